@@ -1,11 +1,59 @@
 import argparse
+import csv
 import json
 import os
 import time
 import datetime
 import dateutil.parser
-import zoneinfo
 import sys
+import itertools
+import math
+import hashlib
+import concurrent.futures
+import time_utils
+import tariff_utils
+import energy_store
+import perf_utils
+
+# checkpoints of the battery state per configuration
+# used by the incremental mode
+state_filename = 'battery_sim_state.json'
+
+# optional numpy and numba for the --jit simulation kernel
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# battery options that can be given in a sweep file
+sweep_option_list = [
+        'battery_capacity',
+        'max_charge_percent',
+        'min_charge_percent',
+        'charge_rate',
+        'discharge_rate',
+        'charge_loss_percent',
+        'discharge_loss_percent',
+        'discharge_bypass_interval',
+        'grid_shift_interval',
+        'fit_discharge_interval',
+        'export_charge_boundary',
+        'dispatch',
+        ]
+
+# battery options with no default
+required_option_list = [
+        'battery_capacity',
+        'max_charge_percent',
+        'min_charge_percent',
+        'charge_rate',
+        'discharge_rate',
+        ]
 
 
 def log_message(
@@ -23,84 +71,63 @@ def log_message(
     return
 
 
-def parse_range_time(
-        datetime_str: str,
-        timezone: str,
-        end: bool = False) -> tuple[int, datetime.datetime]:
-
-    # naive parse
-    dt = datetime.datetime.strptime(datetime_str, '%Y%m%d')
-
-    # end of day
-    if end:
-        dt = dt.replace(
-                hour = 23,
-                minute = 59,
-                second = 59
-                )
-
-    # assert local timezone
-    dt = dt.replace(tzinfo = zoneinfo.ZoneInfo(timezone))
-
-    # convert go epoch as God intended
-    time_stamp = int(dt.timestamp())
-
-    # return both values
-    return time_stamp, dt
-
-
-def load_data(
-        idir: str,
+def get_range_ts(
         start_date: str,
         end_date: str,
-        timezone: str) -> dict:
-
-    global verbose
+        timezone: str) -> tuple[int, int]:
 
-    # start/end range
+    # start/end range epoch ts (0 if not set)
     start_ts = 0
     end_ts = 0
-    start_dt = None
-    end_dt = None
     if start_date:
-        start_ts, start_dt = parse_range_time(
+        start_ts, start_dt = time_utils.parse_range_time(
                 start_date,
                 timezone,
                 end = False)
     
     if end_date:
-        end_ts, end_dt = parse_range_time(
+        end_ts, end_dt = time_utils.parse_range_time(
                 end_date,
                 timezone,
                 end = True)
 
+    return start_ts, end_ts
+
+
+def load_data(
+        idir: str,
+        start_date: str,
+        end_date: str,
+        timezone: str) -> dict:
+
+    global verbose
+
+    start_ts, end_ts = get_range_ts(
+            start_date,
+            end_date,
+            timezone)
+
     # load all data
     data_dict = {}
     file_count = 0
-    for filename in os.listdir(idir):
-        # only loading .jsonl files
-        if not filename.endswith('.jsonl'):
-            continue
-    
+    for full_path in energy_store.list_data_files(
+            idir,
+            start_ts,
+            end_ts):
+        # JSONL day files and columnar month files
+        # files outside the start/end range are 
+        # already skipped by name
         file_count += 1
-        full_path = '%s/%s' % (idir, filename)
-        with open(full_path) as fp:
-            for line in fp:
-                rec = json.loads(line)
-    
-                # skip records if out of range
-                # FIXME probably could also include skipping of 
-                # full files based on name
-                if (start_ts and 
-                    rec['ts'] < start_ts):
-                    continue
-    
-                if (end_ts and 
-                    rec['ts'] > end_ts):
-                    continue
+
+        # records are already restricted to the 
+        # start/end range
+        for rec in energy_store.iter_file_records(
+                full_path,
+                start_ts,
+                end_ts):
     
-                # store keyed on ts
-                data_dict[rec['ts']] = rec
+            # store keyed on ts
+            data_dict[rec['ts']] = rec
     
     log_message(
             1,
@@ -113,26 +140,74 @@ def load_data(
     return data_dict
 
 
+def iter_data_days(
+        idir: str,
+        start_date: str,
+        end_date: str,
+        timezone: str):
+
+    # streams the records of each day in time order
+    # yielding (day, rec_list). Files are read in name
+    # (date) order so only the records of one file (a day
+    # or a month for columnar files) are held at a time
+    start_ts, end_ts = get_range_ts(
+            start_date,
+            end_date,
+            timezone)
+
+    file_count = 0
+    rec_count = 0
+    for full_path in sorted(
+            energy_store.list_data_files(
+                idir,
+                start_ts,
+                end_ts)):
+        file_count += 1
+
+        day_dict = {}
+        for rec in energy_store.iter_file_records(
+                full_path,
+                start_ts,
+                end_ts):
+            if not rec['day'] in day_dict:
+                day_dict[rec['day']] = {}
+            day_dict[rec['day']][rec['ts']] = rec
+
+        for day in sorted(day_dict.keys()):
+            rec_count += len(day_dict[day])
+            yield day, [day_dict[day][ts] for ts in sorted(day_dict[day].keys())]
+
+    log_message(
+            1,
+            'Streamed %d files, %d records' % (
+                file_count, 
+                rec_count
+                )
+            )
+
+    return
+
+
 def output_results(
         odir: str,
-        data_dict: dict,
-        prefix: str,
-        decimal_places: int) -> None:
+        day_dict: dict,
+        decimal_places: int,
+        data_format: str) -> None:
 
     # no date, nothing to do
-    if len(data_dict) == 0:
+    if len(day_dict) == 0:
         return
 
-    # JSONL File
-    dest_jsonl_file = '%s/%s.jsonl' % (odir, prefix)
-    log_message(
-            1,
-            'Writing to %s' % (
-                dest_jsonl_file)
-            )
-    with open(dest_jsonl_file, 'w') as f:
-        for key in sorted(data_dict.keys()):
-            f.write(json.dumps(data_dict[key]) + '\n')
+    # JSONL day files or columnar month files
+    for dest_file in energy_store.write_days(
+            odir,
+            day_dict,
+            data_format):
+        log_message(
+                1,
+                'Writing to %s' % (
+                    dest_file)
+                )
 
     return
 
@@ -160,6 +235,1370 @@ def gen_time_interval_set(
     return interval_set
 
 
+def get_battery_config(
+        option_dict: dict) -> dict:
+
+    # battery simulation settings from the option values
+    # with the interval sets and charge/discharge loss 
+    # factors pre-calculated
+    config = dict(option_dict)
+
+    config['discharge_bypass_set'] = gen_time_interval_set(option_dict['discharge_bypass_interval'])
+    config['grid_shift_set'] = gen_time_interval_set(option_dict['grid_shift_interval'])
+    config['fit_discharge_set'] = gen_time_interval_set(option_dict['fit_discharge_interval'])
+
+    # charging factors
+    config['battery_to_ac_charge_factor'] = 1 + (option_dict['charge_loss_percent'] / 100)
+    config['ac_to_battery_charge_factor'] = (100 - option_dict['charge_loss_percent']) / 100 
+
+    # discharging factors
+    config['battery_to_ac_discharge_factor'] = (100 - option_dict['discharge_loss_percent']) / 100
+    config['ac_to_battery_discharge_factor'] = 1 + (option_dict['discharge_loss_percent'] / 100)
+
+    config['max_charge_capacity'] = option_dict['battery_capacity'] * option_dict['max_charge_percent']/100
+
+    return config
+
+
+def get_record_arrays(
+        rec_list: list,
+        use_jit: bool) -> dict:
+
+    # contiguous import, export, interval length and hour
+    # arrays from the records in time order for the 
+    # simulation kernel. NumPy arrays for the JIT kernel, 
+    # plain lists otherwise
+    array_dict = {
+            'import' : [rec['import'] for rec in rec_list],
+            'export' : [rec['export'] for rec in rec_list],
+            'interval_hours' : [energy_store.get_interval_hours(rec) for rec in rec_list],
+            'hour' : [rec['hour'] for rec in rec_list],
+            }
+
+    if use_jit:
+        for key in array_dict:
+            array_dict[key] = np.array(
+                    array_dict[key], 
+                    dtype = np.int64 if key == 'hour' else np.float64)
+
+    # index of the first record of each day
+    array_dict['day_start_list'] = [
+            i for i, rec in enumerate(rec_list) 
+            if i == 0 or rec['day'] != rec_list[i - 1]['day']]
+
+    return array_dict
+
+
+def get_interval_mask(
+        hour_list: list,
+        interval_set: set[int],
+        use_jit: bool) -> list:
+
+    # boolean mask of the records in the given hour set
+    hour_mask_list = [hour in interval_set for hour in range(24)]
+    if use_jit:
+        return np.array(hour_mask_list)[hour_list]
+
+    return [hour_mask_list[hour] for hour in hour_list]
+
+
+def new_array(
+        size: int,
+        use_jit: bool) -> list:
+
+    if use_jit:
+        return np.zeros(size)
+
+    return [0] * size
+
+
+def battery_kernel(
+        import_arr,
+        export_arr,
+        interval_hours_arr,
+        grid_shift_mask,
+        discharge_mask,
+        fit_discharge_mask,
+        max_charge_capacity,
+        min_charge_storage,
+        charge_rate,
+        discharge_rate,
+        export_charge_boundary,
+        battery_to_ac_charge_factor,
+        ac_to_battery_charge_factor,
+        battery_to_ac_discharge_factor,
+        ac_to_battery_discharge_factor,
+        solar_charge_arr,
+        grid_charge_arr,
+        discharge_arr,
+        storage_arr,
+        cycles_arr,
+        current_battery_storage,
+        overall_charge_total,
+        overall_discharge_total,
+        overall_battery_cycles):
+
+    # battery state machine over the interval arrays in 
+    # time order, starting from the given battery storage
+    # and running totals. Import and export are adjusted 
+    # in place and the charge, discharge, storage and cycles
+    # of each interval are written to the output arrays.
+    # Kept to scalar arithmetic and indexing so the same 
+    # code runs as plain Python or compiled with numba
+    for i in range(len(import_arr)):
+        # charge/discharge rates and export boundary are per hour
+        # and scaled to the interval covered by the record
+        interval_hours = interval_hours_arr[i]
+        interval_charge_rate = charge_rate * interval_hours
+        interval_discharge_rate = discharge_rate * interval_hours
+
+        # solar charge only applies when export reaches min boundary
+        # helps avoid invalid phantom charges overnight
+        battery_solar_charge = 0
+        if export_arr[i] >= export_charge_boundary * interval_hours:
+            # the min of charge rate and available capacity
+            max_export_charge = min(
+                    max_charge_capacity - current_battery_storage, 
+                    interval_charge_rate)
+
+            # charge loss conversions
+            ac_charge = max_export_charge * battery_to_ac_charge_factor
+            solar_export_divert = min(export_arr[i], ac_charge)
+            battery_solar_charge = solar_export_divert * ac_to_battery_charge_factor
+
+            # Reduce export and charge battery
+            current_battery_storage += battery_solar_charge
+            export_arr[i] -= solar_export_divert
+            overall_charge_total += battery_solar_charge
+
+        # grid shift charge
+        battery_grid_shift_charge = 0
+        if grid_shift_mask[i]:
+            # the min of charge rate and available capacity
+            battery_grid_shift_charge = min(
+                    max_charge_capacity - current_battery_storage, 
+                    interval_charge_rate)
+
+            # charge battery from grid with charge loss
+            current_battery_storage += battery_grid_shift_charge
+            import_arr[i] += battery_grid_shift_charge * battery_to_ac_charge_factor
+            overall_charge_total += battery_grid_shift_charge
+
+        # discharge is conditional to 
+        # grid shift and discharge bypass times
+        import_discharge = 0
+        battery_import_discharge = 0
+        battery_fit_discharge = 0
+        if discharge_mask[i]:
+            # determine how much charge we have to use
+            available_discharge_capacity = current_battery_storage - min_charge_storage
+            if available_discharge_capacity < 0:
+                available_discharge_capacity = 0
+
+            # determine max discharge
+            max_discharge = min(available_discharge_capacity, interval_discharge_rate)
+
+            # discharge loss conversions
+            ac_discharge = max_discharge * battery_to_ac_discharge_factor
+            import_discharge = min(import_arr[i], ac_discharge)
+            battery_import_discharge = import_discharge * ac_to_battery_discharge_factor
+
+            # Discharge battery and reduce import 
+            current_battery_storage -= battery_import_discharge
+            import_arr[i] -= import_discharge
+            overall_discharge_total += battery_import_discharge
+
+            # Forced FIT discharge 
+            # trying to flush the battery to the grid
+            if fit_discharge_mask[i]:
+                # additional discharge possible taking off 
+                # any existing import discharge we had applied
+                battery_fit_discharge = max_discharge - battery_import_discharge
+
+                # Additionally discharge battery to max and increase export
+                current_battery_storage -= battery_fit_discharge
+                export_arr[i] += battery_fit_discharge * battery_to_ac_discharge_factor
+                overall_discharge_total += battery_fit_discharge
+
+        # activity and charge status for the interval
+        solar_charge_arr[i] = battery_solar_charge
+        grid_charge_arr[i] = battery_grid_shift_charge
+        discharge_arr[i] = battery_import_discharge + battery_fit_discharge
+        storage_arr[i] = current_battery_storage
+        total_charge_discharge = battery_solar_charge + battery_grid_shift_charge + import_discharge + battery_fit_discharge
+        cycles_arr[i] = total_charge_discharge / (max_charge_capacity * 2)
+        overall_battery_cycles += cycles_arr[i]
+
+    return (
+            current_battery_storage, 
+            overall_charge_total, 
+            overall_discharge_total, 
+            overall_battery_cycles)
+
+
+# numba compiled variant of the kernel for --jit
+# cached on disk after the first compile
+if numba is not None:
+    jit_battery_kernel = numba.njit(cache = True)(battery_kernel)
+
+
+def new_battery_state() -> dict:
+
+    # empty battery with no charge/discharge so far
+    return {
+            'final_storage' : 0,
+            'charge_total' : 0,
+            'discharge_total' : 0,
+            'cycles_total' : 0,
+            }
+
+
+def get_battery_state(
+        battery_dict: dict) -> dict:
+
+    # battery storage and running totals at the end of
+    # a simulation to carry on from
+    return {
+            key : battery_dict[key]
+            for key in new_battery_state()
+            }
+
+
+def simulate_battery(
+        array_dict: dict,
+        config: dict,
+        use_jit: bool,
+        state: dict = None) -> dict:
+
+    # simulates the battery over the record arrays, 
+    # adjusting import/export in place. Starts from
+    # an empty battery or the given state
+    # Returns the final battery state, overall totals
+    # and the battery field arrays
+    num_recs = len(array_dict['import'])
+    hour_list = array_dict['hour']
+    grid_shift_mask = get_interval_mask(
+            hour_list, 
+            config['grid_shift_set'], 
+            use_jit)
+
+    # no discharge in grid shift or discharge bypass times
+    discharge_mask = get_interval_mask(
+            hour_list, 
+            set(range(24)) - config['grid_shift_set'] - config['discharge_bypass_set'], 
+            use_jit)
+    fit_discharge_mask = get_interval_mask(
+            hour_list, 
+            config['fit_discharge_set'], 
+            use_jit)
+
+    battery_dict = {
+            'battery_solar_charge' : new_array(num_recs, use_jit),
+            'battery_grid_charge' : new_array(num_recs, use_jit),
+            'battery_discharge' : new_array(num_recs, use_jit),
+            'battery_storage' : new_array(num_recs, use_jit),
+            'battery_cycles' : new_array(num_recs, use_jit),
+            }
+
+    if state is None:
+        state = new_battery_state()
+
+    state_list = [
+            state['final_storage'],
+            state['charge_total'],
+            state['discharge_total'],
+            state['cycles_total'],
+            ]
+
+    kernel = battery_kernel
+    if use_jit:
+        kernel = jit_battery_kernel
+        state_list = [float(value) for value in state_list]
+    (battery_dict['final_storage'], 
+     battery_dict['charge_total'], 
+     battery_dict['discharge_total'], 
+     battery_dict['cycles_total']) = kernel(
+            array_dict['import'],
+            array_dict['export'],
+            array_dict['interval_hours'],
+            grid_shift_mask,
+            discharge_mask,
+            fit_discharge_mask,
+            config['max_charge_capacity'],
+            config['battery_capacity'] * config['min_charge_percent'] / 100,
+            config['charge_rate'],
+            config['discharge_rate'],
+            config['export_charge_boundary'],
+            config['battery_to_ac_charge_factor'],
+            config['ac_to_battery_charge_factor'],
+            config['battery_to_ac_discharge_factor'],
+            config['ac_to_battery_discharge_factor'],
+            battery_dict['battery_solar_charge'],
+            battery_dict['battery_grid_charge'],
+            battery_dict['battery_discharge'],
+            battery_dict['battery_storage'],
+            battery_dict['battery_cycles'],
+            *state_list)
+
+    # consumed follows import where the battery was active
+    battery_dict['consumed_mask'] = [
+            grid_shift or discharge 
+            for grid_shift, discharge in zip(grid_shift_mask, discharge_mask)]
+
+    return battery_dict
+
+
+def optimise_battery(
+        array_dict: dict,
+        config: dict,
+        rate_dict: dict,
+        soc_levels: int) -> dict:
+
+    # cost minimising battery schedule for the given import
+    # and FIT rates under the same capacity, charge/discharge
+    # rate and loss limits as the greedy simulation.
+    #
+    # The state of charge is discretised into soc_levels 
+    # steps from empty to the max charge and each day is 
+    # solved by dynamic programming over that day and the 
+    # next (rolling horizon), keeping only the first day's 
+    # schedule. The battery can charge from solar export or
+    # the grid and discharge to offset import or export to
+    # the grid at any time, but not below the min charge.
+    #
+    # The cost of moving between two charge levels only
+    # depends on the change, so each interval has a cost 
+    # vector over the possible changes which is gathered
+    # into a (from x to) level matrix for the DP step.
+    # Import/export are adjusted in place and the result
+    # has the same fields as simulate_battery()
+    max_charge_capacity = config['max_charge_capacity']
+    min_charge_storage = config['battery_capacity'] * config['min_charge_percent'] / 100
+    battery_to_ac_charge_factor = config['battery_to_ac_charge_factor']
+    battery_to_ac_discharge_factor = config['battery_to_ac_discharge_factor']
+
+    import_arr = np.array(array_dict['import'], dtype = np.float64)
+    export_arr = np.array(array_dict['export'], dtype = np.float64)
+    interval_hours_arr = np.array(array_dict['interval_hours'], dtype = np.float64)
+    import_rate_arr = np.array(rate_dict['import_rate_list'], dtype = np.float64)
+    export_rate_arr = np.array(rate_dict['export_rate_list'], dtype = np.float64)
+    num_recs = len(import_arr)
+
+    level_arr = np.linspace(0, max_charge_capacity, soc_levels)
+    level_step = level_arr[1] - level_arr[0]
+
+    # battery charge change for each change index
+    # -(levels - 1) .. (levels - 1) steps
+    change_arr = np.arange(1 - soc_levels, soc_levels) * level_step
+    charge_arr = np.maximum(change_arr, 0)
+    discharge_arr = np.maximum(-change_arr, 0)
+    ac_charge_arr = charge_arr * battery_to_ac_charge_factor
+    ac_discharge_arr = discharge_arr * battery_to_ac_discharge_factor
+
+    # change index of each (from, to) pair with an extra 
+    # infeasible index for discharge below the min charge
+    infeasible_index = 2 * soc_levels - 1
+    index_matrix = np.arange(soc_levels)[None, :] - np.arange(soc_levels)[:, None] + soc_levels - 1
+    below_min_mask = level_arr < min_charge_storage - 1e-9
+    index_matrix[below_min_mask[None, :] & (index_matrix < soc_levels - 1)] = infeasible_index
+
+    def get_cost_matrix(
+            start: int,
+            end: int):
+
+        # cost of each change for the intervals (intervals x changes)
+        # charging takes from export before import and 
+        # discharging offsets import before exporting
+        imp = import_arr[start:end, None]
+        exp = export_arr[start:end, None]
+        export_used = np.minimum(ac_charge_arr, exp)
+        import_offset = np.minimum(ac_discharge_arr, imp)
+        new_import = imp + ac_charge_arr - export_used - import_offset
+        new_export = exp - export_used + ac_discharge_arr - import_offset
+        cost_matrix = np.full((end - start, infeasible_index + 1), np.inf)
+        cost_matrix[:, :infeasible_index] = (
+                new_import * import_rate_arr[start:end, None] - 
+                new_export * export_rate_arr[start:end, None])
+
+        # charge/discharge rate limits for the interval length
+        hours = interval_hours_arr[start:end, None]
+        rate_mask = ((change_arr > config['charge_rate'] * hours + 1e-9) | 
+                     (-change_arr > config['discharge_rate'] * hours + 1e-9))
+        cost_matrix[:, :infeasible_index][rate_mask] = np.inf
+
+        return cost_matrix
+
+    level_list = []
+    day_start_list = array_dict['day_start_list'] + [num_recs]
+    current_level = 0
+    for day in range(len(day_start_list) - 1):
+        start = day_start_list[day]
+        end = day_start_list[day + 1]
+        horizon_end = day_start_list[min(day + 2, len(day_start_list) - 1)]
+
+        # backward pass.. cost to go from each level
+        cost_matrix = get_cost_matrix(start, horizon_end)
+        cost_to_go_arr = np.zeros(soc_levels)
+        level_index_arr = np.arange(soc_levels)
+        choice_list = [None] * (horizon_end - start)
+        for i in range(horizon_end - start - 1, -1, -1):
+            total_matrix = cost_matrix[i][index_matrix] + cost_to_go_arr[None, :]
+            choice_arr = total_matrix.argmin(axis = 1)
+            cost_to_go_arr = total_matrix[level_index_arr, choice_arr]
+            choice_list[i] = choice_arr
+
+        # forward pass over the first day
+        for i in range(end - start):
+            current_level = int(choice_list[i][current_level])
+            level_list.append(current_level)
+
+    # interval flows from the chosen levels
+    storage_arr = level_arr[level_list] if level_list else np.zeros(0)
+    change_arr = np.diff(storage_arr, prepend = 0.0)
+    battery_charge_arr = np.maximum(change_arr, 0)
+    battery_discharge_arr = np.maximum(-change_arr, 0)
+    ac_charge_arr = battery_charge_arr * battery_to_ac_charge_factor
+    ac_discharge_arr = battery_discharge_arr * battery_to_ac_discharge_factor
+    export_used_arr = np.minimum(ac_charge_arr, export_arr)
+    import_offset_arr = np.minimum(ac_discharge_arr, import_arr)
+    new_import_arr = import_arr + ac_charge_arr - export_used_arr - import_offset_arr
+    new_export_arr = export_arr - export_used_arr + ac_discharge_arr - import_offset_arr
+
+    # battery side charge split between solar and grid
+    solar_charge_arr = export_used_arr / battery_to_ac_charge_factor
+    grid_charge_arr = np.maximum(battery_charge_arr - solar_charge_arr, 0)
+    cycles_arr = (battery_charge_arr + battery_discharge_arr) / (max_charge_capacity * 2)
+
+    array_dict['import'][:] = new_import_arr.tolist()
+    array_dict['export'][:] = new_export_arr.tolist()
+
+    return {
+            'battery_solar_charge' : solar_charge_arr,
+            'battery_grid_charge' : grid_charge_arr,
+            'battery_discharge' : battery_discharge_arr,
+            'battery_storage' : storage_arr,
+            'battery_cycles' : cycles_arr,
+            'final_storage' : float(storage_arr[-1]) if num_recs else 0.0,
+            'charge_total' : float(battery_charge_arr.sum()),
+            'discharge_total' : float(battery_discharge_arr.sum()),
+            'cycles_total' : float(cycles_arr.sum()),
+            'consumed_mask' : (grid_charge_arr > 0) | (import_offset_arr > 0),
+            }
+
+
+def apply_battery_results(
+        rec_list: list,
+        array_dict: dict,
+        battery_dict: dict,
+        battery_capacity: float) -> None:
+
+    # writes the simulated import/export and 
+    # battery fields back to the records
+    field_list = [
+            'battery_solar_charge',
+            'battery_grid_charge',
+            'battery_discharge',
+            'battery_storage',
+            'battery_cycles',
+            ]
+
+    # plain lists (and floats) for the writers
+    value_list_dict = {}
+    for key in ['import', 'export']:
+        value_list_dict[key] = array_dict[key]
+    for key in field_list:
+        value_list_dict[key] = battery_dict[key]
+    for key in value_list_dict:
+        if not isinstance(value_list_dict[key], list):
+            value_list_dict[key] = value_list_dict[key].tolist()
+
+    for i, rec in enumerate(rec_list):
+        rec['import'] = value_list_dict['import'][i]
+        rec['export'] = value_list_dict['export'][i]
+        if battery_dict['consumed_mask'][i]:
+            rec['consumed'] = rec['import']
+        rec['battery_solar_charge'] = value_list_dict['battery_solar_charge'][i]
+        rec['battery_grid_charge'] = value_list_dict['battery_grid_charge'][i]
+        rec['battery_discharge'] = value_list_dict['battery_discharge'][i]
+        rec['battery_storage'] = value_list_dict['battery_storage'][i]
+        rec['battery_capacity'] = round(rec['battery_storage'] / battery_capacity * 100)
+        rec['battery_cycles'] = value_list_dict['battery_cycles'][i]
+
+    # per interval detail only formatted when enabled
+    if not verbose:
+        return
+
+    for rec in rec_list:
+        log_message(
+                1,
+                '[%s] imp:%.4f exp:%.4f solar_chg:%.4f grid_chg:%.4f dis:%.4f storage:%.4f' % (
+                    rec['datetime'],
+                    rec['import'],
+                    rec['export'],
+                    rec['battery_solar_charge'],
+                    rec['battery_grid_charge'],
+                    rec['battery_discharge'],
+                    rec['battery_storage'],
+                    )
+                )
+
+    return
+
+
+def stream_battery(
+        idir: str,
+        odir: str,
+        start_date: str,
+        end_date: str,
+        timezone: str,
+        config: dict,
+        battery_capacity: float,
+        tariffs_list: list,
+        prices: dict,
+        data_format: str,
+        decimal_places: int,
+        use_jit: bool,
+        state: dict = None) -> dict:
+
+    # simulates the battery a day at a time in time order
+    # from the start date carrying the battery state from 
+    # one day to the next and writing each day once simulated.
+    # Columnar days are written once their month is done as 
+    # each write merges into the month file.
+    # Returns the final battery state with the overall
+    # totals with and without the battery and the state at
+    # the end of the second last day as the checkpoint
+    if state is None:
+        state = new_battery_state()
+
+    prev_day = None
+    checkpoint_day = None
+    checkpoint_state = None
+
+    totals = {
+            'import' : 0,
+            'export' : 0,
+            'cost_list' : [0] * len(tariffs_list),
+            }
+    baseline = {
+            'import' : 0,
+            'export' : 0,
+            'cost_list' : [0] * len(tariffs_list),
+            }
+
+    def add_totals(
+            total_dict: dict,
+            day_totals: dict) -> None:
+        total_dict['import'] += day_totals['import']
+        total_dict['export'] += day_totals['export']
+        for i, cost in enumerate(day_totals['cost_list']):
+            total_dict['cost_list'][i] += cost
+
+    dest_file = None
+    write_day_dict = {}
+    day_iter = iter_data_days(
+            idir,
+            start_date,
+            end_date,
+            timezone)
+    while True:
+        perf_utils.start_stage('load')
+        day, rec_list = next(day_iter, (None, None))
+        perf_utils.end_stage('load')
+
+        # write any days for the previous month file
+        if (write_day_dict and 
+                (day is None or 
+                 energy_store.get_day_file(odir, day, data_format) != dest_file)):
+            perf_utils.start_stage('write')
+            output_results(
+                    odir,
+                    write_day_dict,
+                    decimal_places,
+                    data_format)
+            perf_utils.end_stage('write')
+            write_day_dict = {}
+
+        if day is None:
+            break
+
+        perf_utils.count('records', len(rec_list))
+        perf_utils.count('days')
+
+        # state at the end of the previous day
+        if prev_day:
+            checkpoint_day = prev_day
+            checkpoint_state = state
+        prev_day = day
+
+        perf_utils.start_stage('cost')
+        rate_dict_list = [
+                get_tariff_rates(rec_list, tariffs, prices) 
+                for tariffs in tariffs_list]
+        add_totals(
+                baseline,
+                get_sweep_totals(
+                    [rec['import'] for rec in rec_list], 
+                    [rec['export'] for rec in rec_list], 
+                    rate_dict_list))
+        perf_utils.end_stage('cost')
+
+        perf_utils.start_stage('simulate')
+        array_dict = get_record_arrays(
+                rec_list,
+                use_jit)
+        battery_dict = simulate_battery(
+                array_dict,
+                config,
+                use_jit,
+                state)
+        state = get_battery_state(battery_dict)
+        apply_battery_results(
+                rec_list,
+                array_dict,
+                battery_dict,
+                battery_capacity)
+        perf_utils.end_stage('simulate')
+
+        add_totals(
+                totals,
+                get_sweep_totals(
+                    [rec['import'] for rec in rec_list], 
+                    [rec['export'] for rec in rec_list], 
+                    rate_dict_list))
+
+        dest_file = energy_store.get_day_file(odir, day, data_format)
+        write_day_dict[day] = {rec['ts'] : rec for rec in rec_list}
+
+    state['totals'] = totals
+    state['baseline'] = baseline
+    state['checkpoint_day'] = checkpoint_day
+    state['checkpoint_state'] = checkpoint_state
+
+    return state
+
+
+def get_config_hash(
+        option_dict: dict,
+        idir: str,
+        start_date: str,
+        timezone: str,
+        data_format: str) -> str:
+
+    # short hash of the battery options, input data range,
+    # timezone and output format that a saved battery state
+    # is for
+    config = dict(option_dict)
+    config['idir'] = os.path.abspath(idir)
+    config['start'] = start_date
+    config['timezone'] = timezone
+    config['format'] = data_format
+
+    return hashlib.sha256(
+            json.dumps(config, sort_keys = True).encode()).hexdigest()[:16]
+
+
+def load_state_file(
+        state_file: str) -> dict:
+
+    # config hash -> checkpoint
+    state_dict = {}
+    if os.path.exists(state_file):
+        try:
+            with open(state_file) as f:
+                state_dict = json.load(f)
+        except Exception as ex:
+            log_message(
+                    1,
+                    'Ignoring unreadable state file %s (%s)' % (
+                        state_file,
+                        ex)
+                    )
+            state_dict = {}
+
+    return state_dict
+
+
+def save_state_file(
+        state_file: str,
+        state_dict: dict) -> None:
+
+    # written to a temp file and renamed into place
+    # so an interrupted run leaves the old state intact
+    tmp_file = state_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        f.write(json.dumps(state_dict, indent = 4))
+    os.replace(tmp_file, state_file)
+
+    return
+
+
+def log_final_state(
+        battery_dict: dict,
+        battery_capacity: float,
+        tariff_name_list: list,
+        totals: dict,
+        baseline: dict) -> None:
+
+    log_message(
+            1,
+            'Final battery state.. charge:%.4fkWh (%d%%) ovl_charge:%.4fkWh ovl_discharge:%.4fkWh (%d cycles)' % (
+                battery_dict['final_storage'],
+                round(battery_dict['final_storage'] / battery_capacity * 100),
+                battery_dict['charge_total'],
+                battery_dict['discharge_total'],
+                battery_dict['cycles_total'],
+                )
+            )
+
+    # cost against each tariff file
+    for tariff_name, cost, baseline_cost in zip(
+            tariff_name_list,
+            totals['cost_list'],
+            baseline['cost_list']):
+        log_message(
+                1,
+                'Cost for %s.. %.2f (%.2f without battery, saving %.2f)' % (
+                    tariff_name,
+                    cost,
+                    baseline_cost,
+                    baseline_cost - cost
+                    )
+                )
+
+    return
+
+
+def get_tariff_rates(
+        rec_list: list,
+        tariffs: dict,
+        prices: dict = None) -> dict:
+
+    # import and FIT rate for each record and the overall
+    # standing cost from the tariff plans. These do not 
+    # change with the battery so are looked up once for
+    # all sweep configurations. The import rates are 
+    # replaced by any given SEMOpx prices
+    plan_list = tariffs['plan_list']
+    import_rate_list = []
+    export_rate_list = []
+    standing_cost = 0
+    plan_index_dict = {}
+    for rec in rec_list:
+        if not rec['day'] in plan_index_dict:
+            plan_index = tariff_utils.get_plan_index(
+                    tariffs,
+                    rec['day'])
+            if plan_index is None:
+                log_message(
+                        1,
+                        'Error: No tariff plan covers day %s' % (
+                            rec['day'])
+                        )
+                sys.exit(-1)
+            plan_index_dict[rec['day']] = plan_index
+
+        tariff_plan = plan_list[plan_index_dict[rec['day']]]
+
+        # weekday is formatted as '<num> <local name>'
+        slot = tariff_utils.get_slot(
+                int(rec['weekday'].split(' ')[0]),
+                rec['hour'])
+        import_rate_list.append(tariff_plan['rate_list'][slot])
+        export_rate_list.append(tariff_plan['fit_rate'])
+        standing_cost += tariff_plan['standing_rate'] * energy_store.get_interval_hours(rec)
+
+    if prices:
+        dynamic_rate_list = tariff_utils.get_dynamic_rates(
+                prices,
+                [rec['ts'] for rec in rec_list],
+                [int(energy_store.get_interval_hours(rec) * 3600) for rec in rec_list])
+
+        num_missing = 0
+        for i, dynamic_rate in enumerate(dynamic_rate_list):
+            if dynamic_rate is None:
+                num_missing += 1
+            else:
+                import_rate_list[i] = dynamic_rate
+
+        if num_missing:
+            log_message(
+                    1,
+                    'WARNING: No SEMOpx price for %d/%d records.. using tariff plan rates' % (
+                        num_missing,
+                        len(rec_list))
+                    )
+
+    return {
+            'import_rate_list' : import_rate_list,
+            'export_rate_list' : export_rate_list,
+            'standing_cost' : standing_cost,
+            }
+
+
+def get_sweep_totals(
+        import_list: list,
+        export_list: list,
+        rate_dict_list: list) -> dict:
+
+    # overall import, export and cost per tariff file
+    # from the import/export of each record in time order
+    import_total = 0
+    export_total = 0
+    for import_value, export_value in zip(import_list, export_list):
+        import_total += import_value
+        export_total += export_value
+
+    cost_list = []
+    for rate_dict in rate_dict_list:
+        cost = rate_dict['standing_cost']
+        for import_value, export_value, import_rate, export_rate in zip(
+                import_list,
+                export_list,
+                rate_dict['import_rate_list'],
+                rate_dict['export_rate_list']):
+            cost += import_value * import_rate - export_value * export_rate
+        cost_list.append(cost)
+
+    return {
+            'import' : import_total,
+            'export' : export_total,
+            'cost_list' : cost_list,
+            }
+
+
+def load_sweep_configs(
+        sweep_file: str,
+        default_dict: dict) -> tuple[list, list]:
+
+    # Sweep file is a JSON object of battery option names
+    # each with a list of values to simulate, e.g.
+    # {"battery_capacity": [5, 10, 15], "charge_rate": [2.5, 5]}
+    # Every combination of the values is simulated with the
+    # other options taken from the command line.
+    # A list of such objects combines several grids
+    # Returns the swept option names and option dicts
+    with open(sweep_file) as fp:
+        sweep_grid_list = json.load(fp)
+
+    if isinstance(sweep_grid_list, dict):
+        sweep_grid_list = [sweep_grid_list]
+
+    sweep_key_list = []
+    option_dict_list = []
+    for sweep_grid in sweep_grid_list:
+        for key in sweep_grid:
+            if not key in sweep_option_list:
+                log_message(
+                        1, 
+                        'Error: unknown sweep option %s' % (
+                            key)
+                        )
+                sys.exit(-1)
+
+            if not isinstance(sweep_grid[key], list):
+                sweep_grid[key] = [sweep_grid[key]]
+
+            if not key in sweep_key_list:
+                sweep_key_list.append(key)
+
+        key_list = list(sweep_grid.keys())
+        for value_tuple in itertools.product(
+                *[sweep_grid[key] for key in key_list]):
+            option_dict = dict(default_dict)
+            option_dict.update(zip(key_list, value_tuple))
+            option_dict_list.append(option_dict)
+
+    for option_dict in option_dict_list:
+        for key in required_option_list:
+            if option_dict[key] is None:
+                log_message(
+                        1, 
+                        'Error: --%s is required on the command line or in the sweep file' % (
+                            key)
+                        )
+                sys.exit(-1)
+
+    return sweep_key_list, option_dict_list
+
+
+def init_sweep_worker(
+        array_dict: dict,
+        rate_dict_list: list,
+        use_jit: bool,
+        soc_levels: int) -> None:
+
+    # loaded record arrays and tariff rates shared by 
+    # the sweep configurations run in this process
+    global sweep_array_dict
+    global sweep_rate_dict_list
+    global sweep_use_jit
+    global sweep_soc_levels
+
+    sweep_array_dict = array_dict
+    sweep_rate_dict_list = rate_dict_list
+    sweep_use_jit = use_jit
+    sweep_soc_levels = soc_levels
+
+    return
+
+
+def run_sweep_config(
+        option_dict: dict) -> dict:
+
+    # simulates a single sweep configuration against
+    # a copy of the loaded import/export arrays
+    array_dict = dict(sweep_array_dict)
+    array_dict['import'] = sweep_array_dict['import'].copy()
+    array_dict['export'] = sweep_array_dict['export'].copy()
+
+    if option_dict['dispatch'] == 'optimal':
+        battery_dict = optimise_battery(
+                array_dict,
+                get_battery_config(option_dict),
+                sweep_rate_dict_list[0],
+                sweep_soc_levels)
+    else:
+        battery_dict = simulate_battery(
+                array_dict,
+                get_battery_config(option_dict),
+                sweep_use_jit)
+
+    # numpy values summed as floats in the same order
+    import_list = array_dict['import']
+    export_list = array_dict['export']
+    if sweep_use_jit:
+        import_list = import_list.tolist()
+        export_list = export_list.tolist()
+
+    totals = get_sweep_totals(
+            import_list, 
+            export_list, 
+            sweep_rate_dict_list)
+    totals['charge_total'] = battery_dict['charge_total']
+    totals['discharge_total'] = battery_dict['discharge_total']
+    totals['battery_cycles'] = battery_dict['cycles_total']
+
+    return totals
+
+
+def run_sweep(
+        array_dict: dict,
+        rate_dict_list: list,
+        option_dict_list: list,
+        jobs: int,
+        use_jit: bool,
+        soc_levels: int) -> list:
+
+    # simulates each configuration, in worker processes
+    # if more than one job. Results are in configuration order
+    initargs = (array_dict, rate_dict_list, use_jit, soc_levels)
+    if jobs <= 1 or len(option_dict_list) <= 1:
+        init_sweep_worker(*initargs)
+        return [run_sweep_config(option_dict) for option_dict in option_dict_list]
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers = jobs,
+            initializer = init_sweep_worker,
+            initargs = initargs) as executor:
+        return list(executor.map(run_sweep_config, option_dict_list))
+
+
+def output_sweep_summary(
+        sweep_key_list: list,
+        tariff_name_list: list,
+        option_dict_list: list,
+        result_list: list,
+        baseline: dict,
+        sweep_output: str) -> None:
+
+    # summary table of each configuration printed and
+    # optionally written to a CSV file. The first row is
+    # the data without any battery
+    header_list = (['scenario'] + sweep_key_list + 
+                   ['import', 'export', 'battery_charge', 'battery_discharge', 'battery_cycles'] + 
+                   ['cost_%s' % (name) for name in tariff_name_list])
+
+    row_list = []
+    row_list.append(
+            ['none'] + 
+            ['' for key in sweep_key_list] + 
+            [baseline['import'], baseline['export'], 0, 0, 0] + 
+            baseline['cost_list'])
+
+    for i, (option_dict, result) in enumerate(zip(option_dict_list, result_list)):
+        row_list.append(
+                [i + 1] + 
+                [option_dict[key] for key in sweep_key_list] + 
+                [result['import'], 
+                 result['export'], 
+                 result['charge_total'], 
+                 result['discharge_total'], 
+                 result['battery_cycles']] +
+                result['cost_list'])
+
+    output_summary_table(
+            'Sweep summary..',
+            header_list,
+            row_list,
+            sweep_output)
+
+    return
+
+
+def output_summary_table(
+        title: str,
+        header_list: list,
+        row_list: list,
+        output_file: str) -> None:
+
+    # summary rows printed as a table and optionally
+    # written to a CSV file
+    # rounded for display and the CSV
+    for row in row_list:
+        for i, value in enumerate(row):
+            if isinstance(value, float):
+                row[i] = round(value, 2)
+            elif value is None:
+                row[i] = ''
+
+    width_list = [
+            max(len(str(row[i])) for row in [header_list] + row_list)
+            for i in range(len(header_list))]
+
+    log_message(1, title)
+    for row in [header_list] + row_list:
+        print(
+                '  '.join(
+                    str(value).rjust(width) 
+                    for value, width in zip(row, width_list)))
+
+    if output_file:
+        with open(output_file, 'w', newline = '') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(header_list)
+            writer.writerows(row_list)
+        log_message(
+                1,
+                'Writing to %s' % (
+                    output_file)
+                )
+
+    return
+
+
+def get_fleet_dirs(
+        fleet_dir_list: list) -> list:
+
+    # household data directories for the fleet. A directory
+    # with no data files of its own is taken as a fleet store
+    # with a sub-directory of data files per household
+    household_dir_list = []
+    for fleet_dir in fleet_dir_list:
+        if energy_store.list_data_files(fleet_dir):
+            household_dir_list.append(fleet_dir)
+            continue
+
+        for name in sorted(os.listdir(fleet_dir)):
+            household_dir = os.path.join(fleet_dir, name)
+            if os.path.isdir(household_dir):
+                household_dir_list.append(household_dir)
+
+    return household_dir_list
+
+
+def get_fleet_arrays(
+        rec_list_list: list) -> dict:
+
+    # (intervals x households) import, export, interval 
+    # length and hour arrays over the combined timestamps
+    # of all households. Intervals a household has no record
+    # for are left at 0 length so the battery is idle.
+    # The interval index of each household's records is
+    # kept to map the results back
+    ts_list = sorted(set(
+        rec['ts'] 
+        for rec_list in rec_list_list 
+        for rec in rec_list))
+    ts_index_dict = {ts : i for i, ts in enumerate(ts_list)}
+
+    shape = (len(ts_list), len(rec_list_list))
+    array_dict = {
+            'import' : np.zeros(shape),
+            'export' : np.zeros(shape),
+            'interval_hours' : np.zeros(shape),
+            'hour' : np.zeros(shape, dtype = np.int64),
+            'index_list' : [],
+            }
+
+    for household, rec_list in enumerate(rec_list_list):
+        index_arr = np.array(
+                [ts_index_dict[rec['ts']] for rec in rec_list], 
+                dtype = np.int64)
+        array_dict['import'][index_arr, household] = [rec['import'] for rec in rec_list]
+        array_dict['export'][index_arr, household] = [rec['export'] for rec in rec_list]
+        array_dict['interval_hours'][index_arr, household] = [energy_store.get_interval_hours(rec) for rec in rec_list]
+        array_dict['hour'][index_arr, household] = [rec['hour'] for rec in rec_list]
+        array_dict['index_list'].append(index_arr)
+
+    return array_dict
+
+
+def fleet_battery_kernel(
+        import_arr,
+        export_arr,
+        interval_hours_arr,
+        grid_shift_mask,
+        discharge_mask,
+        fit_discharge_mask,
+        max_charge_capacity,
+        min_charge_storage,
+        charge_rate,
+        discharge_rate,
+        export_charge_boundary,
+        battery_to_ac_charge_factor,
+        ac_to_battery_charge_factor,
+        battery_to_ac_discharge_factor,
+        ac_to_battery_discharge_factor,
+        solar_charge_arr,
+        grid_charge_arr,
+        discharge_arr,
+        storage_arr,
+        cycles_arr):
+
+    # battery_kernel across households. The arrays are 
+    # (intervals x households) and each interval updates 
+    # the battery of every household at once, with the 
+    # conditional steps applied as masks. Households not 
+    # charging or discharging in a step have 0 added so 
+    # the results match battery_kernel exactly
+    num_households = import_arr.shape[1]
+    current_battery_storage = np.zeros(num_households)
+    overall_charge_total = np.zeros(num_households)
+    overall_discharge_total = np.zeros(num_households)
+    overall_battery_cycles = np.zeros(num_households)
+
+    # FIT discharge only applies where discharge is allowed
+    fit_discharge_mask = fit_discharge_mask & discharge_mask
+
+    for i in range(len(import_arr)):
+        interval_hours = interval_hours_arr[i]
+        interval_charge_rate = charge_rate * interval_hours
+        interval_discharge_rate = discharge_rate * interval_hours
+        import_row = import_arr[i]
+        export_row = export_arr[i]
+
+        # solar charge where export reaches the min boundary
+        max_export_charge = np.minimum(
+                max_charge_capacity - current_battery_storage, 
+                interval_charge_rate)
+        solar_export_divert = np.where(
+                export_row >= export_charge_boundary * interval_hours,
+                np.minimum(export_row, max_export_charge * battery_to_ac_charge_factor),
+                0)
+        battery_solar_charge = solar_export_divert * ac_to_battery_charge_factor
+        current_battery_storage += battery_solar_charge
+        export_row -= solar_export_divert
+        overall_charge_total += battery_solar_charge
+
+        # grid shift charge
+        battery_grid_shift_charge = np.where(
+                grid_shift_mask[i],
+                np.minimum(
+                    max_charge_capacity - current_battery_storage, 
+                    interval_charge_rate),
+                0)
+        current_battery_storage += battery_grid_shift_charge
+        import_row += battery_grid_shift_charge * battery_to_ac_charge_factor
+        overall_charge_total += battery_grid_shift_charge
+
+        # import discharge
+        max_discharge = np.minimum(
+                np.maximum(current_battery_storage - min_charge_storage, 0),
+                interval_discharge_rate)
+        import_discharge = np.where(
+                discharge_mask[i],
+                np.minimum(import_row, max_discharge * battery_to_ac_discharge_factor),
+                0)
+        battery_import_discharge = import_discharge * ac_to_battery_discharge_factor
+        current_battery_storage -= battery_import_discharge
+        import_row -= import_discharge
+        overall_discharge_total += battery_import_discharge
+
+        # forced FIT discharge
+        battery_fit_discharge = np.where(
+                fit_discharge_mask[i],
+                max_discharge - battery_import_discharge,
+                0)
+        current_battery_storage -= battery_fit_discharge
+        export_row += battery_fit_discharge * battery_to_ac_discharge_factor
+        overall_discharge_total += battery_fit_discharge
+
+        # activity and charge status for the interval
+        solar_charge_arr[i] = battery_solar_charge
+        grid_charge_arr[i] = battery_grid_shift_charge
+        discharge_arr[i] = battery_import_discharge + battery_fit_discharge
+        storage_arr[i] = current_battery_storage
+        total_charge_discharge = battery_solar_charge + battery_grid_shift_charge + import_discharge + battery_fit_discharge
+        cycles_arr[i] = total_charge_discharge / (max_charge_capacity * 2)
+        overall_battery_cycles += cycles_arr[i]
+
+    return (
+            current_battery_storage, 
+            overall_charge_total, 
+            overall_discharge_total, 
+            overall_battery_cycles)
+
+
+def simulate_fleet(
+        array_dict: dict,
+        config: dict,
+        use_jit: bool) -> dict:
+
+    # simulates the same battery for every household 
+    # over the fleet arrays, adjusting import/export in place
+    # Returns the per household totals and the 
+    # (intervals x households) battery field arrays
+    shape = array_dict['import'].shape
+    hour_arr = array_dict['hour']
+    grid_shift_mask = get_interval_mask(
+            hour_arr, 
+            config['grid_shift_set'], 
+            True)
+    discharge_mask = get_interval_mask(
+            hour_arr, 
+            set(range(24)) - config['grid_shift_set'] - config['discharge_bypass_set'], 
+            True)
+    fit_discharge_mask = get_interval_mask(
+            hour_arr, 
+            config['fit_discharge_set'], 
+            True)
+
+    field_list = [
+            'battery_solar_charge',
+            'battery_grid_charge',
+            'battery_discharge',
+            'battery_storage',
+            'battery_cycles',
+            ]
+    battery_dict = {}
+    for key in field_list:
+        battery_dict[key] = np.zeros(shape)
+
+    param_list = [
+            config['max_charge_capacity'],
+            config['battery_capacity'] * config['min_charge_percent'] / 100,
+            config['charge_rate'],
+            config['discharge_rate'],
+            config['export_charge_boundary'],
+            config['battery_to_ac_charge_factor'],
+            config['ac_to_battery_charge_factor'],
+            config['battery_to_ac_discharge_factor'],
+            config['ac_to_battery_discharge_factor'],
+            ]
+
+    if use_jit:
+        # compiled kernel per household column
+        total_list = []
+        for household in range(shape[1]):
+            total_list.append(
+                    jit_battery_kernel(
+                        array_dict['import'][:, household],
+                        array_dict['export'][:, household],
+                        array_dict['interval_hours'][:, household],
+                        grid_shift_mask[:, household],
+                        discharge_mask[:, household],
+                        fit_discharge_mask[:, household],
+                        *param_list,
+                        *[battery_dict[key][:, household] for key in field_list],
+                        0.0, 0.0, 0.0, 0.0))
+        total_tuple = tuple(np.array(totals) for totals in zip(*total_list))
+    else:
+        total_tuple = fleet_battery_kernel(
+                array_dict['import'],
+                array_dict['export'],
+                array_dict['interval_hours'],
+                grid_shift_mask,
+                discharge_mask,
+                fit_discharge_mask,
+                *param_list,
+                *[battery_dict[key] for key in field_list])
+
+    (battery_dict['final_storage'], 
+     battery_dict['charge_total'], 
+     battery_dict['discharge_total'], 
+     battery_dict['cycles_total']) = total_tuple
+
+    # consumed follows import where the battery was active
+    battery_dict['consumed_mask'] = grid_shift_mask | discharge_mask
+
+    return battery_dict
+
+
+def get_household_results(
+        array_dict: dict,
+        battery_dict: dict,
+        household: int) -> tuple[dict, dict]:
+
+    # record arrays and battery results of a single 
+    # household from the fleet arrays
+    index_arr = array_dict['index_list'][household]
+
+    household_array_dict = {}
+    for key in ['import', 'export']:
+        household_array_dict[key] = array_dict[key][index_arr, household]
+
+    household_battery_dict = {}
+    for key in [
+            'battery_solar_charge',
+            'battery_grid_charge',
+            'battery_discharge',
+            'battery_storage',
+            'battery_cycles',
+            'consumed_mask']:
+        household_battery_dict[key] = battery_dict[key][index_arr, household]
+
+    return household_array_dict, household_battery_dict
+
+
+def output_fleet_summary(
+        household_list: list,
+        tariff_name_list: list,
+        baseline_list: list,
+        result_list: list,
+        fleet_output: str) -> None:
+
+    # summary table of each household printed and 
+    # optionally written to a CSV file, with the cost
+    # and saving against no battery per tariff file
+    header_list = (['household', 'records', 'import', 'export', 
+                    'battery_charge', 'battery_discharge', 'battery_cycles'])
+    for name in tariff_name_list:
+        header_list += ['cost_%s' % (name), 'saving_%s' % (name)]
+
+    row_list = []
+    for household, baseline, result in zip(household_list, baseline_list, result_list):
+        row = [
+                household['name'], 
+                household['records'],
+                result['import'], 
+                result['export'], 
+                result['charge_total'], 
+                result['discharge_total'], 
+                result['battery_cycles']]
+        for baseline_cost, cost in zip(baseline['cost_list'], result['cost_list']):
+            row += [cost, baseline_cost - cost]
+        row_list.append(row)
+
+    output_summary_table(
+            'Fleet summary..',
+            header_list,
+            row_list,
+            fleet_output)
+
+    return
+
+
 # main()
 
 parser = argparse.ArgumentParser(
@@ -169,13 +1608,13 @@ parser = argparse.ArgumentParser(
 parser.add_argument(
         '--idir', 
         help = 'Input Directory for data files', 
-        required = True
+        required = False
         )
 
 parser.add_argument(
         '--odir', 
         help = 'Output Directory for modifled data files', 
-        required = True
+        required = False
         )
 
 parser.add_argument(
@@ -201,7 +1640,7 @@ parser.add_argument(
         '--battery_capacity', 
         help = 'Battery Capacity (kWh)', 
         type = float,
-        required = True
+        required = False
         )
 
 parser.add_argument(
@@ -209,7 +1648,7 @@ parser.add_argument(
         help = 'Battery Max Charge Percentage (1..100)', 
         type = int,
         choices = range(1, 101),
-        required = True
+        required = False
         )
 
 parser.add_argument(
@@ -217,21 +1656,21 @@ parser.add_argument(
         help = 'Battery Min Charge Percentage (1..100)', 
         type = int,
         choices = range(1, 101),
-        required = True
+        required = False
         )
 
 parser.add_argument(
         '--charge_rate', 
         help = 'Battery Charge Rate (kWh/hour)', 
         type = float,
-        required = True
+        required = False
         )
 
 parser.add_argument(
         '--discharge_rate', 
         help = 'Battery Discharge Rate (kWh/hour)', 
         type = float,
-        required = True
+        required = False
         )
 
 parser.add_argument(
@@ -281,6 +1720,22 @@ parser.add_argument(
         required = False
         )
 
+parser.add_argument(
+        '--dispatch', 
+        help = 'Battery dispatch (def greedy), optimal minimises cost for the --tariffs rates', 
+        choices = ['greedy', 'optimal'],
+        default = 'greedy',
+        required = False
+        )
+
+parser.add_argument(
+        '--soc_levels', 
+        help = 'Battery charge levels for optimal dispatch (def 101)', 
+        type = int,
+        default = 101,
+        required = False
+        )
+
 parser.add_argument(
         '--decimal_places', 
         help = 'Decimal Places (def:4)', 
@@ -290,228 +1745,563 @@ parser.add_argument(
         )
 
 parser.add_argument(
-        '--verbose', 
-        help = 'Enable verbose output', 
-        action = 'store_true'
+        '--format', 
+        help = 'Output data format (def jsonl)', 
+        choices = energy_store.data_format_list,
+        default = 'jsonl',
+        required = False
         )
 
+parser.add_argument(
+        '--sweep', 
+        help = 'JSON file of battery option values to simulate in every combination', 
+        required = False
+        )
 
-args = vars(parser.parse_args())
-idir = args['idir']
-odir = args['odir']
-start_date = args['start']
-end_date = args['end']
-timezone = args['timezone']
-battery_capacity = args['battery_capacity']
-max_charge_percent = args['max_charge_percent']
-min_charge_percent = args['min_charge_percent']
-charge_rate = args['charge_rate']
-discharge_rate = args['discharge_rate']
-charge_loss_percent = args['charge_loss_percent']
-discharge_loss_percent = args['discharge_loss_percent']
-discharge_bypass_interval = args['discharge_bypass_interval']
-grid_shift_interval = args['grid_shift_interval']
-fit_discharge_interval = args['fit_discharge_interval']
-export_charge_boundary = args['export_charge_boundary']
-decimal_places = args['decimal_places']
-verbose = args['verbose']
-
-data_dict = load_data(
-        idir,
-        start_date,
-        end_date,
-        timezone)
+parser.add_argument(
+        '--tariffs', 
+        help = 'Tariffs JSON files for the summary costs (the first is used for optimal dispatch)', 
+        nargs = '+',
+        default = [],
+        required = False
+        )
 
-discharge_bypass_set = gen_time_interval_set(discharge_bypass_interval)
-grid_shift_set = gen_time_interval_set(grid_shift_interval)
-fit_discharge_set = gen_time_interval_set(fit_discharge_interval)
+parser.add_argument(
+        '--semopx', 
+        help = 'SEMOpx data directory for dynamic import rates', 
+        required = False
+        )
 
-current_battery_storage = 0
-overall_charge_total = 0
-overall_discharge_total = 0
-overall_battery_cycles = 0
+parser.add_argument(
+        '--semopx_margin', 
+        help = 'Margin added to the SEMOpx rates per kWh (def:0)', 
+        type = float,
+        default = 0,
+        required = False
+        )
 
-# charging factors
-battery_to_ac_charge_factor = 1 + (charge_loss_percent / 100)
-ac_to_battery_charge_factor = (100 - charge_loss_percent) / 100 
+parser.add_argument(
+        '--semopx_vat', 
+        help = 'VAT Rate applied to the SEMOpx rates (def:0.. range 1-100)', 
+        type = float,
+        default = 0,
+        required = False
+        )
 
-# discharging factors
-battery_to_ac_discharge_factor = (100 - discharge_loss_percent) / 100
-ac_to_battery_discharge_factor = 1 + (discharge_loss_percent / 100)
+parser.add_argument(
+        '--sweep_output', 
+        help = 'CSV file for the sweep summary', 
+        required = False
+        )
 
-max_charge_capacity = battery_capacity * max_charge_percent/100
+parser.add_argument(
+        '--jobs', 
+        help = 'Number of sweep configurations simulated in parallel (def 1, 0 for all CPUs)', 
+        type = int,
+        default = 1,
+        required = False
+        )
 
-# scan data to simulate battery
-key_list = list(data_dict.keys())
-key_list.sort()
+parser.add_argument(
+        '--fleet', 
+        help = 'Household data directories (or directories of household sub-directories) to simulate together', 
+        nargs = '+',
+        required = False
+        )
 
-for key in key_list:
-    rec = data_dict[key]
+parser.add_argument(
+        '--fleet_output', 
+        help = 'CSV file for the fleet summary', 
+        required = False
+        )
 
-    # solar charge only applies when export reaches min boundary
-    # helps avoid invalid phantom charges overnight
-    battery_solar_charge = 0
-    if rec['export'] >= export_charge_boundary:
-        # determine how much storage space we have 
-        available_charge_capacity = max_charge_capacity - current_battery_storage
+parser.add_argument(
+        '--streaming', 
+        help = 'Simulate and write a day at a time (greedy dispatch only)', 
+        action = 'store_true'
+        )
 
-        # determine what can be charged
-        # the min of charge rate and available capacity
-        max_export_charge = min(available_charge_capacity, charge_rate)
+parser.add_argument(
+        '--incremental', 
+        help = 'Continue from the battery state saved in odir by the last run (implies --streaming)', 
+        action = 'store_true'
+        )
 
-        # charge loss conversions
-        ac_charge = max_export_charge * battery_to_ac_charge_factor
-        solar_export_divert = min(rec['export'], ac_charge)
-        battery_solar_charge = solar_export_divert * ac_to_battery_charge_factor
+parser.add_argument(
+        '--jit', 
+        help = 'Compile the simulation kernel with numba', 
+        action = 'store_true'
+        )
 
-        log_message(
-                verbose,
-                '[%s] export charge:.. exp:%.4f max:%.4f exp_div:%.4f bat_chg:%.4f' % (
-                    rec['datetime'],
-                    rec['export'],
-                    max_export_charge,
-                    solar_export_divert,
-                    battery_solar_charge
-                    )
-                )
+parser.add_argument(
+        '--verbose', 
+        help = 'Enable verbose output', 
+        action = 'store_true'
+        )
 
-        # Reduce export and charge battery
-        current_battery_storage += battery_solar_charge
-        rec['export'] -= solar_export_divert
-        overall_charge_total += battery_solar_charge
+perf_utils.add_arguments(parser)
 
-    # grid shift charge
-    battery_grid_shift_charge = 0
-    if rec['hour'] in grid_shift_set:
-        # determine how much storage space we have 
-        available_charge_capacity = max_charge_capacity - current_battery_storage
+args = vars(parser.parse_args())
+idir = args['idir']
+odir = args['odir']
+start_date = args['start']
+end_date = args['end']
+timezone = args['timezone']
+decimal_places = args['decimal_places']
+data_format = args['format']
+sweep_file = args['sweep']
+tariff_file_list = args['tariffs']
+soc_levels = args['soc_levels']
+semopx_dir = args['semopx']
+semopx_margin = args['semopx_margin']
+semopx_vat = args['semopx_vat']
+sweep_output = args['sweep_output']
+jobs = args['jobs']
+fleet_dir_list = args['fleet']
+fleet_output = args['fleet_output']
+streaming = args['streaming']
+incremental = args['incremental']
+use_jit = args['jit']
+verbose = args['verbose']
 
-        # determine what can be charged
-        # the min of charge rate and available capacity
-        battery_grid_shift_charge = min(available_charge_capacity, charge_rate)
+# battery options as given on the command line
+option_dict = {}
+for key in sweep_option_list:
+    option_dict[key] = args[key]
+
+if jobs <= 0:
+    jobs = os.cpu_count()
+
+if soc_levels < 2:
+    log_message(1, 'Error: --soc_levels must be at least 2')
+    sys.exit(-1)
+
+if use_jit and numba is None:
+    log_message(1, 'Error: --jit requires the numba module')
+    sys.exit(-1)
+
+if fleet_dir_list:
+    if np is None:
+        log_message(1, 'Error: --fleet requires the numpy module')
+        sys.exit(-1)
+
+    if sweep_file or idir:
+        log_message(1, 'Error: --fleet cannot be combined with --idir or --sweep')
+        sys.exit(-1)
+
+elif not idir:
+    parser.error('the following arguments are required: --idir (or --fleet)')
+
+if option_dict['dispatch'] == 'optimal' and fleet_dir_list:
+    log_message(1, 'Error: --dispatch optimal is not supported with --fleet')
+    sys.exit(-1)
+
+if incremental:
+    streaming = True
+
+if streaming and (sweep_file or fleet_dir_list or option_dict['dispatch'] == 'optimal'):
+    log_message(1, 'Error: --streaming and --incremental cannot be combined with --sweep, --fleet or --dispatch optimal')
+    sys.exit(-1)
+
+# output directory is optional for sweeps and fleets
+required_list = list(required_option_list)
+if not sweep_file and not fleet_dir_list:
+    required_list.insert(0, 'odir')
+
+if not sweep_file:
+    missing_list = []
+    for key in required_list:
+        if args[key] is None:
+            missing_list.append('--%s' % (key))
+
+    # same usage error and exit status as argparse
+    if missing_list:
+        parser.error(
+                'the following arguments are required: %s' % (
+                    ', '.join(missing_list))
+                )
 
-        # charge loss conversions
-        import_grid_shift_charge = battery_grid_shift_charge * battery_to_ac_charge_factor
+if __name__ == '__main__':
+    perf_utils.start(args)
 
+    # dynamic import rates
+    prices = None
+    if semopx_dir:
+        prices = tariff_utils.load_prices(
+                semopx_dir,
+                semopx_margin,
+                semopx_vat)
         log_message(
-                verbose,
-                '[%s] grid charge:.. bat_chg:%.4f imp_chg:%.4f' % (
-                    rec['datetime'],
-                    battery_grid_shift_charge,
-                    import_grid_shift_charge,
+                1,
+                'Loaded %d SEMOpx prices from %s' % (
+                    len(prices['ts_list']),
+                    semopx_dir
                     )
                 )
 
-        # charge battery from grid
-        current_battery_storage += battery_grid_shift_charge
-        rec['import'] += import_grid_shift_charge
-        rec['consumed'] = rec['import']
-        overall_charge_total += battery_grid_shift_charge
-
-    # discharge is conditional to 
-    # grid shift and discharge bypass times
-    import_discharge = 0
-    export_discharge = 0
-    battery_import_discharge = 0
-    battery_fit_discharge = 0
-    if (not rec['hour'] in discharge_bypass_set and 
-        not rec['hour'] in grid_shift_set):
-        # determine how much charge we have to use
-        available_discharge_capacity = current_battery_storage - (battery_capacity * min_charge_percent/100)
-        if available_discharge_capacity < 0:
-            available_discharge_capacity = 0
-
-        # determine max discharge
-        max_discharge = min(available_discharge_capacity, discharge_rate)
-
-        # discharge loss conversions
-        ac_discharge = max_discharge * battery_to_ac_discharge_factor
-        import_discharge = min(rec['import'], ac_discharge)
-        battery_import_discharge = import_discharge * ac_to_battery_discharge_factor
+    if fleet_dir_list:
+        # records of each household in time order
+        perf_utils.start_stage('load')
+        household_list = []
+        rec_list_list = []
+        for household_dir in get_fleet_dirs(fleet_dir_list):
+            data_dict = load_data(
+                    household_dir,
+                    start_date,
+                    end_date,
+                    timezone)
+            rec_list_list.append([data_dict[key] for key in sorted(data_dict.keys())])
+            household_list.append(
+                    {
+                        'name' : os.path.basename(os.path.normpath(household_dir)),
+                        'records' : len(data_dict),
+                        }
+                    )
+            perf_utils.count('records', len(data_dict))
+        perf_utils.count('households', len(household_list))
+
+        name_list = [household['name'] for household in household_list]
+        if len(set(name_list)) != len(name_list):
+            log_message(1, 'Error: household directory names must be unique')
+            sys.exit(-1)
+
+        array_dict = get_fleet_arrays(rec_list_list)
+        perf_utils.end_stage('load')
+
+        # tariff rates per record and the totals without 
+        # any battery for each household
+        perf_utils.start_stage('cost')
+        tariff_name_list = []
+        tariffs_list = []
+        for tariff_file in tariff_file_list:
+            tariff_name_list.append(
+                    os.path.splitext(os.path.basename(tariff_file))[0])
+            tariffs_list.append(tariff_utils.load_tariff_file(tariff_file))
+
+        rate_dict_list_list = []
+        baseline_list = []
+        for rec_list in rec_list_list:
+            rate_dict_list = [
+                    get_tariff_rates(rec_list, tariffs, prices) 
+                    for tariffs in tariffs_list]
+            rate_dict_list_list.append(rate_dict_list)
+            baseline_list.append(
+                    get_sweep_totals(
+                        [rec['import'] for rec in rec_list], 
+                        [rec['export'] for rec in rec_list], 
+                        rate_dict_list))
+        perf_utils.end_stage('cost')
 
         log_message(
-                verbose,
-                '[%s] import discharge:.. imp:%.4f max:%.4f imp_dis:%.4f bat_dis:%.4f' % (
-                    rec['datetime'],
-                    rec['import'],
-                    max_discharge,
-                    import_discharge,
-                    battery_import_discharge
-                    )
+                1,
+                'Simulating %d households over %d intervals' % (
+                    len(household_list),
+                    len(array_dict['import']))
                 )
 
-        # Discharge battery and reduce import 
-        current_battery_storage -= battery_import_discharge
-        rec['import'] -= import_discharge
-        rec['consumed'] = rec['import']
-        overall_discharge_total += battery_import_discharge
-
-        # Forced FIT discharge 
-        # trying to flush the battery to the grid
-        battery_fit_discharge = 0
-        if rec['hour'] in fit_discharge_set:
-            # determine additional discharge possible
-            # taking off any existing import discharge we had applied
-            battery_fit_discharge = max_discharge - battery_import_discharge
-            export_discharge = battery_fit_discharge * battery_to_ac_discharge_factor
-
-            log_message(
-                    verbose,
-                    '[%s] fit discharge:.. exp_dis:%.4f bat_dis:%.4f' % (
-                        rec['datetime'],
-                        export_discharge,
-                        battery_fit_discharge
+        perf_utils.start_stage('simulate')
+        battery_capacity = option_dict['battery_capacity']
+        battery_dict = simulate_fleet(
+                array_dict,
+                get_battery_config(option_dict),
+                use_jit)
+        perf_utils.end_stage('simulate')
+
+        perf_utils.start_stage('write')
+        energy_store.set_decimal_places(decimal_places)
+        result_list = []
+        for household, rec_list in enumerate(rec_list_list):
+            household_array_dict, household_battery_dict = get_household_results(
+                    array_dict,
+                    battery_dict,
+                    household)
+
+            totals = get_sweep_totals(
+                    household_array_dict['import'].tolist(),
+                    household_array_dict['export'].tolist(),
+                    rate_dict_list_list[household])
+            totals['charge_total'] = float(battery_dict['charge_total'][household])
+            totals['discharge_total'] = float(battery_dict['discharge_total'][household])
+            totals['battery_cycles'] = float(battery_dict['cycles_total'][household])
+            result_list.append(totals)
+
+            # optional per interval output per household
+            if odir:
+                apply_battery_results(
+                        rec_list,
+                        household_array_dict,
+                        household_battery_dict,
+                        battery_capacity)
+
+                household_odir = os.path.join(
+                        odir, 
+                        household_list[household]['name'])
+                if not os.path.exists(household_odir):
+                    os.makedirs(household_odir)
+
+                day_dict = {}
+                for rec in rec_list:
+                    if not rec['day'] in day_dict:
+                        day_dict[rec['day']] = {}
+                    day_dict[rec['day']][rec['ts']] = rec
+
+                output_results(
+                        household_odir,
+                        day_dict,
+                        decimal_places,
+                        data_format)
+
+        output_fleet_summary(
+                household_list,
+                tariff_name_list,
+                baseline_list,
+                result_list,
+                fleet_output)
+        perf_utils.end_stage('write')
+
+        sys.exit(0)
+
+    if streaming:
+        # JSONL writer decimal places (def 4)
+        energy_store.set_decimal_places(decimal_places)
+
+        tariff_name_list = []
+        tariffs_list = []
+        for tariff_file in tariff_file_list:
+            tariff_name_list.append(
+                    os.path.splitext(os.path.basename(tariff_file))[0])
+            tariffs_list.append(tariff_utils.load_tariff_file(tariff_file))
+
+        # Incremental mode
+        # The state file keeps the battery state at the end of
+        # the second last day simulated for each configuration.
+        # The run carries on from the day after, so the last day
+        # is simulated again in case its data was incomplete.
+        state = None
+        stream_start_date = start_date
+        if incremental:
+            state_file = '%s/%s' % (odir, state_filename)
+            state_dict = load_state_file(state_file)
+            config_hash = get_config_hash(
+                    option_dict,
+                    idir,
+                    start_date,
+                    timezone,
+                    data_format)
+            checkpoint = state_dict.get(config_hash)
+            if checkpoint:
+                state = get_battery_state(checkpoint)
+                stream_start_date = (
+                        datetime.date.fromisoformat(checkpoint['day']) + 
+                        datetime.timedelta(days = 1)).strftime('%Y%m%d')
+                log_message(
+                        1,
+                        'Resuming from battery state at end of %s' % (
+                            checkpoint['day'])
                         )
-                    )
-
-            # Additionally discharge battery to max and increase export
-            current_battery_storage -= battery_fit_discharge
-            rec['export'] += export_discharge
-            overall_discharge_total += battery_fit_discharge
-
-    # record activity and charge status in record
-    rec['battery_solar_charge'] = battery_solar_charge
-    rec['battery_grid_charge'] = battery_grid_shift_charge
-    rec['battery_discharge'] = battery_import_discharge + battery_fit_discharge
-    rec['battery_storage'] = current_battery_storage
-    rec['battery_capacity'] = round(current_battery_storage / battery_capacity * 100)
-    total_charge_discharge = battery_solar_charge + battery_grid_shift_charge + import_discharge + battery_fit_discharge
-    rec['battery_cycles'] = total_charge_discharge / (max_charge_capacity * 2)
-    overall_battery_cycles += rec['battery_cycles']
-
-
-# split into separate dicts per day
-day_dict = {}
-for ts in data_dict:
-    usage_rec = data_dict[ts]
-    day = usage_rec['day']
-    if not day in day_dict:
-        day_dict[day] = {}
-
-    day_dict[day][ts] = usage_rec
 
-# JSON encoder force decimal places to 4
-class RoundingFloat(float):
-    __repr__ = staticmethod(lambda x: format(x, '.4f'))
-
-json.encoder.c_make_encoder = None
-json.encoder.float = RoundingFloat
+        battery_capacity = option_dict['battery_capacity']
+        battery_dict = stream_battery(
+                idir,
+                odir,
+                stream_start_date,
+                end_date,
+                timezone,
+                get_battery_config(option_dict),
+                battery_capacity,
+                tariffs_list,
+                prices,
+                data_format,
+                decimal_places,
+                use_jit,
+                state)
+
+        if incremental and battery_dict['checkpoint_day']:
+            checkpoint = {}
+            checkpoint['day'] = battery_dict['checkpoint_day']
+            checkpoint.update(battery_dict['checkpoint_state'])
+            checkpoint['options'] = option_dict
+            state_dict[config_hash] = checkpoint
+            save_state_file(
+                    state_file,
+                    state_dict)
+
+        log_final_state(
+                battery_dict,
+                battery_capacity,
+                tariff_name_list,
+                battery_dict['totals'],
+                battery_dict['baseline'])
+
+        sys.exit(0)
+
+    perf_utils.start_stage('load')
+    data_dict = load_data(
+            idir,
+            start_date,
+            end_date,
+            timezone)
+    perf_utils.end_stage('load')
+    perf_utils.count('records', len(data_dict))
+
+    # records in time order
+    key_list = list(data_dict.keys())
+    key_list.sort()
+    rec_list = [data_dict[key] for key in key_list]
+    array_dict = get_record_arrays(
+            rec_list,
+            use_jit)
+
+    if sweep_file:
+        sweep_key_list, option_dict_list = load_sweep_configs(
+                sweep_file,
+                option_dict)
+    else:
+        option_dict_list = [option_dict]
+
+    # optimal dispatch needs the rates of the first tariff file
+    for dispatch in set(config['dispatch'] for config in option_dict_list):
+        if not dispatch in ['greedy', 'optimal']:
+            log_message(1, 'Error: unknown dispatch %s' % (dispatch))
+            sys.exit(-1)
+
+        if dispatch == 'optimal':
+            if not tariff_file_list:
+                log_message(1, 'Error: --tariffs required for optimal dispatch')
+                sys.exit(-1)
+
+            if np is None:
+                log_message(1, 'Error: optimal dispatch requires the numpy module')
+                sys.exit(-1)
+
+    # the optimal schedule only moves between charge levels
+    # so a level step must be possible within the shortest 
+    # interval at both the charge and discharge rate
+    if len(rec_list) > 0:
+        min_interval_hours = min(array_dict['interval_hours'])
+        for config in option_dict_list:
+            if config['dispatch'] != 'optimal':
+                continue
+
+            max_step = min(config['charge_rate'], config['discharge_rate']) * min_interval_hours
+            max_charge_capacity = get_battery_config(config)['max_charge_capacity']
+            level_step = max_charge_capacity / (soc_levels - 1)
+            if level_step > max_step + 1e-9:
+                if max_step > 0:
+                    min_levels = '.. use --soc_levels %d or more' % (
+                            math.ceil(max_charge_capacity / max_step - 1e-9) + 1)
+                else:
+                    min_levels = ''
+                log_message(
+                        1,
+                        'Error: --soc_levels %d gives %.4fkWh charge level steps, more than the %.4fkWh a %d min interval allows at the charge/discharge rates%s' % (
+                            soc_levels,
+                            level_step,
+                            max_step,
+                            round(min_interval_hours * 60),
+                            min_levels)
+                        )
+                sys.exit(-1)
+
+    # tariff rates per record and the totals without 
+    # any battery
+    perf_utils.start_stage('cost')
+    tariff_name_list = []
+    rate_dict_list = []
+    for tariff_file in tariff_file_list:
+        tariff_name_list.append(
+                os.path.splitext(os.path.basename(tariff_file))[0])
+        rate_dict_list.append(
+                get_tariff_rates(
+                    rec_list,
+                    tariff_utils.load_tariff_file(tariff_file),
+                    prices))
+    baseline = get_sweep_totals(
+            [rec['import'] for rec in rec_list], 
+            [rec['export'] for rec in rec_list], 
+            rate_dict_list)
+    perf_utils.end_stage('cost')
+
+    if sweep_file:
+        log_message(
+                1,
+                'Simulating %d battery configurations' % (
+                    len(option_dict_list))
+                )
 
-for day in sorted(day_dict.keys()):
+        perf_utils.start_stage('simulate')
+        result_list = run_sweep(
+                array_dict,
+                rate_dict_list,
+                option_dict_list,
+                jobs,
+                use_jit,
+                soc_levels)
+        perf_utils.end_stage('simulate')
+        perf_utils.count('configs', len(option_dict_list))
+
+        perf_utils.start_stage('write')
+        output_sweep_summary(
+                sweep_key_list,
+                tariff_name_list,
+                option_dict_list,
+                result_list,
+                baseline,
+                sweep_output)
+        perf_utils.end_stage('write')
+
+        sys.exit(0)
+
+    perf_utils.start_stage('simulate')
+    battery_capacity = option_dict['battery_capacity']
+    if option_dict['dispatch'] == 'optimal':
+        battery_dict = optimise_battery(
+                array_dict,
+                get_battery_config(option_dict),
+                rate_dict_list[0],
+                soc_levels)
+    else:
+        battery_dict = simulate_battery(
+                array_dict,
+                get_battery_config(option_dict),
+                use_jit)
+    apply_battery_results(
+            rec_list,
+            array_dict,
+            battery_dict,
+            battery_capacity)
+    perf_utils.end_stage('simulate')
+
+    # split into separate dicts per day
+    day_dict = {}
+    for ts in data_dict:
+        usage_rec = data_dict[ts]
+        day = usage_rec['day']
+        if not day in day_dict:
+            day_dict[day] = {}
+
+        day_dict[day][ts] = usage_rec
+
+    # JSONL writer decimal places (def 4)
+    energy_store.set_decimal_places(decimal_places)
+
+    perf_utils.start_stage('write')
     output_results(
             odir,
-            day_dict[day],
-            day,
-            decimal_places)   
-
-
-log_message(
-        1,
-        'Final battery state.. charge:%.4fkWh (%d%%) ovl_charge:%.4fkWh ovl_discharge:%.4fkWh (%d cycles)' % (
-            current_battery_storage,
-            round(current_battery_storage / battery_capacity * 100),
-            overall_charge_total,
-            overall_discharge_total,
-            overall_battery_cycles,
-            )
-        )
+            day_dict,
+            decimal_places,
+            data_format)
+    perf_utils.end_stage('write')
+
+    # cost against each tariff file
+    totals = get_sweep_totals(
+            [rec['import'] for rec in rec_list], 
+            [rec['export'] for rec in rec_list], 
+            rate_dict_list)
+
+    log_final_state(
+            battery_dict,
+            battery_capacity,
+            tariff_name_list,
+            totals,
+            baseline)
@@ -0,0 +1,773 @@
+import argparse
+import json
+import os
+import time
+import datetime
+import math
+import random
+import platform
+import shutil
+import subprocess
+import sys
+import time_utils
+import energy_store
+
+# optional numpy, selects the vectorized stages
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# script directory, all scripts are run from here
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# synthetic datasets end on this day and go back
+# the given number of years
+end_day = '2024-12-31'
+
+# pipeline stages in run order
+# each is run per dataset as a separate process
+# {
+#   'script' : script file
+#   'args' : arguments with {dir} placeholders
+#   'odir' : output directory reset before each run
+#   'records' : dataset record count used for throughput
+#   'requires' : optional module needed by the stage
+# }
+stage_dict = {
+        'esb_hdf_reader' : {
+            'script' : 'esb_hdf_reader.py',
+            'args' : [
+                '--file', '{hdf_file}',
+                '--odir', '{esb_dir}',
+                '--interval', '{interval}',
+                '--partial_days',
+                '--timezone', '{timezone}',
+                '--format', '{format}',
+                ],
+            'odir' : 'esb_dir',
+            'records' : 'esb',
+            },
+        'esb_hdf_reader_vectorized' : {
+            'script' : 'esb_hdf_reader.py',
+            'args' : [
+                '--file', '{hdf_file}',
+                '--odir', '{esb_vec_dir}',
+                '--interval', '{interval}',
+                '--partial_days',
+                '--vectorized',
+                '--timezone', '{timezone}',
+                '--format', '{format}',
+                ],
+            'odir' : 'esb_vec_dir',
+            'records' : 'esb',
+            'requires' : 'numpy',
+            },
+        'battery_sim' : {
+            'script' : 'battery_sim.py',
+            'args' : [
+                '--idir', '{esb_dir}',
+                '--odir', '{battery_dir}',
+                '--battery_capacity', '10',
+                '--max_charge_percent', '100',
+                '--min_charge_percent', '10',
+                '--charge_rate', '5',
+                '--discharge_rate', '5',
+                '--grid_shift_interval', '02-06',
+                '--timezone', '{timezone}',
+                '--format', '{format}',
+                ],
+            'odir' : 'battery_dir',
+            'records' : 'esb',
+            },
+        'esb_merge_util' : {
+            'script' : 'esb_merge_util.py',
+            'args' : [
+                '--inverter_dir', '{solar_dir}',
+                '--esb_dir', '{esb_dir}',
+                '--odir', '{merge_dir}',
+                '--format', '{format}',
+                ],
+            'odir' : 'merge_dir',
+            'records' : 'solar',
+            },
+        'gen_report' : {
+            'script' : 'gen_report.py',
+            'args' : [
+                '--idir', '{esb_dir}',
+                '--tariffs', '{tariff_file}',
+                '--file', '{report_dir}/esb_report.xlsx',
+                '--timezone', '{timezone}',
+                ],
+            'odir' : 'report_dir',
+            'records' : 'esb',
+            },
+        'gen_report_csv' : {
+            'script' : 'gen_report.py',
+            'args' : [
+                '--idir', '{esb_dir}',
+                '--tariffs', '{tariff_file}',
+                '--file', '{report_dir}/esb_report',
+                '--output', 'csv',
+                '--timezone', '{timezone}',
+                ],
+            'odir' : 'report_dir',
+            'records' : 'esb',
+            },
+        'gen_report_semopx' : {
+            'script' : 'gen_report.py',
+            'args' : [
+                '--idir', '{esb_dir}',
+                '--tariffs', '{tariff_file}',
+                '--semopx', '{semopx_dir}',
+                '--file', '{report_dir}/esb_semopx_report',
+                '--output', 'csv',
+                '--timezone', '{timezone}',
+                ],
+            'odir' : 'report_dir',
+            'records' : 'esb',
+            },
+        'gen_semopx_report' : {
+            'script' : 'gen_semopx_report.py',
+            'args' : [
+                '--idir', '{semopx_dir}',
+                '--file', '{report_dir}/semopx_report.xlsx',
+                '--timezone', '{timezone}',
+                ],
+            'odir' : 'report_dir',
+            'records' : 'semopx',
+            },
+        }
+
+
+def log_message(
+        verbose: int,
+        message: str):
+
+    if verbose:
+        print(
+                '%s %s' % (
+                    time.asctime(),
+                    message
+                    )
+                )
+
+    return
+
+
+def get_dataset_name(
+        years: int,
+        interval: int) -> str:
+
+    return '%dy_%dmin' % (years, interval)
+
+
+def get_start_day(
+        years: int) -> str:
+
+    # day after the same date the given years back
+    end_dt = datetime.date.fromisoformat(end_day)
+    start_dt = end_dt.replace(year = end_dt.year - years)
+    return (start_dt + datetime.timedelta(days = 1)).isoformat()
+
+
+def iter_interval_ts(
+        years: int,
+        interval: int):
+
+    # epoch start of each interval in the dataset
+    start_ts, _ = time_utils.parse_range_time(
+            get_start_day(years).replace('-', ''),
+            timezone,
+            end = False)
+    end_ts, _ = time_utils.parse_range_time(
+            end_day.replace('-', ''),
+            timezone,
+            end = True)
+
+    return range(start_ts, end_ts, interval * 60)
+
+
+def get_usage(
+        rng: random.Random,
+        dt: datetime.datetime,
+        interval_hours: float) -> tuple[float, float]:
+
+    # synthetic household load and solar generation (kWh)
+    # for the interval. Load has a night base, morning
+    # and evening peaks. Solar follows the day length
+    # and a seasonal peak in June
+    hour = dt.hour + dt.minute / 60
+    day_of_year = dt.timetuple().tm_yday
+    season = math.cos(2 * math.pi * (day_of_year - 172) / 365)
+
+    load = 0.3
+    load += 0.8 * math.exp(-((hour - 8) ** 2) / 2)
+    load += 1.5 * math.exp(-((hour - 19) ** 2) / 4)
+    load *= 0.6 + rng.random() * 0.8
+
+    day_length = 12 + 4 * season
+    solar = 0
+    sunrise = 13 - day_length / 2
+    if sunrise < hour < sunrise + day_length:
+        solar = (3 + 2 * season) * math.sin(
+                math.pi * (hour - sunrise) / day_length)
+        solar *= 0.3 + rng.random() * 0.7
+
+    return load * interval_hours, solar * interval_hours
+
+
+def gen_esb_hdf_file(
+        hdf_file: str,
+        years: int,
+        rng: random.Random) -> int:
+
+    # ESB HDF CSV file of 30-min import/export reads
+    # most recent first with local end times as
+    # provided by ESB Networks
+    row_list = []
+    for ts in iter_interval_ts(years, 30):
+        dt = time_utils.epoch_to_local(ts, timezone)
+        load, solar = get_usage(rng, dt, 0.5)
+        end_str = time_utils.epoch_to_local(
+                ts + 1800,
+                timezone).strftime('%d-%m-%Y %H:%M')
+
+        grid_import = max(load - solar, 0)
+        grid_export = max(solar - load, 0)
+        row_list.append(
+                'XXXX,XXXX,%.4f,Active Export Interval (kWh),%s\n' % (
+                    grid_export,
+                    end_str))
+        row_list.append(
+                'XXXX,XXXX,%.4f,Active Import Interval (kWh),%s\n' % (
+                    grid_import,
+                    end_str))
+
+    with open(hdf_file, 'w') as f:
+        f.write('MPRN,Meter Serial Number,Read Value,Read Type,Read Date and End Time\n')
+        for row in reversed(row_list):
+            f.write(row)
+
+    return len(row_list) // 2
+
+
+def get_time_fields(
+        rec: dict,
+        ts: int,
+        interval: int) -> datetime.datetime:
+
+    # common time fields as written by the data utilities
+    dt = time_utils.epoch_to_local(ts, timezone)
+    rec['ts'] = ts
+    rec['datetime'] = dt.strftime('%Y/%m/%d %H:%M:%S')
+    rec['hour'] = dt.hour
+    (rec['day'],
+     rec['month'],
+     rec['year'],
+     rec['weekday'],
+     rec['week']) = time_utils.get_day_keys(
+             dt.year,
+             dt.month,
+             dt.day)
+    if interval != 60:
+        rec['interval'] = interval
+
+    return dt
+
+
+def gen_solar_files(
+        solar_dir: str,
+        years: int,
+        interval: int,
+        rng: random.Random) -> int:
+
+    # Solis/Shelly style day files with solar, import
+    # and export at the given interval
+    day_dict = {}
+    num_recs = 0
+    for ts in iter_interval_ts(years, interval):
+        rec = {}
+        dt = get_time_fields(rec, ts, interval)
+        load, solar = get_usage(rng, dt, interval / 60)
+        rec['import'] = max(load - solar, 0)
+        rec['export'] = max(solar - load, 0)
+        rec['solar'] = solar
+        rec['solar_consumed'] = rec['solar'] - rec['export']
+        rec['consumed'] = rec['import'] + rec['solar_consumed']
+
+        if not rec['day'] in day_dict:
+            day_dict[rec['day']] = {}
+        day_dict[rec['day']][ts] = rec
+        num_recs += 1
+
+    energy_store.write_days(solar_dir, day_dict, data_format)
+
+    return num_recs
+
+
+def gen_semopx_files(
+        semopx_dir: str,
+        years: int,
+        rng: random.Random) -> int:
+
+    # SEMOpx style day files of 30-min market rates
+    day_dict = {}
+    num_recs = 0
+    for ts in iter_interval_ts(years, 30):
+        dt = time_utils.epoch_to_local(ts, timezone)
+        rec = {
+                'ts' : ts,
+                'datetime' : dt.strftime('%Y/%m/%d %H:%M:%S'),
+                'market_area' : 'ROI',
+                'currency' : 'euro',
+                'da_kwh_rate' : round(0.08 + rng.random() * 0.2, 4),
+                'ida1_kwh_rate' : round(0.08 + rng.random() * 0.2, 4),
+                }
+        rec['final_kwh_rate'] = rec['ida1_kwh_rate']
+
+        day = dt.strftime('%Y-%m-%d')
+        if not day in day_dict:
+            day_dict[day] = {}
+        day_dict[day][ts] = rec
+        num_recs += 1
+
+    energy_store.write_days(semopx_dir, day_dict, data_format)
+
+    return num_recs
+
+
+def get_dataset(
+        data_dir: str,
+        years: int,
+        interval: int,
+        result_list: list) -> dict:
+
+    # generates the synthetic inputs for a dataset once
+    # and reuses them on later runs with the same seed
+    dataset = get_dataset_name(years, interval)
+    dataset_dir = '%s/%s' % (data_dir, dataset)
+    info_file = '%s/dataset.json' % (dataset_dir)
+
+    dir_dict = {
+            'hdf_file' : '%s/HDF_%s.csv' % (dataset_dir, dataset),
+            'solar_dir' : '%s/solar' % (dataset_dir),
+            'semopx_dir' : '%s/semopx' % (dataset_dir),
+            'esb_dir' : '%s/esb' % (dataset_dir),
+            'esb_vec_dir' : '%s/esb_vectorized' % (dataset_dir),
+            'battery_dir' : '%s/battery' % (dataset_dir),
+            'merge_dir' : '%s/merged' % (dataset_dir),
+            'report_dir' : '%s/reports' % (dataset_dir),
+            'tariff_file' : '%s/sample_tariffs_plan.json' % (script_dir),
+            'interval' : str(interval),
+            'timezone' : timezone,
+            'format' : data_format,
+            }
+
+    if os.path.exists(info_file):
+        with open(info_file) as f:
+            info = json.load(f)
+        if (info['seed'] == seed and
+            info['format'] == data_format and
+            info['timezone'] == timezone):
+            log_message(
+                    1,
+                    'Using existing dataset %s' % (
+                        dataset)
+                    )
+            info.update(dir_dict)
+            return info
+
+    log_message(
+            1,
+            'Generating dataset %s' % (
+                dataset)
+            )
+    if os.path.exists(dataset_dir):
+        shutil.rmtree(dataset_dir)
+    for key in ['solar_dir', 'semopx_dir']:
+        os.makedirs(dir_dict[key])
+
+    # same seed per dataset so that the values
+    # do not depend on which datasets are selected
+    rng = random.Random('%s-%s' % (seed, dataset))
+    start_time = time.perf_counter()
+    info = {
+            'seed' : seed,
+            'format' : data_format,
+            'timezone' : timezone,
+            'years' : years,
+            'interval' : interval,
+            }
+
+    # ESB records at the dataset interval from the
+    # 30-min reads
+    info['esb_records'] = gen_esb_hdf_file(
+            dir_dict['hdf_file'], 
+            years, 
+            rng) * 30 // interval
+    info['solar_records'] = gen_solar_files(dir_dict['solar_dir'], years, interval, rng)
+    info['semopx_records'] = gen_semopx_files(dir_dict['semopx_dir'], years, rng)
+    elapsed = time.perf_counter() - start_time
+
+    with open(info_file, 'w') as f:
+        json.dump(info, f, indent = 4)
+
+    num_recs = (info['esb_records'] + 
+                info['solar_records'] + 
+                info['semopx_records'])
+    result_list.append(
+            {
+                'dataset' : dataset,
+                'stage' : 'generate',
+                'elapsed' : round(elapsed, 3),
+                'records' : num_recs,
+                'records_per_sec' : round(num_recs / elapsed),
+                'peak_rss_kb' : None,
+                'exit_code' : 0,
+                }
+            )
+
+    info.update(dir_dict)
+    return info
+
+
+def run_stage(
+        dataset: str,
+        stage: str,
+        info: dict) -> dict:
+
+    # runs the stage script as a separate process
+    # timing it end to end and getting its peak RSS
+    stage_rec = stage_dict[stage]
+    arg_list = [
+            sys.executable,
+            '%s/%s' % (script_dir, stage_rec['script']),
+            ]
+    for arg in stage_rec['args']:
+        arg_list.append(arg.format(**info))
+
+    # stage timing summary as the last line of the log
+    arg_list += ['--timings', 'json']
+
+    # output directory is reset on each run
+    odir = info[stage_rec['odir']]
+    shutil.rmtree(odir, ignore_errors = True)
+    os.makedirs(odir)
+
+    log_file = '%s/%s.log' % (
+            os.path.dirname(info['hdf_file']),
+            stage)
+
+    log_message(
+            verbose,
+            'Running %s' % (
+                ' '.join(arg_list))
+            )
+
+    peak_rss_kb = None
+    start_time = time.perf_counter()
+    with open(log_file, 'w') as log_fp:
+        proc = subprocess.Popen(
+                arg_list,
+                cwd = script_dir,
+                stdout = log_fp,
+                stderr = subprocess.STDOUT)
+
+        # per process resource usage where supported
+        # ru_maxrss is in KB on Linux and bytes on macOS
+        if hasattr(os, 'wait4'):
+            _, status, rusage = os.wait4(proc.pid, 0)
+            exit_code = os.waitstatus_to_exitcode(status)
+            proc.returncode = exit_code
+            peak_rss_kb = rusage.ru_maxrss
+            if sys.platform == 'darwin':
+                peak_rss_kb //= 1024
+        else:
+            exit_code = proc.wait()
+    elapsed = time.perf_counter() - start_time
+
+    num_recs = info['%s_records' % (stage_rec['records'])]
+    result = {
+            'dataset' : dataset,
+            'stage' : stage,
+            'elapsed' : round(elapsed, 3),
+            'records' : num_recs,
+            'records_per_sec' : round(num_recs / elapsed),
+            'peak_rss_kb' : peak_rss_kb,
+            'exit_code' : exit_code,
+            }
+
+    # last line of the log is the JSON timing summary
+    # or shows the failure
+    with open(log_file) as f:
+        line_list = f.read().strip().split('\n')
+
+    if exit_code != 0:
+        result['error'] = line_list[-1]
+    else:
+        try:
+            summary = json.loads(line_list[-1])
+            result['stages'] = summary['stages']
+            result['counters'] = summary['counters']
+        except (ValueError, KeyError):
+            log_message(
+                    1,
+                    'No timing summary in %s' % (
+                        log_file)
+                    )
+
+    return result
+
+
+def compare_results(
+        result_list: list,
+        compare_file: str,
+        threshold: float) -> int:
+
+    # lists the change in elapsed time and peak RSS against
+    # a previous results file, flagging any stage that is
+    # slower by more than the threshold percentage
+    # Returns the number of regressions
+    with open(compare_file) as f:
+        previous = json.load(f)
+
+    previous_dict = {}
+    for result in previous['results']:
+        previous_dict[(result['dataset'], result['stage'])] = result
+
+    regression_count = 0
+    for result in result_list:
+        key = (result['dataset'], result['stage'])
+        if (not key in previous_dict or
+            result['exit_code'] != 0 or
+            previous_dict[key]['exit_code'] != 0):
+            continue
+
+        previous_result = previous_dict[key]
+        change = (result['elapsed'] / max(previous_result['elapsed'], 0.001) - 1) * 100
+        flag = ''
+        if change > threshold:
+            flag = ' REGRESSION'
+            regression_count += 1
+
+        rss_str = ''
+        if result['peak_rss_kb'] and previous_result['peak_rss_kb']:
+            rss_str = ', peak RSS %d -> %d MB' % (
+                    previous_result['peak_rss_kb'] // 1024,
+                    result['peak_rss_kb'] // 1024)
+
+        log_message(
+                1,
+                '%-14s %-26s %8.2fs -> %8.2fs (%+.1f%%)%s%s' % (
+                    result['dataset'],
+                    result['stage'],
+                    previous_result['elapsed'],
+                    result['elapsed'],
+                    change,
+                    rss_str,
+                    flag)
+                )
+
+    return regression_count
+
+
+# main()
+parser = argparse.ArgumentParser(
+        description = 'Energy Utils Benchmark'
+        )
+
+parser.add_argument(
+        '--dir',
+        help = 'Working directory for the synthetic datasets and outputs',
+        required = True
+        )
+
+parser.add_argument(
+        '--years',
+        help = 'Dataset sizes in years (def 1 5 20)',
+        nargs = '+',
+        type = int,
+        default = [1, 5, 20],
+        required = False
+        )
+
+parser.add_argument(
+        '--interval',
+        help = 'Dataset intervals in minutes (def 60 30)',
+        nargs = '+',
+        type = int,
+        choices = [60, 30],
+        default = [60, 30],
+        required = False
+        )
+
+parser.add_argument(
+        '--stages',
+        help = 'Stages to run (def all)',
+        nargs = '+',
+        choices = list(stage_dict.keys()),
+        default = list(stage_dict.keys()),
+        required = False
+        )
+
+parser.add_argument(
+        '--results',
+        help = 'Output JSON results file (def <dir>/results_<time>.json)',
+        required = False
+        )
+
+parser.add_argument(
+        '--compare',
+        help = 'Previous JSON results file to compare against',
+        required = False
+        )
+
+parser.add_argument(
+        '--threshold',
+        help = 'Slowdown percentage reported as a regression (def 10)',
+        type = float,
+        default = 10,
+        required = False
+        )
+
+parser.add_argument(
+        '--seed',
+        help = 'Random seed for the synthetic data (def 1)',
+        type = int,
+        default = 1,
+        required = False
+        )
+
+parser.add_argument(
+        '--timezone',
+        help = 'Timezone',
+        default = 'Europe/Dublin',
+        required = False
+        )
+
+parser.add_argument(
+        '--format',
+        help = 'Data format (def jsonl)',
+        choices = ['jsonl', 'ecol'],
+        default = 'jsonl',
+        required = False
+        )
+
+parser.add_argument(
+        '--verbose',
+        help = 'Enable verbose output',
+        action = 'store_true'
+        )
+
+args = vars(parser.parse_args())
+data_dir = args['dir']
+years_list = args['years']
+interval_list = args['interval']
+stage_list = args['stages']
+results_file = args['results']
+compare_file = args['compare']
+threshold = args['threshold']
+seed = args['seed']
+timezone = args['timezone']
+data_format = args['format']
+verbose = args['verbose']
+
+os.makedirs(data_dir, exist_ok = True)
+if not results_file:
+    results_file = '%s/results_%s.json' % (
+            data_dir,
+            time.strftime('%Y%m%d_%H%M%S'))
+
+result_list = []
+for years in years_list:
+    for interval in interval_list:
+        dataset = get_dataset_name(years, interval)
+        info = get_dataset(
+                data_dir,
+                years,
+                interval,
+                result_list)
+
+        # stages in the defined order so that the ESB data
+        # is present for those that depend on it
+        for stage in stage_dict:
+            if not stage in stage_list:
+                continue
+
+            if (stage_dict[stage].get('requires') == 'numpy' and
+                np is None):
+                log_message(
+                        1,
+                        'Skipping %s %s (requires numpy)' % (
+                            dataset,
+                            stage)
+                        )
+                continue
+
+            result = run_stage(dataset, stage, info)
+            result_list.append(result)
+
+            if result['exit_code'] == 0:
+                log_message(
+                        1,
+                        '%-14s %-26s %8.2fs %10d rec/s %6s MB' % (
+                            dataset,
+                            stage,
+                            result['elapsed'],
+                            result['records_per_sec'],
+                            (result['peak_rss_kb'] // 1024
+                             if result['peak_rss_kb'] else '-'))
+                        )
+                for name, stage_rec in result.get('stages', {}).items():
+                    log_message(
+                            verbose,
+                            '%-14s   %-24s %8.2fs' % (
+                                '',
+                                name,
+                                stage_rec['elapsed'])
+                            )
+            else:
+                log_message(
+                        1,
+                        '%-14s %-26s FAILED (%s)' % (
+                            dataset,
+                            stage,
+                            result.get('error'))
+                        )
+
+with open(results_file, 'w') as f:
+    json.dump(
+            {
+                'time' : datetime.datetime.now().isoformat(timespec = 'seconds'),
+                'python' : platform.python_version(),
+                'platform' : platform.platform(),
+                'cpu_count' : os.cpu_count(),
+                'seed' : seed,
+                'format' : data_format,
+                'results' : result_list,
+                },
+            f,
+            indent = 4)
+
+log_message(
+        1,
+        'Results written to %s' % (
+            results_file)
+        )
+
+if compare_file:
+    regression_count = compare_results(
+            result_list,
+            compare_file,
+            threshold)
+    log_message(
+            1,
+            '%d regressions over %.1f%% against %s' % (
+                regression_count,
+                threshold,
+                compare_file)
+            )
+    if regression_count:
+        sys.exit(1)
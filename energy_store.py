@@ -0,0 +1,650 @@
+import array
+import bisect
+import calendar
+import datetime
+import json
+import mmap
+import os
+import struct
+import sys
+
+
+# Columnar energy data store
+# An alternative to the per-day JSONL files written by the
+# data utilities. Each file holds a full month of records
+# (YYYY-MM.ecol) as typed columns with a small JSON schema
+# header. Files are read via mmap so columns can be used
+# directly without any decoding.
+#
+# File layout:
+#   magic (8 bytes)
+#   header length (uint32 LE) + 4 bytes padding
+#   header JSON (padded to 8 bytes)
+#   column data blocks (little endian, each padded to 8 bytes)
+#
+# Column types:
+#   int64   - integer fields (ts, hour etc)
+#   float32 - numeric fields (import, export, rates etc)
+#   bool    - int8 flags (partial etc)
+#   str     - int32 codes into a value table in the header
+#
+# Any column not present in every record gets a uint8
+# presence mask so records are restored with the same keys.
+# Records are grouped by the day they were written for so
+# a day can be replaced in the same way as a day file.
+
+store_magic = b'ECOL\x00\x00\x00\x01'
+store_extension = '.ecol'
+jsonl_extension = '.jsonl'
+
+# supported data file formats for writers
+data_format_list = ['jsonl', 'ecol']
+
+# supported record intervals (minutes)
+# records without an interval field are hourly
+interval_list = [60, 30, 15]
+
+# float format for JSONL records, set via set_decimal_places()
+# None leaves the standard JSON float repr
+float_format = None
+infinity = float('inf')
+
+# encoded '"key": ' prefixes for record fields
+key_str_dict = {}
+
+# slack applied either side of the UTC span of a 
+# named day/month file when pruning by date range.
+# Covers any local timezone offset and the previous
+# day's 23:00 record present in SEMOpx day files
+file_range_slack = 2 * 86400
+
+# column type to array typecode
+column_type_dict = {
+        'int64' : 'q',
+        'float32' : 'f',
+        'bool' : 'b',
+        'str' : 'i',
+        }
+
+
+def align8(
+        size: int) -> int:
+
+    return (size + 7) & ~7
+
+
+def get_column_type(
+        value_list: list) -> str:
+
+    # narrowest type covering all present values
+    # bool is checked first as it is a subclass of int
+    present_list = [v for v in value_list if v is not None]
+    if all(isinstance(v, bool) for v in present_list):
+        return 'bool'
+
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in present_list):
+        return 'int64'
+
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present_list):
+        return 'float32'
+
+    return 'str'
+
+
+def to_le_bytes(
+        arr: array.array) -> bytes:
+
+    if sys.byteorder == 'big':
+        arr = array.array(arr.typecode, arr)
+        arr.byteswap()
+
+    return arr.tobytes()
+
+
+def write_store(
+        store_file: str,
+        day_dict: dict) -> None:
+
+    # day_dict is keyed by day (YYYY-MM-DD) with each
+    # day being a dict of records keyed by ts
+    day_list = []
+    rec_list = []
+    for day in sorted(day_dict.keys()):
+        if len(day_dict[day]) == 0:
+            continue
+        day_list.append([day, len(day_dict[day])])
+        for key in sorted(day_dict[day].keys()):
+            rec_list.append(day_dict[day][key])
+
+    # column names in first-seen order
+    name_dict = {}
+    for rec in rec_list:
+        for name in rec:
+            name_dict[name] = True
+
+    rows = len(rec_list)
+    column_list = []
+    block_list = []
+    offset = 0
+    for name in name_dict:
+        value_list = [rec.get(name) for rec in rec_list]
+        column_type = get_column_type(value_list)
+
+        column = {}
+        column['name'] = name
+        column['type'] = column_type
+
+        if column_type == 'str':
+            # dictionary encoded
+            # non-string values (lists/dicts) stored as JSON
+            value_table = {}
+            code_list = []
+            for value in value_list:
+                if value is None:
+                    code_list.append(-1)
+                    continue
+
+                if not isinstance(value, str):
+                    value = '\x00' + json.dumps(value)
+
+                if not value in value_table:
+                    value_table[value] = len(value_table)
+                code_list.append(value_table[value])
+
+            column['values'] = list(value_table.keys())
+            arr = array.array('i', code_list)
+        else:
+            default = 0
+            arr = array.array(
+                    column_type_dict[column_type],
+                    [default if v is None else v for v in value_list])
+
+        column['offset'] = offset
+        block = to_le_bytes(arr)
+        block_list.append(block + bytes(align8(len(block)) - len(block)))
+        offset += align8(len(block))
+
+        # presence mask for optional fields
+        if None in value_list:
+            mask = bytes(0 if v is None else 1 for v in value_list)
+            column['mask_offset'] = offset
+            block_list.append(mask + bytes(align8(len(mask)) - len(mask)))
+            offset += align8(len(mask))
+
+        column_list.append(column)
+
+    # global ts order is flagged to allow range
+    # searching with bisect
+    ts_list = [rec.get('ts') for rec in rec_list]
+    ts_sorted = (
+            not None in ts_list and
+            all(ts_list[i] <= ts_list[i + 1] for i in range(rows - 1)))
+
+    header = {}
+    header['version'] = 1
+    header['rows'] = rows
+    header['ts_sorted'] = ts_sorted
+    header['days'] = day_list
+    header['columns'] = column_list
+    header_bytes = json.dumps(header).encode('utf-8')
+
+    # written to a temp file and renamed into place
+    tmp_file = store_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(store_magic)
+        f.write(struct.pack('<II', len(header_bytes), 0))
+        f.write(header_bytes)
+        f.write(bytes(align8(len(header_bytes)) - len(header_bytes)))
+        for block in block_list:
+            f.write(block)
+    os.replace(tmp_file, store_file)
+
+    return
+
+
+def map_store(
+        store_file: str) -> tuple[dict, mmap.mmap, int]:
+
+    with open(store_file, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+
+    if mm[:8] != store_magic:
+        mm.close()
+        raise ValueError('%s is not a columnar store file' % (store_file))
+
+    header_len = struct.unpack_from('<I', mm, 8)[0]
+    header = json.loads(mm[16:16 + header_len])
+    data_start = 16 + align8(header_len)
+
+    return header, mm, data_start
+
+
+def read_store(
+        store_file: str) -> tuple[dict, dict, dict]:
+
+    # memory mapped column access
+    # returns the header, a dict of columns and a dict of 
+    # presence masks (optional columns only) keyed by name.
+    # Numeric columns are memoryviews over the mapped file
+    # (usable directly with numpy.frombuffer) and str columns
+    # are int32 code views into the column 'values' list
+    header, mm, data_start = map_store(store_file)
+    rows = header['rows']
+
+    column_dict = {}
+    mask_dict = {}
+    buf = memoryview(mm)
+    for column in header['columns']:
+        typecode = column_type_dict[column['type']]
+        start = data_start + column['offset']
+        size = rows * array.array(typecode).itemsize
+        if sys.byteorder == 'big':
+            arr = array.array(typecode, buf[start:start + size].tobytes())
+            arr.byteswap()
+            column_dict[column['name']] = memoryview(arr)
+        else:
+            column_dict[column['name']] = buf[start:start + size].cast(typecode)
+
+        if 'mask_offset' in column:
+            start = data_start + column['mask_offset']
+            mask_dict[column['name']] = buf[start:start + rows]
+
+    return header, column_dict, mask_dict
+
+
+def get_row_range(
+        header: dict,
+        column_dict: dict,
+        start_ts: int,
+        end_ts: int) -> tuple[int, int]:
+
+    # rows within the ts range (inclusive)
+    # narrowed by bisect when ts is in order
+    start_row = 0
+    end_row = header['rows']
+    if header['ts_sorted'] and 'ts' in column_dict:
+        if start_ts:
+            start_row = bisect.bisect_left(column_dict['ts'], start_ts)
+        if end_ts:
+            end_row = bisect.bisect_right(column_dict['ts'], end_ts)
+
+    return start_row, end_row
+
+
+def decode_records(
+        header: dict,
+        column_dict: dict,
+        mask_dict: dict,
+        start_row: int,
+        end_row: int) -> list[dict]:
+
+    # rebuild record dicts for the given row range
+    name_list = []
+    value_list_list = []
+    for column in header['columns']:
+        name = column['name']
+        value_list = column_dict[name][start_row:end_row].tolist()
+
+        if column['type'] == 'str':
+            value_table = [
+                    json.loads(v[1:]) if v.startswith('\x00') else v
+                    for v in column['values']]
+            value_list = [value_table[c] for c in value_list]
+        elif column['type'] == 'bool':
+            value_list = [bool(v) for v in value_list]
+
+        name_list.append(name)
+        value_list_list.append(value_list)
+
+    rec_list = [dict(zip(name_list, row)) for row in zip(*value_list_list)]
+
+    # drop fields not present in the original records
+    for name in mask_dict:
+        mask = mask_dict[name][start_row:end_row]
+        for rec, present in zip(rec_list, mask):
+            if not present:
+                del rec[name]
+
+    return rec_list
+
+
+def read_store_records(
+        store_file: str,
+        start_ts: int = 0,
+        end_ts: int = 0) -> list[dict]:
+
+    # full records restored from the column data
+    # with optional ts range (inclusive)
+    header, column_dict, mask_dict = read_store(store_file)
+    start_row, end_row = get_row_range(
+            header,
+            column_dict,
+            start_ts,
+            end_ts)
+
+    rec_list = decode_records(
+            header,
+            column_dict,
+            mask_dict,
+            start_row,
+            end_row)
+
+    # range filter for files not in ts order
+    if not header['ts_sorted'] and (start_ts or end_ts):
+        rec_list = [
+                rec for rec in rec_list
+                if not (start_ts and rec['ts'] < start_ts) and
+                not (end_ts and rec['ts'] > end_ts)]
+
+    release_store(column_dict, mask_dict)
+
+    return rec_list
+
+
+def read_store_days(
+        store_file: str) -> dict:
+
+    # records grouped by the day they were written for
+    # as a dict of days, each a dict of records keyed by ts
+    header, column_dict, mask_dict = read_store(store_file)
+
+    day_dict = {}
+    start_row = 0
+    for day, row_count in header['days']:
+        rec_list = decode_records(
+                header,
+                column_dict,
+                mask_dict,
+                start_row,
+                start_row + row_count)
+        day_dict[day] = {rec['ts'] : rec for rec in rec_list}
+        start_row += row_count
+
+    release_store(column_dict, mask_dict)
+
+    return day_dict
+
+
+def release_store(
+        column_dict: dict,
+        mask_dict: dict) -> None:
+
+    # release views so the mapped file can be 
+    # closed and replaced
+    for view in list(column_dict.values()) + list(mask_dict.values()):
+        view.release()
+
+    return
+
+
+def set_decimal_places(
+        decimal_places: int) -> None:
+
+    # fixed decimal places for floats in written JSONL records
+    global float_format
+
+    float_format = '.%df' % (decimal_places)
+
+    return
+
+
+def encode_value(value) -> str:
+
+    # JSON text for a single record value with floats
+    # rounded to the configured decimal places
+    value_type = type(value)
+
+    if value_type is float:
+        if value != value:
+            return 'NaN'
+        if value == infinity:
+            return 'Infinity'
+        if value == -infinity:
+            return '-Infinity'
+        if float_format:
+            return format(value, float_format)
+        return float.__repr__(value)
+
+    if value_type is str:
+        return json.encoder.encode_basestring_ascii(value)
+
+    if value is True:
+        return 'true'
+
+    if value is False:
+        return 'false'
+
+    if value is None:
+        return 'null'
+
+    if value_type is int:
+        return int.__repr__(value)
+
+    # nested values via the standard encoder
+    return json.dumps(value)
+
+
+def encode_record(
+        rec: dict) -> str:
+
+    # single line JSON for a flat record, same layout as
+    # json.dumps() but without disabling the C encoder 
+    # for the whole process to get rounded floats
+    key_list = []
+    for key in rec:
+        key_str = key_str_dict.get(key)
+        if key_str is None:
+            key_str = json.encoder.encode_basestring_ascii(key) + ': '
+            key_str_dict[key] = key_str
+        key_list.append(key_str)
+
+    return '{%s}' % (
+            ', '.join([
+                key_str + encode_value(value)
+                for key_str, value in zip(key_list, rec.values())]))
+
+
+def get_day_file(
+        odir: str,
+        day: str,
+        data_format: str) -> str:
+
+    # data file holding the given day (YYYY-MM-DD)
+    if data_format == 'ecol':
+        return '%s/%s%s' % (odir, day[:7], store_extension)
+
+    return '%s/%s%s' % (odir, day, jsonl_extension)
+
+
+def write_days(
+        odir: str,
+        day_dict: dict,
+        data_format: str) -> list[str]:
+
+    # writes each day of records (dict keyed by ts) to 
+    # a YYYY-MM-DD.jsonl file or merges it into the YYYY-MM.ecol
+    # month file replacing any existing data for that day.
+    # An empty day removes the day.
+    # Returns the list of files written or removed
+    file_list = []
+
+    if data_format != 'ecol':
+        for day in sorted(day_dict.keys()):
+            dest_file = get_day_file(odir, day, data_format)
+            if len(day_dict[day]) == 0:
+                if os.path.exists(dest_file):
+                    os.remove(dest_file)
+                    file_list.append(dest_file)
+                continue
+
+            with open(dest_file, 'w') as f:
+                for key in sorted(day_dict[day].keys()):
+                    f.write(encode_record(day_dict[day][key]) + '\n')
+            file_list.append(dest_file)
+
+        return file_list
+
+    # group days by month file
+    month_dict = {}
+    for day in day_dict:
+        dest_file = get_day_file(odir, day, data_format)
+        if not dest_file in month_dict:
+            month_dict[dest_file] = {}
+        month_dict[dest_file][day] = day_dict[day]
+
+    for dest_file in sorted(month_dict.keys()):
+        store_day_dict = {}
+        if os.path.exists(dest_file):
+            store_day_dict = read_store_days(dest_file)
+        elif all(len(day_recs) == 0 for day_recs in month_dict[dest_file].values()):
+            continue
+
+        store_day_dict.update(month_dict[dest_file])
+        if all(len(day_recs) == 0 for day_recs in store_day_dict.values()):
+            os.remove(dest_file)
+        else:
+            write_store(dest_file, store_day_dict)
+        file_list.append(dest_file)
+
+    return file_list
+
+
+def read_day_records(
+        odir: str,
+        day: str,
+        data_format: str) -> dict:
+
+    # records for a single day keyed by ts
+    # or None if the day is not present
+    dest_file = get_day_file(odir, day, data_format)
+    if not os.path.exists(dest_file):
+        return None
+
+    if data_format == 'ecol':
+        return read_store_days(dest_file).get(day)
+
+    rec_dict = {}
+    with open(dest_file) as f:
+        for line in f:
+            rec = json.loads(line)
+            rec_dict[rec['ts']] = rec
+
+    return rec_dict
+
+
+def get_interval_hours(
+        rec: dict) -> float:
+
+    # length of the interval covered by a record in hours
+    interval = rec.get('interval')
+    if interval is None:
+        return 1
+
+    return interval / 60
+
+
+def is_data_file(
+        filename: str) -> bool:
+
+    return (filename.endswith(jsonl_extension) or 
+            filename.endswith(store_extension))
+
+
+def get_file_ts_range(
+        filename: str) -> tuple[int, int] | None:
+
+    # conservative min/max ts covered by a data file based
+    # on its YYYY-MM-DD.jsonl or YYYY-MM.ecol name.
+    # Returns None for any other naming where the 
+    # file cannot be ruled out
+    if filename.endswith(store_extension):
+        date_str = filename[:-len(store_extension)]
+        date_format = '%Y-%m'
+    elif filename.endswith(jsonl_extension):
+        date_str = filename[:-len(jsonl_extension)]
+        date_format = '%Y-%m-%d'
+    else:
+        return None
+
+    try:
+        start_dt = datetime.datetime.strptime(
+                date_str, 
+                date_format)
+    except ValueError:
+        return None
+
+    if date_format == '%Y-%m':
+        num_days = calendar.monthrange(
+                start_dt.year, 
+                start_dt.month)[1]
+    else:
+        num_days = 1
+
+    start_ts = calendar.timegm(start_dt.timetuple())
+    end_ts = start_ts + num_days * 86400 - 1
+
+    return (
+            start_ts - file_range_slack, 
+            end_ts + file_range_slack)
+
+
+def list_data_files(
+        idir: str,
+        start_ts: int = 0,
+        end_ts: int = 0) -> list[str]:
+
+    # JSONL day files and columnar month files in a directory
+    # Files named for days or months entirely outside the 
+    # optional start/end ts range (inclusive) are skipped 
+    # without being opened
+    file_list = []
+    for filename in os.listdir(idir):
+        if not is_data_file(filename):
+            continue
+
+        if start_ts or end_ts:
+            file_range = get_file_ts_range(filename)
+            if file_range:
+                if (start_ts and 
+                    file_range[1] < start_ts):
+                    continue
+
+                if (end_ts and 
+                    file_range[0] > end_ts):
+                    continue
+
+        file_list.append('%s/%s' % (idir, filename))
+
+    return file_list
+
+
+def iter_file_records(
+        full_path: str,
+        start_ts: int = 0,
+        end_ts: int = 0):
+
+    # records from a JSONL or columnar file within
+    # the optional ts range (inclusive)
+    if full_path.endswith(store_extension):
+        yield from read_store_records(
+                full_path,
+                start_ts,
+                end_ts)
+        return
+
+    with open(full_path) as fp:
+        for line in fp:
+            rec = json.loads(line)
+
+            if (start_ts and 
+                rec['ts'] < start_ts):
+                continue
+
+            if (end_ts and 
+                rec['ts'] > end_ts):
+                continue
+
+            yield rec
+
+    return
+
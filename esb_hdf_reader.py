@@ -3,10 +3,26 @@ import json
 import os
 import time
 import datetime
-import zoneinfo
 import sys
 import csv
 import glob
+import hashlib
+import concurrent.futures
+import heapq
+import itertools
+import time_utils
+import energy_store
+import perf_utils
+
+# manifest of processed input files
+# used by the incremental mode
+manifest_filename = 'esb_hdf_manifest.json'
+
+# optional numpy for the vectorized ingest engine
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 def log_message(
@@ -28,31 +44,30 @@ def parse_esb_time(
         datetime_str: str,
         timezone: str) -> tuple[int, datetime.datetime]:
 
-    # naive parse
+    # fixed format parse
+    # with either / or - date separators
     if '/' in datetime_str:
-        dt = datetime.datetime.strptime(datetime_str, '%d/%m/%Y %H:%M')
+        return time_utils.parse_local_time(
+                datetime_str, 
+                timezone,
+                '%d/%m/%Y %H:%M')
     else:
-        dt = datetime.datetime.strptime(datetime_str, '%d-%m-%Y %H:%M')
-
-    # assert local timezone
-    dt = dt.replace(tzinfo = zoneinfo.ZoneInfo(timezone))
-
-    # convert go epoch as God intended
-    time_stamp = int(dt.timestamp())
-
-    # return both values
-    return time_stamp, dt
+        return time_utils.parse_local_time(
+                datetime_str, 
+                timezone,
+                '%d-%m-%Y %H:%M')
 
 
-def get_hours_in_day(
+def get_intervals_in_day(
         datetime_str: str,
-        timezone: str) -> int:
+        timezone: str,
+        interval: int = 60) -> int:
 
     # naive parse of our datetime field
-    dt = datetime.datetime.strptime(datetime_str, '%Y/%m/%d %H:%M:%S')
+    dt = time_utils.parse_fixed_time(datetime_str, '%Y/%m/%d %H:%M:%S')
 
     # assert local timezone
-    dt = dt.replace(tzinfo = zoneinfo.ZoneInfo(timezone))
+    dt = dt.replace(tzinfo = time_utils.get_zone(timezone))
 
     # reset to current day midnight
     # and get dt for the next day 
@@ -75,18 +90,14 @@ def get_hours_in_day(
     # so we will only see 24 hours reported
     daylen_hours = min(24, daylen_hours)
 
-    return daylen_hours
+    return daylen_hours * 60 // interval
 
 
-def process_esb_hdf_files(
-        hdf_file_list: list[str],
-        timezone: str,
-        odir: str,
-        partial_days: bool,
-        import_scale: float,
-        export_scale: float) -> None:
+def read_esb_hdf_rows(
+        hdf_file: str):
 
-    # ESB HDF Parse
+    # ESB HDF rows as dicts
+    # read lazily with the header row skipped
     fields = [
             'mprn', 
             'serial', 
@@ -95,193 +106,816 @@ def process_esb_hdf_files(
             'datetime'
             ]
 
-    # master hour dict being generated
-    # merged from all files processed
-    hour_dict = {}
-
-    # parse each ESB HDF files into a esb_dict
-    for hdf_file in hdf_file_list:
-        esb_dict = {}
+    with open(hdf_file) as fp:
         reader = csv.DictReader(
-                open(hdf_file),
+                fp,
                 delimiter = ',',
                 quotechar = '"',
                 fieldnames = fields
                 )
-        
+    
         row_num = -1
         for hdf_rec in reader:
             row_num += 1
-        
+    
             # skip header row
             if row_num == 0:
                 continue
-        
-            # parse the ESB local time
-            ts, dt = parse_esb_time(
-                    hdf_rec['datetime'],
-                    timezone
-                    )
-            
-            # Adjust time to common hour from within usage occurred
-            # ESB report time at end of measurement
-            # So we roll :30 -> :00 and :00 back to previous hour
-            if dt.minute == 30:
-                # :30 -> roll back to start of hour
-                dt_ref = dt.replace(
-                    minute = 0,
-                    )
-            else:
-                # :00 -> roll back 1 hour
-                dt_ref = dt - datetime.timedelta(hours = 1)
-        
-            # Get epoch of the common reference hour
-            ts_ref = int(dt_ref.timestamp())
-        
-            # init esb rec or retrieve from dict
-            if not ts_ref in esb_dict:
-                # init usage rec
-                esb_rec = {}
-                esb_dict[ts_ref] = esb_rec
-                esb_rec['ts'] = ts_ref
-                esb_rec['dt_ref'] = dt_ref
-                esb_rec['import'] = 0
-                esb_rec['export'] = 0
-                esb_rec['datetime'] = dt_ref.strftime('%Y/%m/%d %H:%M:%S')
-            else:
-                # retrieve usage rec
-                esb_rec = esb_dict[ts_ref]
-
-            # add on import/export values
-            # this caters or the merging of both 30-min intervals 
-            # and also for any repeat hours (winter DST rollback)
-
-            # Import usage both kW and kWh variants
-            if hdf_rec['type'] == 'Active Import Interval (kW)':
-                esb_rec['import'] += float(hdf_rec['value']) / 2
-
-            if hdf_rec['type'] == 'Active Import Interval (kWh)':
-                esb_rec['import'] += float(hdf_rec['value'])
-        
-            # Export both kW and kWh variants
-            if hdf_rec['type'] == 'Active Export Interval (kW)':
-                esb_rec['export'] += float(hdf_rec['value']) / 2
-
-            if hdf_rec['type'] == 'Active Export Interval (kWh)':
-                esb_rec['export'] += float(hdf_rec['value'])
 
-        log_message(
-                1,
-                'Parsed %d half-hourly records from %s' % (
-                    len(esb_dict),
-                    hdf_file,
-                    )
+            yield hdf_rec
+
+    return
+
+
+def get_esb_ref_time(
+        datetime_str: str,
+        timezone: str,
+        interval: int = 60) -> tuple[int, datetime.datetime]:
+
+    # parse the ESB local time
+    ts, dt = parse_esb_time(
+            datetime_str,
+            timezone
+            )
+    
+    # Sub-hourly intervals
+    # ESB report time at end of 30 min measurement
+    # So we roll back 30 mins in epoch time to the start
+    # of the measurement. This follows the DST changes where
+    # the local time jumps
+    if interval != 60:
+        ts_ref = ts - 1800
+        ts_ref -= ts_ref % (interval * 60)
+        dt_ref = time_utils.epoch_to_local(ts_ref, timezone)
+
+        return ts_ref, dt_ref
+
+    # Adjust time to common hour from within usage occurred
+    # ESB report time at end of measurement
+    # So we roll :30 -> :00 and :00 back to previous hour
+    if dt.minute == 30:
+        # :30 -> roll back to start of hour
+        dt_ref = dt.replace(
+            minute = 0,
+            )
+    else:
+        # :00 -> roll back 1 hour
+        dt_ref = dt - datetime.timedelta(hours = 1)
+    
+    # Get epoch of the common reference hour
+    ts_ref = time_utils.local_to_epoch(dt_ref, timezone)
+
+    return ts_ref, dt_ref
+
+
+def add_esb_hdf_value(
+        esb_dict: dict,
+        ts_ref: int,
+        dt_ref: datetime.datetime,
+        hdf_rec: dict,
+        interval: int = 60) -> None:
+
+    # init esb rec or retrieve from dict
+    if not ts_ref in esb_dict:
+        # init usage rec
+        esb_rec = {}
+        esb_dict[ts_ref] = esb_rec
+        esb_rec['ts'] = ts_ref
+        esb_rec['dt_ref'] = dt_ref
+        esb_rec['import'] = 0
+        esb_rec['export'] = 0
+        esb_rec['datetime'] = dt_ref.strftime('%Y/%m/%d %H:%M:%S')
+
+        # sub-hourly records carry their interval (mins)
+        if interval != 60:
+            esb_rec['interval'] = interval
+    else:
+        # retrieve usage rec
+        esb_rec = esb_dict[ts_ref]
+
+    # add on import/export values
+    # this caters or the merging of both 30-min intervals 
+    # and also for any repeat hours (winter DST rollback)
+
+    # Import usage both kW and kWh variants
+    if hdf_rec['type'] == 'Active Import Interval (kW)':
+        esb_rec['import'] += float(hdf_rec['value']) / 2
+
+    if hdf_rec['type'] == 'Active Import Interval (kWh)':
+        esb_rec['import'] += float(hdf_rec['value'])
+    
+    # Export both kW and kWh variants
+    if hdf_rec['type'] == 'Active Export Interval (kW)':
+        esb_rec['export'] += float(hdf_rec['value']) / 2
+
+    if hdf_rec['type'] == 'Active Export Interval (kWh)':
+        esb_rec['export'] += float(hdf_rec['value'])
+
+    return
+
+
+def parse_esb_hdf_file(
+        hdf_file: str,
+        timezone: str,
+        interval: int = 60) -> dict:
+
+    # ESB HDF Parse
+    esb_dict = {}
+    for hdf_rec in read_esb_hdf_rows(hdf_file):
+        ts_ref, dt_ref = get_esb_ref_time(
+                hdf_rec['datetime'],
+                timezone,
+                interval)
+
+        add_esb_hdf_value(
+                esb_dict,
+                ts_ref,
+                dt_ref,
+                hdf_rec,
+                interval)
+
+    log_message(
+            1,
+            'Parsed %d half-hourly records from %s' % (
+                len(esb_dict),
+                hdf_file,
                 )
+            )
 
-        # merge into master hour_dict
-        for ts_ref in esb_dict:
-            esb_rec = esb_dict[ts_ref]
-            dt_ref = esb_rec['dt_ref']
-
-            if not ts_ref in hour_dict:
-                hour_dict[ts_ref] = {}
-                usage_rec = hour_dict[ts_ref]
-
-                # time fields for the common 
-                # hour
-                usage_rec['import'] = 0
-                usage_rec['export'] = 0
-                usage_rec['ts'] = ts_ref
-                usage_rec['datetime'] = esb_rec['datetime']
-
-                # aggregation keys
-                usage_rec['hour'] = dt_ref.hour
-                usage_rec['day'] = '%04d-%02d-%02d' % (
-                        dt_ref.year, 
-                        dt_ref.month, 
-                        dt_ref.day)
-                usage_rec['month'] = '%04d-%02d' % (
-                        dt_ref.year, 
-                        dt_ref.month) 
-                usage_rec['year'] = '%04d' %(
-                        dt_ref.year)
-                usage_rec['weekday'] = dt_ref.strftime('%u %a')
-                usage_rec['week'] = dt_ref.strftime('%Y-%W')
-
-            else:
-                # pull the existing master record
-                usage_rec = hour_dict[ts_ref]
-
-            # merge data using max value recorded
-            # this will record the largest single value for import and 
-            # export if the exact same hour was covered in multiple files
-            usage_rec['import'] = max(usage_rec['import'], esb_rec['import'])
-            usage_rec['export'] = max(usage_rec['export'], esb_rec['export'])
-
-            # optional scaling
-            usage_rec['import'] *= import_scale
-            usage_rec['export'] *= export_scale
-
-            # align consumed to same import value
-            usage_rec['consumed'] = usage_rec['import']
+    return esb_dict
+
+
+def stream_esb_hdf_file(
+        hdf_file: str,
+        timezone: str,
+        interval: int = 60):
+
+    # Streaming parse of an ESB HDF file yielding
+    # (date, esb_dict) one local day at a time.
+    # HDF files list the most recent data first so days are
+    # yielded in descending order. A day is complete once a row
+    # for an earlier day is read. Out of order rows within a day 
+    # (e.g. DST changes) are fine but a file in ascending order
+    # (detected from its first two days) or a row for a day 
+    # already yielded is fatal as the days cannot be merged
+    # without holding the whole file.
+    day_buffer = {}
+    first_day = None
+    current_day = None
+    yielded_day = None
+    hour_count = 0
+
+    for hdf_rec in read_esb_hdf_rows(hdf_file):
+        ts_ref, dt_ref = get_esb_ref_time(
+                hdf_rec['datetime'],
+                timezone,
+                interval)
+        day = dt_ref.date()
+
+        if day != current_day:
+            if first_day is None:
+                first_day = day
+
+            if ((yielded_day and day >= yielded_day) or
+                (not yielded_day and day > first_day)):
+                log_message(
+                        1,
+                        'Error: %s is not in descending time order (%s).. '
+                        'streaming not possible' % (
+                            hdf_file,
+                            hdf_rec['datetime'])
+                        )
+                sys.exit(-1)
+
+            # yield any buffered days after this day
+            for buffered_day in sorted(day_buffer, reverse = True):
+                if buffered_day > day:
+                    esb_dict = day_buffer.pop(buffered_day)
+                    hour_count += len(esb_dict)
+                    yielded_day = buffered_day
+                    yield buffered_day, esb_dict
+
+            current_day = day
+            if not day in day_buffer:
+                day_buffer[day] = {}
+
+        add_esb_hdf_value(
+                day_buffer[day],
+                ts_ref,
+                dt_ref,
+                hdf_rec,
+                interval)
+
+    # remaining days
+    for buffered_day in sorted(day_buffer, reverse = True):
+        esb_dict = day_buffer.pop(buffered_day)
+        hour_count += len(esb_dict)
+        yield buffered_day, esb_dict
 
     log_message(
             1,
-            'Merged all ESB data into %d hourly records' % (
+            'Parsed %d half-hourly records from %s' % (
+                hour_count,
+                hdf_file,
+                )
+            )
+
+    return
+
+
+def merge_esb_dict(
+        hour_dict: dict,
+        esb_dict: dict,
+        import_scale: float,
+        export_scale: float) -> None:
+
+    # merge into master hour_dict
+    for ts_ref in esb_dict:
+        esb_rec = esb_dict[ts_ref]
+        dt_ref = esb_rec['dt_ref']
+
+        if not ts_ref in hour_dict:
+            hour_dict[ts_ref] = {}
+            usage_rec = hour_dict[ts_ref]
+
+            # time fields for the common 
+            # hour
+            usage_rec['import'] = 0
+            usage_rec['export'] = 0
+            usage_rec['ts'] = ts_ref
+            usage_rec['datetime'] = esb_rec['datetime']
+
+            # aggregation keys
+            # cached per local day
+            day, month, year, weekday, week = time_utils.get_day_keys(
+                    dt_ref.year, 
+                    dt_ref.month, 
+                    dt_ref.day)
+            usage_rec['hour'] = dt_ref.hour
+            usage_rec['day'] = day
+            usage_rec['month'] = month
+            usage_rec['year'] = year
+            usage_rec['weekday'] = weekday
+            usage_rec['week'] = week
+
+            if 'interval' in esb_rec:
+                usage_rec['interval'] = esb_rec['interval']
+
+        else:
+            # pull the existing master record
+            usage_rec = hour_dict[ts_ref]
+
+        # merge data using max value recorded
+        # this will record the largest single value for import and 
+        # export if the exact same hour was covered in multiple files
+        usage_rec['import'] = max(usage_rec['import'], esb_rec['import'])
+        usage_rec['export'] = max(usage_rec['export'], esb_rec['export'])
+
+        # optional scaling
+        usage_rec['import'] *= import_scale
+        usage_rec['export'] *= export_scale
+
+        # align consumed to same import value
+        usage_rec['consumed'] = usage_rec['import']
+
+    return
+
+
+def local_minutes_to_epoch(
+        local_minutes: 'np.ndarray',
+        timezone: str) -> 'np.ndarray':
+
+    # converts naive local minutes (since 1970-01-01 00:00 local) 
+    # into epoch seconds. Offsets are resolved once per unique 
+    # local day and only DST transition days are resolved per value.
+    # Mirrors datetime.replace(tzinfo = ...) semantics (fold=0)
+    zone = time_utils.get_zone(timezone)
+    epoch_dt = datetime.datetime(1970, 1, 1)
+
+    local_days = local_minutes // 1440
+    day_list, day_index = np.unique(
+            local_days, 
+            return_inverse = True)
+
+    day_offset = np.empty(len(day_list), dtype = np.int64)
+    transition_day_list = []
+    for i, day in enumerate(day_list.tolist()):
+        day_dt = epoch_dt + datetime.timedelta(days = day)
+        start_offset = zone.utcoffset(day_dt)
+        end_offset = zone.utcoffset(
+                day_dt.replace(
+                    hour = 23, 
+                    minute = 59))
+        day_offset[i] = int(start_offset.total_seconds())
+        if start_offset != end_offset:
+            transition_day_list.append(i)
+
+    offset = day_offset[day_index]
+
+    # DST transition days
+    # offset resolved for each value
+    for i in transition_day_list:
+        for j in np.flatnonzero(day_index == i).tolist():
+            local_dt = epoch_dt + datetime.timedelta(
+                    minutes = int(local_minutes[j]))
+            offset[j] = int(zone.utcoffset(local_dt).total_seconds())
+
+    return local_minutes * 60 - offset
+
+
+def epoch_to_local_minutes(
+        ts: 'np.ndarray',
+        timezone: str) -> 'np.ndarray':
+
+    # converts epoch seconds into naive local minutes 
+    # (since 1970-01-01 00:00 local). The UTC offset is
+    # resolved once per unique 15 minute block
+    zone = time_utils.get_zone(timezone)
+    block_list, block_index = np.unique(
+            ts // 900,
+            return_inverse = True)
+
+    block_offset = np.empty(len(block_list), dtype = np.int64)
+    for i, block in enumerate(block_list.tolist()):
+        block_dt = datetime.datetime.fromtimestamp(
+                block * 900,
+                tz = zone)
+        block_offset[i] = int(block_dt.utcoffset().total_seconds())
+
+    return (ts + block_offset[block_index.reshape(-1)]) // 60
+
+
+def parse_esb_local_minutes(
+        datetime_list: list[str]) -> 'np.ndarray':
+
+    # bulk parse of DD-MM-YYYY HH:MM (or DD/MM/YYYY HH:MM) 
+    # local times into naive minutes since 1970-01-01 00:00
+    # The strings are viewed as a 2D array of code points
+    # and digits are decoded by column. Strings of any other
+    # length are cut to 16 for the view but are left to the
+    # strptime fallback
+    datetime_arr = np.array(datetime_list)
+    length_arr = np.char.str_len(datetime_arr)
+    datetime_arr = datetime_arr.astype('<U16')
+    codes = datetime_arr.view(np.uint32).reshape(-1, 16).astype(np.int64)
+    digits = codes - ord('0')
+
+    year = digits[:, 6] * 1000 + digits[:, 7] * 100 + digits[:, 8] * 10 + digits[:, 9]
+    month = digits[:, 3] * 10 + digits[:, 4]
+    day = digits[:, 0] * 10 + digits[:, 1]
+    hour = digits[:, 11] * 10 + digits[:, 12]
+    minute = digits[:, 14] * 10 + digits[:, 15]
+
+    # epoch days from year/month/day
+    month_index = np.clip((year - 1970) * 12 + month - 1, 0, None)
+    month_start = month_index.astype('datetime64[M]').astype('datetime64[D]')
+    epoch_days = month_start.astype(np.int64) + day - 1
+
+    # validate fixed layout and field ranges
+    # anything that fails falls back to strptime
+    digit_cols = [0, 1, 3, 4, 6, 7, 8, 9, 11, 12, 14, 15]
+    valid = np.all(
+            (digits[:, digit_cols] >= 0) & (digits[:, digit_cols] <= 9), 
+            axis = 1)
+    valid &= length_arr == 16
+    valid &= np.isin(codes[:, 2], [ord('/'), ord('-')])
+    valid &= codes[:, 5] == codes[:, 2]
+    valid &= codes[:, 10] == ord(' ')
+    valid &= codes[:, 13] == ord(':')
+    valid &= (year >= 1970) & (month >= 1) & (month <= 12) & (day >= 1)
+    valid &= (hour <= 23) & (minute <= 59)
+    valid &= epoch_days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64) == month_index
+
+    local_minutes = epoch_days * 1440 + hour * 60 + minute
+
+    epoch_dt = datetime.datetime(1970, 1, 1)
+    for i in np.flatnonzero(~valid).tolist():
+        datetime_str = datetime_list[i]
+        if '/' in datetime_str:
+            dt = datetime.datetime.strptime(datetime_str, '%d/%m/%Y %H:%M')
+        else:
+            dt = datetime.datetime.strptime(datetime_str, '%d-%m-%Y %H:%M')
+        local_minutes[i] = (dt - epoch_dt) // datetime.timedelta(minutes = 1)
+
+    return local_minutes
+
+
+def parse_esb_hdf_file_columnar(
+        hdf_file: str,
+        timezone: str,
+        interval: int = 60) -> dict:
+
+    # read the raw CSV rows in one go
+    # blank lines are skipped and the first row is the header
+    with open(hdf_file) as fp:
+        reader = csv.reader(
+                fp,
+                delimiter = ',',
+                quotechar = '"',
+                )
+        row_list = [row for row in reader if row]
+    row_list = row_list[1:]
+
+    # column lists
+    value_list = [row[2] for row in row_list]
+    type_arr = np.array([row[3] for row in row_list])
+    datetime_list = [row[4] for row in row_list]
+
+    local_minutes = parse_esb_local_minutes(datetime_list)
+
+    if interval != 60:
+        # Sub-hourly intervals
+        # ESB report time at end of 30 min measurement
+        # So we roll back 30 mins in epoch time 
+        ts_ref = local_minutes_to_epoch(local_minutes, timezone) - 1800
+        ts_ref -= ts_ref % (interval * 60)
+        ref_minutes = epoch_to_local_minutes(ts_ref, timezone)
+    else:
+        # Adjust time to common hour from within usage occurred
+        # ESB report time at end of measurement
+        # So we roll :30 -> :00 and :00 back to previous hour
+        ref_minutes = np.where(
+                local_minutes % 60 == 30,
+                local_minutes - 30,
+                local_minutes - 60)
+        ts_ref = local_minutes_to_epoch(ref_minutes, timezone)
+
+    # unique intervals in order of first appearance
+    ts_list, first_index, hour_index = np.unique(
+            ts_ref,
+            return_index = True,
+            return_inverse = True)
+    order = np.argsort(first_index, kind = 'stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    hour_index = rank[hour_index.reshape(-1)]
+
+    # import/export sums in file row order
+    # kW variants are halved to kWh
+    import_arr = np.zeros(len(ts_list))
+    export_arr = np.zeros(len(ts_list))
+    type_list = [
+            ('Active Import Interval (kW)', import_arr, 2),
+            ('Active Import Interval (kWh)', import_arr, 1),
+            ('Active Export Interval (kW)', export_arr, 2),
+            ('Active Export Interval (kWh)', export_arr, 1),
+            ]
+    for type_name, dest_arr, divisor in type_list:
+        row_index = np.flatnonzero(type_arr == type_name)
+        if len(row_index) == 0:
+            continue
+        values = np.array(
+                [value_list[i] for i in row_index.tolist()]).astype(np.float64)
+        if divisor != 1:
+            values = values / divisor
+        np.add.at(dest_arr, hour_index[row_index], values)
+
+    log_message(
+            1,
+            'Parsed %d half-hourly records from %s' % (
+                len(ts_list),
+                hdf_file,
+                )
+            )
+
+    return {
+            'ts' : ts_list[order],
+            'ref_minutes' : ref_minutes[first_index[order]],
+            'import' : import_arr,
+            'export' : export_arr,
+            }
+
+
+def merge_esb_columns(
+        hour_columns: dict,
+        esb_columns: dict,
+        import_scale: float,
+        export_scale: float) -> dict:
+
+    # first file becomes the master set of columns
+    if not hour_columns:
+        return {
+                'ts' : esb_columns['ts'],
+                'ref_minutes' : esb_columns['ref_minutes'],
+                'import' : np.maximum(0, esb_columns['import']) * import_scale,
+                'export' : np.maximum(0, esb_columns['export']) * export_scale,
+                }
+
+    # locate file hours in the master hours
+    sort_index = np.argsort(hour_columns['ts'])
+    sorted_ts = hour_columns['ts'][sort_index]
+    pos = np.searchsorted(sorted_ts, esb_columns['ts'])
+    pos = np.minimum(pos, len(sorted_ts) - 1)
+    present = sorted_ts[pos] == esb_columns['ts']
+    master_index = sort_index[pos[present]]
+    new = ~present
+
+    # merge data using max value recorded and then scale
+    # existing hours are merged in place and new hours 
+    # appended in file order
+    import_arr = hour_columns['import'].copy()
+    export_arr = hour_columns['export'].copy()
+    import_arr[master_index] = np.maximum(
+            import_arr[master_index], 
+            esb_columns['import'][present]) * import_scale
+    export_arr[master_index] = np.maximum(
+            export_arr[master_index], 
+            esb_columns['export'][present]) * export_scale
+
+    return {
+            'ts' : np.concatenate((
+                hour_columns['ts'], 
+                esb_columns['ts'][new])),
+            'ref_minutes' : np.concatenate((
+                hour_columns['ref_minutes'], 
+                esb_columns['ref_minutes'][new])),
+            'import' : np.concatenate((
+                import_arr, 
+                np.maximum(0, esb_columns['import'][new]) * import_scale)),
+            'export' : np.concatenate((
+                export_arr, 
+                np.maximum(0, esb_columns['export'][new]) * export_scale)),
+            }
+
+
+def gen_hour_dict_columnar(
+        hour_columns: dict,
+        interval: int = 60) -> dict:
+
+    hour_dict = {}
+    if not hour_columns:
+        return hour_dict
+
+    epoch_date = datetime.date(1970, 1, 1)
+
+    # day-level keys are formatted once per local day
+    local_days = hour_columns['ref_minutes'] // 1440
+    day_list, day_index = np.unique(
+            local_days, 
+            return_inverse = True)
+    day_key_list = []
+    for day in day_list.tolist():
+        day_dt = epoch_date + datetime.timedelta(days = day)
+        day_key_list.append(
+                (day_dt.strftime('%Y/%m/%d'),) + 
+                time_utils.get_day_keys(
+                    day_dt.year, 
+                    day_dt.month, 
+                    day_dt.day)
+                )
+
+    minute_of_day = (hour_columns['ref_minutes'] % 1440).tolist()
+    for ts, day_i, day_minute, import_value, export_value in zip(
+            hour_columns['ts'].tolist(),
+            day_index.reshape(-1).tolist(),
+            minute_of_day,
+            hour_columns['import'].tolist(),
+            hour_columns['export'].tolist()):
+        date_str, day, month, year, weekday, week = day_key_list[day_i]
+        hour = day_minute // 60
+
+        usage_rec = {}
+        usage_rec['import'] = import_value
+        usage_rec['export'] = export_value
+        usage_rec['ts'] = ts
+        usage_rec['datetime'] = '%s %02d:%02d:00' % (
+                date_str,
+                hour,
+                day_minute % 60)
+
+        # aggregation keys
+        usage_rec['hour'] = hour
+        usage_rec['day'] = day
+        usage_rec['month'] = month
+        usage_rec['year'] = year
+        usage_rec['weekday'] = weekday
+        usage_rec['week'] = week
+
+        # sub-hourly records carry their interval (mins)
+        if interval != 60:
+            usage_rec['interval'] = interval
+
+        # align consumed to same import value
+        usage_rec['consumed'] = usage_rec['import']
+
+        hour_dict[ts] = usage_rec
+
+    return hour_dict
+
+
+def get_day_range(
+        esb_data: dict) -> list[str]:
+
+    # first and last local day covered by a parsed file
+    # as [YYYY-MM-DD, YYYY-MM-DD] or None for an empty file
+    if not esb_data:
+        return None
+
+    if 'ref_minutes' in esb_data:
+        # columnar engine
+        if len(esb_data['ref_minutes']) == 0:
+            return None
+        epoch_date = datetime.date(1970, 1, 1)
+        first_day = epoch_date + datetime.timedelta(
+                days = int(esb_data['ref_minutes'].min()) // 1440)
+        last_day = epoch_date + datetime.timedelta(
+                days = int(esb_data['ref_minutes'].max()) // 1440)
+    else:
+        # row engine
+        first_day = esb_data[min(esb_data)]['dt_ref']
+        last_day = esb_data[max(esb_data)]['dt_ref']
+
+    return [
+            first_day.strftime('%Y-%m-%d'),
+            last_day.strftime('%Y-%m-%d'),
+            ]
+
+
+def parse_esb_data(
+        hdf_file: str,
+        timezone: str,
+        vectorized: bool,
+        interval: int = 60) -> dict:
+
+    if vectorized:
+        return parse_esb_hdf_file_columnar(
+                hdf_file,
+                timezone,
+                interval)
+
+    return parse_esb_hdf_file(
+            hdf_file,
+            timezone,
+            interval)
+
+
+def iter_esb_data(
+        hdf_file_list: list[str],
+        timezone: str,
+        vectorized: bool,
+        jobs: int,
+        interval: int = 60):
+
+    # parsed data for each file yielded in the given order
+    # With multiple jobs, files are parsed in worker processes
+    # and yielded in order as each completes
+    if jobs <= 1 or len(hdf_file_list) <= 1:
+        for hdf_file in hdf_file_list:
+            yield hdf_file, parse_esb_data(
+                    hdf_file,
+                    timezone,
+                    vectorized,
+                    interval)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers = jobs) as executor:
+        result_iter = executor.map(
+                parse_esb_data,
+                hdf_file_list,
+                itertools.repeat(timezone),
+                itertools.repeat(vectorized),
+                itertools.repeat(interval))
+        for hdf_file, esb_data in zip(hdf_file_list, result_iter):
+            yield hdf_file, esb_data
+
+    return
+
+
+def merge_esb_hdf_files(
+        hdf_file_list: list[str],
+        timezone: str,
+        import_scale: float,
+        export_scale: float,
+        vectorized: bool,
+        parsed_dict: dict = None,
+        jobs: int = 1,
+        interval: int = 60) -> tuple[dict, dict]:
+
+    # parses and merges the given files into the master 
+    # hour dict. Also returns the day range covered by each file.
+    # Files already parsed can be passed in via parsed_dict
+    perf_utils.start_stage('parse')
+    day_range_dict = {}
+    if not parsed_dict:
+        parsed_dict = {}
+
+    parse_list = [f for f in hdf_file_list if not f in parsed_dict]
+    parse_iter = iter_esb_data(
+            parse_list,
+            timezone,
+            vectorized,
+            jobs,
+            interval)
+
+    # master hour dict or columns being generated
+    # merged from all files processed in the given order
+    hour_dict = {}
+    hour_columns = None
+
+    for hdf_file in hdf_file_list:
+        if hdf_file in parsed_dict:
+            esb_data = parsed_dict[hdf_file]
+        else:
+            _, esb_data = next(parse_iter)
+        day_range_dict[hdf_file] = get_day_range(esb_data)
+
+        if vectorized:
+            # columnar merge of each file
+            # with the hour dict generated once at the end
+            hour_columns = merge_esb_columns(
+                    hour_columns,
+                    esb_data,
+                    import_scale,
+                    export_scale)
+        else:
+            merge_esb_dict(
+                    hour_dict,
+                    esb_data,
+                    import_scale,
+                    export_scale)
+
+    if vectorized:
+        hour_dict = gen_hour_dict_columnar(
+                hour_columns,
+                interval)
+
+    log_message(
+            1,
+            'Merged all ESB data into %d interval records' % (
                 len(hour_dict),
                 )
             )
-    
+    perf_utils.end_stage('parse')
+    perf_utils.count('records', len(hour_dict))
+
+    return hour_dict, day_range_dict
+
+
+def write_day_files(
+        hour_dict: dict,
+        timezone: str,
+        odir: str,
+        partial_days: bool,
+        day_set: set = None,
+        data_format: str = 'jsonl',
+        interval: int = 60) -> list[str]:
+
     # split into separate dicts per day
+    # restricted to the given day set if specified
+    perf_utils.start_stage('write')
     day_dict = {}
     for ts in hour_dict:
         usage_rec = hour_dict[ts]
         day = usage_rec['day']
+        if day_set is not None and not day in day_set:
+            continue
+
         if not day in day_dict:
             day_dict[day] = {}
     
         day_dict[day][ts] = usage_rec
     
     # Check for full 24h coverage per day
+    # in records of the given interval
     # purging incomplete days
     purged_day_dict = {}
     for day in list(day_dict.keys()):
         # get datetime of first item in dict
         # actual one we pick does not matter
         # we need to then determine how long that day
-        # is in hours
+        # is in intervals
         first_ts = next(iter(day_dict[day]))
         first_datetime = day_dict[day][first_ts]['datetime']
-        expected_day_hours = get_hours_in_day(
+        expected_day_intervals = get_intervals_in_day(
                 first_datetime,
-                timezone)
+                timezone,
+                interval)
     
-        # then check how many hours we actually have tracked
-        tracked_hours = len(day_dict[day])
+        # then check how many intervals we actually have tracked
+        tracked_intervals = len(day_dict[day])
     
-        # purge if the tracked hours do not match the expected
+        # purge if the tracked intervals do not match the expected
         # total. The partial_days option over-rides this
         if (not partial_days and 
-            tracked_hours != expected_day_hours):
+            tracked_intervals != expected_day_intervals):
             del day_dict[day]
 
             # track the purge context as tracked/expected string
             # in dict
-            purge_context = '%d/%d' % (tracked_hours, expected_day_hours)
+            purge_context = '%d/%d' % (tracked_intervals, expected_day_intervals)
             purged_day_dict[day] = purge_context
     
-    # dump to files
-    for day in day_dict:
-        # JSONL File
-        dest_jsonl_file = '%s/%s.jsonl' % (odir, day)
+    # dump to JSONL day files or columnar month files
+    for dest_file in energy_store.write_days(
+            odir,
+            day_dict,
+            data_format):
         log_message(
                 1,
                 'Writing %s' % (
-                    dest_jsonl_file)
+                    dest_file)
                 )
-        with open(dest_jsonl_file, 'w') as f:
-            for key in sorted(day_dict[day].keys()):
-                f.write(json.dumps(day_dict[day][key]) + '\n')
 
     if len(purged_day_dict) > 0:
         log_message(
@@ -291,6 +925,411 @@ def process_esb_hdf_files(
                     purged_day_dict
                     )
                 )
+    perf_utils.end_stage('write')
+
+    return list(day_dict.keys())
+
+
+def get_file_fingerprint(
+        hdf_file: str,
+        prev_entry: dict = None) -> dict:
+
+    # size, mtime and content hash of an input file
+    # the hash is only recalculated when the size or mtime
+    # differ from the previous manifest entry
+    stat = os.stat(hdf_file)
+    entry = {}
+    entry['size'] = stat.st_size
+    entry['mtime_ns'] = stat.st_mtime_ns
+
+    if (prev_entry and 
+        prev_entry['size'] == entry['size'] and
+        prev_entry['mtime_ns'] == entry['mtime_ns']):
+        entry['sha256'] = prev_entry['sha256']
+    else:
+        sha = hashlib.sha256()
+        with open(hdf_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        entry['sha256'] = sha.hexdigest()
+
+    # day range carried over for unchanged content
+    # and set after parsing otherwise
+    if (prev_entry and 
+        prev_entry['sha256'] == entry['sha256']):
+        entry['day_range'] = prev_entry['day_range']
+    else:
+        entry['day_range'] = None
+
+    return entry
+
+
+def load_manifest(
+        manifest_file: str) -> dict:
+
+    manifest = {}
+    if os.path.exists(manifest_file):
+        try:
+            with open(manifest_file) as f:
+                manifest = json.load(f)
+        except Exception as ex:
+            log_message(
+                    1,
+                    'Ignoring unreadable manifest %s (%s)' % (
+                        manifest_file,
+                        ex)
+                    )
+            manifest = {}
+
+    return manifest
+
+
+def save_manifest(
+        manifest_file: str,
+        manifest: dict) -> None:
+
+    # written to a temp file and renamed into place
+    # so an interrupted run leaves the old manifest intact
+    tmp_file = manifest_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        f.write(json.dumps(manifest, indent = 4))
+    os.replace(tmp_file, manifest_file)
+
+    return
+
+
+def ranges_overlap(
+        day_range: list[str],
+        range_list: list[list[str]]) -> bool:
+
+    if not day_range:
+        return False
+
+    for start_day, end_day in range_list:
+        if (day_range[0] <= end_day and 
+            day_range[1] >= start_day):
+            return True
+
+    return False
+
+
+def get_range_days(
+        range_list: list[list[str]]) -> set:
+
+    # expand day ranges into a set of YYYY-MM-DD days
+    day_set = set()
+    for start_day, end_day in range_list:
+        day_dt = datetime.date.fromisoformat(start_day)
+        end_dt = datetime.date.fromisoformat(end_day)
+        while day_dt <= end_dt:
+            day_set.add(day_dt.strftime('%Y-%m-%d'))
+            day_dt += datetime.timedelta(days = 1)
+
+    return day_set
+
+
+def process_esb_hdf_files(
+        hdf_file_list: list[str],
+        timezone: str,
+        odir: str,
+        partial_days: bool,
+        import_scale: float,
+        export_scale: float,
+        vectorized: bool = False,
+        incremental: bool = False,
+        jobs: int = 1,
+        data_format: str = 'jsonl',
+        interval: int = 60) -> None:
+
+    if not incremental:
+        hour_dict, day_range_dict = merge_esb_hdf_files(
+                hdf_file_list,
+                timezone,
+                import_scale,
+                export_scale,
+                vectorized,
+                jobs = jobs,
+                interval = interval)
+
+        write_day_files(
+                hour_dict,
+                timezone,
+                odir,
+                partial_days,
+                data_format = data_format,
+                interval = interval)
+
+        return
+
+    # Incremental mode
+    # The manifest tracks the fingerprint and day range of 
+    # each input file from the last run. Options that alter 
+    # the generated values force a full rebuild if changed.
+    manifest_file = '%s/%s' % (odir, manifest_filename)
+    manifest = load_manifest(manifest_file)
+
+    options = {}
+    options['timezone'] = timezone
+    options['import_scale'] = str(import_scale)
+    options['export_scale'] = str(export_scale)
+    options['partial_days'] = partial_days
+    options['format'] = data_format
+
+    # only recorded for sub-hourly intervals so that 
+    # existing hourly manifests still match
+    if interval != 60:
+        options['interval'] = interval
+
+    if manifest.get('options') == options:
+        prev_file_dict = manifest.get('files', {})
+    else:
+        if manifest:
+            log_message(
+                    1,
+                    'Options changed since last run.. full rebuild'
+                    )
+        prev_file_dict = {}
+
+    # fingerprint all inputs
+    file_dict = {}
+    changed_list = []
+    for hdf_file in hdf_file_list:
+        key = os.path.abspath(hdf_file)
+        prev_entry = prev_file_dict.get(key)
+        entry = get_file_fingerprint(
+                hdf_file,
+                prev_entry)
+        file_dict[key] = entry
+
+        if (not prev_entry or 
+            entry['sha256'] != prev_entry['sha256']):
+            changed_list.append(hdf_file)
+
+    removed_list = [key for key in prev_file_dict if not key in file_dict]
+
+    log_message(
+            1,
+            'Incremental check.. files:%d changed:%d removed:%d' % (
+                len(hdf_file_list),
+                len(changed_list),
+                len(removed_list)
+                )
+            )
+
+    manifest = {}
+    manifest['options'] = options
+    manifest['files'] = file_dict
+
+    if not prev_file_dict:
+        # full rebuild
+        hour_dict, day_range_dict = merge_esb_hdf_files(
+                hdf_file_list,
+                timezone,
+                import_scale,
+                export_scale,
+                vectorized,
+                jobs = jobs,
+                interval = interval)
+
+        write_day_files(
+                hour_dict,
+                timezone,
+                odir,
+                partial_days,
+                data_format = data_format,
+                interval = interval)
+
+    elif len(changed_list) == 0 and len(removed_list) == 0:
+        log_message(
+                1,
+                'No changes to ESB data.. nothing to do'
+                )
+        day_range_dict = {}
+
+    else:
+        # parse the changed files to learn the days they now cover
+        perf_utils.start_stage('parse')
+        parsed_dict = {}
+        for hdf_file, esb_data in iter_esb_data(
+                changed_list,
+                timezone,
+                vectorized,
+                jobs,
+                interval):
+            parsed_dict[hdf_file] = esb_data
+        perf_utils.end_stage('parse')
+
+        # affected days are those covered by the new and old
+        # content of changed files and by removed files
+        range_list = []
+        for hdf_file in changed_list:
+            day_range = get_day_range(parsed_dict[hdf_file])
+            if day_range:
+                range_list.append(day_range)
+            prev_entry = prev_file_dict.get(os.path.abspath(hdf_file))
+            if prev_entry and prev_entry['day_range']:
+                range_list.append(prev_entry['day_range'])
+
+        for key in removed_list:
+            if prev_file_dict[key]['day_range']:
+                range_list.append(prev_file_dict[key]['day_range'])
+
+        # unchanged files that overlap the affected days are 
+        # re-merged with the changed files, preserving the given
+        # file order for the merge
+        merge_list = []
+        for hdf_file in hdf_file_list:
+            if (hdf_file in parsed_dict or
+                ranges_overlap(
+                    file_dict[os.path.abspath(hdf_file)]['day_range'], 
+                    range_list)):
+                merge_list.append(hdf_file)
+
+        log_message(
+                1,
+                'Re-merging %d/%d files for %d affected day ranges' % (
+                    len(merge_list),
+                    len(hdf_file_list),
+                    len(range_list)
+                    )
+                )
+
+        hour_dict, day_range_dict = merge_esb_hdf_files(
+                merge_list,
+                timezone,
+                import_scale,
+                export_scale,
+                vectorized,
+                parsed_dict,
+                jobs,
+                interval)
+
+        day_set = get_range_days(range_list)
+        written_list = write_day_files(
+                hour_dict,
+                timezone,
+                odir,
+                partial_days,
+                day_set,
+                data_format,
+                interval)
+
+        # remove affected days that are no longer generated
+        stale_day_dict = {}
+        for day in day_set - set(written_list):
+            stale_day_dict[day] = {}
+
+        for dest_file in energy_store.write_days(
+                odir,
+                stale_day_dict,
+                data_format):
+            log_message(
+                    1,
+                    'Removing %s' % (
+                        dest_file)
+                    )
+
+    # record day ranges of parsed files
+    for hdf_file in day_range_dict:
+        file_dict[os.path.abspath(hdf_file)]['day_range'] = day_range_dict[hdf_file]
+
+    save_manifest(
+            manifest_file,
+            manifest)
+
+    return
+
+
+def process_esb_hdf_files_streaming(
+        hdf_file_list: list[str],
+        timezone: str,
+        odir: str,
+        partial_days: bool,
+        import_scale: float,
+        export_scale: float,
+        data_format: str = 'jsonl',
+        interval: int = 60) -> None:
+
+    # k-way merge of the per-file day streams
+    # each stream item is tagged with its file index so the 
+    # per-day merge is applied in the given file order
+    stream_list = []
+    for file_index, hdf_file in enumerate(hdf_file_list):
+        stream_list.append(
+                zip(
+                    itertools.repeat(file_index),
+                    stream_esb_hdf_file(
+                        hdf_file,
+                        timezone,
+                        interval)
+                    )
+                )
+
+    merged_stream = heapq.merge(
+            *stream_list,
+            key = lambda item: item[1][0],
+            reverse = True)
+
+    # merge and write each day as soon as all files 
+    # have moved past it. Columnar month files are 
+    # written once per month instead
+    hour_count = 0
+    day_count = 0
+    hour_dict = {}
+    write_key = None
+    for day, day_group in itertools.groupby(
+            merged_stream, 
+            key = lambda item: item[1][0]):
+        if data_format == 'ecol':
+            day_write_key = (day.year, day.month)
+        else:
+            day_write_key = day
+
+        if hour_dict and day_write_key != write_key:
+            hour_count += len(hour_dict)
+            day_count += len(
+                    write_day_files(
+                        hour_dict,
+                        timezone,
+                        odir,
+                        partial_days,
+                        data_format = data_format,
+                        interval = interval)
+                    )
+            hour_dict = {}
+        write_key = day_write_key
+
+        for file_index, (day, esb_dict) in sorted(
+                day_group,
+                key = lambda item: item[0]):
+            merge_esb_dict(
+                    hour_dict,
+                    esb_dict,
+                    import_scale,
+                    export_scale)
+
+    if hour_dict:
+        hour_count += len(hour_dict)
+        day_count += len(
+                write_day_files(
+                    hour_dict,
+                    timezone,
+                    odir,
+                    partial_days,
+                    data_format = data_format,
+                    interval = interval)
+                )
+
+    log_message(
+            1,
+            'Merged all ESB data into %d interval records, %d days written' % (
+                hour_count,
+                day_count
+                )
+            )
+    perf_utils.count('records', hour_count)
+
+    return
 
 
 # main()
@@ -340,12 +1379,57 @@ parser.add_argument(
         action = 'store_true'
         )
 
+parser.add_argument(
+        '--vectorized', 
+        help = 'Use the vectorized (NumPy) ingest engine', 
+        action = 'store_true'
+        )
+
+parser.add_argument(
+        '--incremental', 
+        help = 'Only re-process new or changed files (manifest kept in odir)', 
+        action = 'store_true'
+        )
+
+parser.add_argument(
+        '--streaming', 
+        help = 'Stream and merge files by day with bounded memory', 
+        action = 'store_true'
+        )
+
+parser.add_argument(
+        '--jobs', 
+        help = 'Number of files parsed in parallel (def 1, 0 for all CPUs)', 
+        type = int,
+        default = 1,
+        required = False
+        )
+
+parser.add_argument(
+        '--interval', 
+        help = 'Record interval in minutes (def 60)', 
+        type = int,
+        choices = [60, 30],
+        default = 60,
+        required = False
+        )
+
+parser.add_argument(
+        '--format', 
+        help = 'Output data format (def jsonl)', 
+        choices = energy_store.data_format_list,
+        default = 'jsonl',
+        required = False
+        )
+
 parser.add_argument(
         '--verbose', 
         help = 'Enable verbose output', 
         action = 'store_true'
         )
 
+perf_utils.add_arguments(parser)
+
 args = vars(parser.parse_args())
 hdf_file_list = args['file']
 odir = args['odir']
@@ -353,14 +1437,27 @@ timezone = args['timezone']
 partial_days = args['partial_days']
 import_scale = args['import_scale']
 export_scale = args['export_scale']
+vectorized = args['vectorized']
+incremental = args['incremental']
+streaming = args['streaming']
+jobs = args['jobs']
+data_format = args['format']
+interval = args['interval']
 verbose = args['verbose']
 
-# JSON encoder force decimal places to 4
-class RoundingFloat(float):
-    __repr__ = staticmethod(lambda x: format(x, '.4f'))
+if vectorized and not np:
+    log_message(1, 'Error: --vectorized requires the numpy module')
+    sys.exit(-1)
+
+if streaming and (vectorized or incremental or jobs != 1):
+    log_message(1, 'Error: --streaming cannot be combined with --vectorized, --incremental or --jobs')
+    sys.exit(-1)
+
+if jobs <= 0:
+    jobs = os.cpu_count()
 
-json.encoder.c_make_encoder = None
-json.encoder.float = RoundingFloat
+# JSONL writer decimal places forced to 4
+energy_store.set_decimal_places(4)
 
 # directory expansion into file list
 # needed for Windows only as underlying shell
@@ -369,10 +1466,32 @@ if (len(hdf_file_list) == 1 and
     os.path.isdir(hdf_file_list[0])):
     hdf_file_list = glob.glob(hdf_file_list[0] + '/*.csv')
 
-process_esb_hdf_files(
-        hdf_file_list,
-        timezone,
-        odir,
-        partial_days,
-        import_scale,
-        export_scale)
+# worker processes for --jobs re-import this script
+# on platforms that spawn rather than fork (Windows, macOS)
+# so the processing is only started from the main process
+if __name__ == '__main__':
+    perf_utils.start(args)
+
+    if streaming:
+        process_esb_hdf_files_streaming(
+                hdf_file_list,
+                timezone,
+                odir,
+                partial_days,
+                import_scale,
+                export_scale,
+                data_format,
+                interval)
+    else:
+        process_esb_hdf_files(
+                hdf_file_list,
+                timezone,
+                odir,
+                partial_days,
+                import_scale,
+                export_scale,
+                vectorized,
+                incremental,
+                jobs,
+                data_format,
+                interval)
@@ -1,11 +1,13 @@
 import argparse
 import requests
-import json
 import os
 import time
 import datetime
 import dateutil.parser
 import zoneinfo
+import sys
+import energy_store
+import perf_utils
 
 
 def log_message(
@@ -23,15 +25,46 @@ def log_message(
     return
 
 
-def load_jsonl_file(filename):
-    data_dict = {}
+# ESB days of the last columnar month file read
+esb_store_dict = {}
 
-    with open(filename) as fp:
-        for line in fp:
-            rec = json.loads(line)
-            data_dict[rec['ts']] = rec
 
-    return data_dict
+def get_esb_day(
+        esb_dir: str,
+        day: str) -> dict:
+
+    # ESB records for the day from its JSONL day file
+    # or columnar month file, None if not present
+    esb_dict = energy_store.read_day_records(esb_dir, day, 'jsonl')
+    if esb_dict is not None:
+        return esb_dict
+
+    store_file = energy_store.get_day_file(esb_dir, day, 'ecol')
+    if esb_store_dict.get('file') != store_file:
+        esb_store_dict['file'] = store_file
+        esb_store_dict['days'] = {}
+        if os.path.exists(store_file):
+            esb_store_dict['days'] = energy_store.read_store_days(store_file)
+
+    return esb_store_dict['days'].get(day)
+
+
+def write_merge_days(
+        odir: str,
+        merge_day_dict: dict,
+        context_dict: dict,
+        data_format: str) -> None:
+
+    # JSONL day file or columnar month file
+    perf_utils.start_stage('write')
+    for merge_filename in energy_store.write_days(
+            odir,
+            merge_day_dict,
+            data_format):
+        log_message(1, 'Wrote %s (%s)' % (merge_filename, context_dict[merge_filename]))
+    perf_utils.end_stage('write')
+
+    return
 
 
 # main()
@@ -58,24 +91,33 @@ parser.add_argument(
         required = True
         )
 
+parser.add_argument(
+        '--format', 
+        help = 'Output data format (def jsonl)', 
+        choices = energy_store.data_format_list,
+        default = 'jsonl',
+        required = False
+        )
+
 parser.add_argument(
         '--verbose', 
         help = 'Enable verbose output', 
         action = 'store_true'
         )
 
+perf_utils.add_arguments(parser)
+
 args = vars(parser.parse_args())
 inverter_dir = args['inverter_dir']
 esb_dir = args['esb_dir']
 odir = args['odir']
+data_format = args['format']
 gv_verbose = args['verbose']
 
-# JSON encoder force decimal places to 5
-class RoundingFloat(float):
-    __repr__ = staticmethod(lambda x: format(x, '.5f'))
+perf_utils.start(args)
 
-json.encoder.c_make_encoder = None
-json.encoder.float = RoundingFloat
+# JSONL writer decimal places forced to 5
+energy_store.set_decimal_places(5)
 
 if not os.path.exists(odir):
     os.mkdir(odir)
@@ -86,42 +128,72 @@ if len(set([inverter_dir, esb_dir, odir])) != 3:
     sys.exit(-1)
 
 
-# read each file in inverter dir
-for filename in sorted(os.listdir(inverter_dir)):
-    # only loading .jsonl files
-    if not filename.endswith('.jsonl'):
-        continue
-
-    # test for ESB equivaent
-    inverter_filename = os.path.join(inverter_dir, filename)
-    esb_filename = os.path.join(esb_dir, filename)
-    merge_filename = os.path.join(odir, filename)
-
-    # load inverter data
-    inverter_dict = load_jsonl_file(inverter_filename)
-
-    # load and merge ESB data is present
-    context = 'No ESB data'
-    if os.path.exists(esb_filename):
-        esb_dict = load_jsonl_file(esb_filename)
-        context = 'Merged with ESB data'
-
-        # merge data
-        for ts in inverter_dict:
-            if ts in esb_dict:
-                inverter_rec = inverter_dict[ts]
-                esb_rec = esb_dict[ts]
-
-                # direct overwrite of the import/export values
-                inverter_rec['import'] = esb_rec['import']
-                inverter_rec['export'] = esb_rec['export']
-
-                # solar_consumed and consumed recalcs
-                if 'solar' in inverter_rec:
-                    inverter_rec['solar_consumed'] = inverter_rec['solar'] - inverter_rec['export']
-                    inverter_rec['consumed'] = inverter_rec['import'] + inverter_rec['solar_consumed']
-
-    log_message(1, 'Writing %s (%s)' % (merge_filename, context))
-    with open(merge_filename, 'w') as f:
-        for key in sorted(inverter_dict.keys()):
-            f.write(json.dumps(inverter_dict[key]) + '\n')
+# merge each day of inverter data in order from 
+# JSONL day files or columnar month files. Output files
+# are written once all their days are merged
+merge_day_dict = {}
+context_dict = {}
+merge_filename = None
+for inverter_file in sorted(energy_store.list_data_files(inverter_dir)):
+    perf_utils.start_stage('load')
+    if inverter_file.endswith(energy_store.store_extension):
+        inverter_day_dict = energy_store.read_store_days(inverter_file)
+    else:
+        day = os.path.basename(inverter_file)[:-len(energy_store.jsonl_extension)]
+        inverter_day_dict = {day : {}}
+        for rec in energy_store.iter_file_records(inverter_file):
+            inverter_day_dict[day][rec['ts']] = rec
+    perf_utils.end_stage('load')
+
+    for day in sorted(inverter_day_dict.keys()):
+        inverter_dict = inverter_day_dict[day]
+
+        # write the days of the previous output file
+        day_filename = energy_store.get_day_file(odir, day, data_format)
+        if merge_day_dict and day_filename != merge_filename:
+            write_merge_days(
+                    odir,
+                    merge_day_dict,
+                    context_dict,
+                    data_format)
+            merge_day_dict = {}
+            context_dict = {}
+        merge_filename = day_filename
+
+        # load and merge ESB data is present
+        perf_utils.start_stage('merge')
+        context = 'No ESB data'
+        esb_dict = get_esb_day(esb_dir, day)
+        if esb_dict is not None:
+            context = 'Merged with ESB data'
+
+            # merge data
+            for ts in inverter_dict:
+                if ts in esb_dict:
+                    inverter_rec = inverter_dict[ts]
+                    esb_rec = esb_dict[ts]
+
+                    # direct overwrite of the import/export values
+                    inverter_rec['import'] = esb_rec['import']
+                    inverter_rec['export'] = esb_rec['export']
+
+                    # solar_consumed and consumed recalcs
+                    if 'solar' in inverter_rec:
+                        inverter_rec['solar_consumed'] = inverter_rec['solar'] - inverter_rec['export']
+                        inverter_rec['consumed'] = inverter_rec['import'] + inverter_rec['solar_consumed']
+
+        # month files note any days without ESB data
+        if merge_filename in context_dict and context_dict[merge_filename] != context:
+            context = 'Partly merged with ESB data'
+        context_dict[merge_filename] = context
+
+        merge_day_dict[day] = inverter_dict
+        perf_utils.count('records', len(inverter_dict))
+        perf_utils.end_stage('merge')
+
+if merge_day_dict:
+    write_merge_days(
+            odir,
+            merge_day_dict,
+            context_dict,
+            data_format)
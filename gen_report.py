@@ -1,13 +1,27 @@
 import argparse
+import csv
 import json
 import os
 import time
-import datetime
+import hashlib
+import pickle
+import shutil
 import dateutil.parser
-import zoneinfo
 import sys
+import concurrent.futures
+import time_utils
+import tariff_utils
+import energy_store
+import perf_utils
 import xlsxwriter
 
+# optional pyarrow for the parquet output format
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
 field_dict = {
         'datetime' : {
             'title' : 'Date',
@@ -305,6 +319,41 @@ field_dict = {
             },
         }
 
+# version of the aggregate cache file layout
+cache_version = 2
+
+# costed variants (tariff plans and prices) kept in the
+# aggregate cache per input directory. The least recently
+# used are removed beyond this
+cache_variant_limit = 8
+
+# first field of each report sheet
+# all but the hour report are aggregated on that field
+report_field_dict = {
+        'hour' : 'datetime',
+        'day' : 'day',
+        'weekday' : 'weekday',
+        'week' : 'week',
+        'month' : 'month',
+        'year' : 'year',
+        '24h' : 'hour',
+        'tariff' : 'tariff_name',
+        }
+
+# CSV number formats for each field format
+# a few more places than the Excel display 
+# formats so that sums re-add closely
+csv_format_dict = {
+        'integer' : '.0f',
+        'float' : '.6f',
+        'kwh' : '.4f',
+        'kwh_3dp' : '.5f',
+        'vac' : '.2f',
+        'percent' : '.4f',
+        'currency_4dp' : '.6f',
+        'currency_2dp' : '.4f',
+        }
+
 def log_message(
         verbose,
         message):
@@ -320,30 +369,36 @@ def log_message(
     return
 
 
-def parse_range_time(
-        datetime_str: str,
-        timezone: str,
-        end: bool = False) -> tuple[int, datetime.datetime]:
+def get_header_fields(
+        field_dict: dict,
+        data_dict: dict,
+        first_field: str) -> tuple:
 
-    # naive parse
-    dt = datetime.datetime.strptime(datetime_str, '%Y%m%d')
+    # key list taken from from dict original 
+    # construction order and first field is then 
+    # located to front
+    header_fields = list(field_dict.keys())
+    header_fields.remove(first_field)
+    header_fields.insert(0, first_field)
 
-    # end of day
-    if end:
-        dt = dt.replace(
-                hour = 23,
-                minute = 59,
-                second = 59
-                )
+    # build set of fields present in data dict
+    data_field_set = set()
+    for key in data_dict:
+        for field in data_dict[key]:
+            data_field_set.add(field)
 
-    # assert local timezone
-    dt = dt.replace(tzinfo = zoneinfo.ZoneInfo(timezone))
+    # remove headers not represented
+    # needs to use a 2nd set for this
+    header_purge_set = set()
+    for field in header_fields:
+        if not field in data_field_set:
+            header_purge_set.add(field)
 
-    # convert go epoch as God intended
-    time_stamp = int(dt.timestamp())
+    # purge from header list
+    for field in header_purge_set:
+        header_fields.remove(field)
 
-    # return both values
-    return time_stamp, dt
+    return header_fields, data_field_set
 
 
 def add_worksheet(
@@ -356,6 +411,7 @@ def add_worksheet(
         chart_list: list = None) -> None:
 
     global verbose
+    global low_memory
 
     # nothing to do if no data sent
     if len(data_dict) == 0:
@@ -371,29 +427,10 @@ def add_worksheet(
     worksheet = workbook.add_worksheet(sheet_title)
 
     # Headers
-    # key list taken from from dict original 
-    # construction order and first field is then 
-    # located to front
-    header_fields = list(field_dict.keys())
-    header_fields.remove(first_field)
-    header_fields.insert(0, first_field)
-
-    # build set of fields present in data dict
-    data_field_set = set()
-    for key in data_dict:
-        for field in data_dict[key]:
-            data_field_set.add(field)
-
-    # remove headers not represented
-    # needs to use a 2nd set for this
-    header_purge_set = set()
-    for field in header_fields:
-        if not field in data_field_set:
-            header_purge_set.add(field)
-
-    # purge from header list
-    for field in header_purge_set:
-        header_fields.remove(field)
+    header_fields, data_field_set = get_header_fields(
+            field_dict,
+            data_dict,
+            first_field)
 
     # print in-use headers and assign columns
     col = -1
@@ -489,6 +526,7 @@ def add_worksheet(
             filter_key_list = list(filter_field_set)
             filter_key_list.sort()
             filter_key_list = filter_key_list[-max_filter_periods:]
+            filter_key_set = set(filter_key_list)
 
             # populate the filter list with the 
             # selected list of values
@@ -499,60 +537,76 @@ def add_worksheet(
                     filter_col,
                     filter_key_list)
     
+    # compile the per-column writer plan once
+    # (field, column, writer, cell format, default value)
+    # string fields default to an empty string
+    number_format_set = {
+            'integer', 
+            'float', 
+            'currency_4dp', 
+            'currency_2dp', 
+            'percent', 
+            'vac',
+            'kwh',
+            'kwh_3dp',
+            }
+    writer_plan = []
+    for field in header_fields:
+        field_rec = field_dict[field]
+        if field_rec['format'] == 'str':
+            writer_plan.append(
+                    (
+                        field,
+                        field_rec['col'],
+                        worksheet.write_string,
+                        format_dict[field_rec['format']],
+                        ''
+                        )
+                    )
+
+        elif field_rec['format'] in number_format_set:
+            # missing values written as 0
+            writer_plan.append(
+                    (
+                        field,
+                        field_rec['col'],
+                        worksheet.write_number,
+                        format_dict[field_rec['format']],
+                        0
+                        )
+                    )
+
+        # unknown field formats are skipped
+
     # Populate Rows in sorted order
+    # in low memory mode, the written cells are not retained 
+    # so the chart category values are tracked separately
+    category_list = []
     row = 0
     for key in key_list:
         rec = data_dict[key]
         row += 1
 
-        for field in header_fields:
-            field_rec = field_dict[field]
-            # write string
-            if field_rec['format'] == 'str':
-                # use present value or empty string
-                if field in rec:
-                    value = rec[field]
-                else:
-                    value = ''
-
-                worksheet.write_string(
-                        row,
-                        field_rec['col'],
-                        value,
-                        format_dict[field_rec['format']])
-    
-            # write number
-            elif field_rec['format'] in [
-                    'integer', 
-                    'float', 
-                    'currency_4dp', 
-                    'currency_2dp', 
-                    'percent', 
-                    'vac',
-                    'kwh',
-                    'kwh_3dp']:
-                if field in rec:
-                    value = rec[field]
-                else:
-                    value = 0
-
-                worksheet.write_number(
-                        row,
-                        field_rec['col'],
-                        value,
-                        format_dict[field_rec['format']])
-            else:
-                # unknown field format
-                # skipped
-                pass
+        if low_memory:
+            category_list.append(rec[first_field])
 
         # auto-hide row for filtered scenario
         # applies only if the given row's filter field value
         # is not in the filter value list
+        # Set ahead of the row cells so that rows are written 
+        # strictly in order for the low memory mode
         if (filtered_field and 
-            not rec[filtered_field] in filter_key_list):
+            not rec[filtered_field] in filter_key_set):
             worksheet.set_row(row, options={"hidden": True})
 
+        # write cells via the compiled plan
+        for field, col, writer, cell_format, default in writer_plan:
+            writer(
+                    row,
+                    col,
+                    rec.get(field, default),
+                    cell_format)
+
     # Charts
     if not chart_list:
         return
@@ -599,6 +653,12 @@ def add_worksheet(
                     'categories': [sheet_title, 1, 0, row, 0],
                     'values': [sheet_title, 1, field_rec['col'], row, field_rec['col']],
                     }
+
+            # category cache for low memory mode
+            # otherwise taken from the written cells 
+            if low_memory:
+                series_dict['categories_data'] = category_list
+
             # optional series colour
             if 'colour' in series_rec:
                 series_dict['line'] = {'color': series_rec['colour']}
@@ -627,16 +687,22 @@ def add_worksheet(
     return
 
 
-def gen_aggregate_dict(
+def gen_aggregate_dicts(
         data_dict: dict,
-        agg_field: str) -> dict:
+        agg_field_list: list) -> dict:
 
-    agg_dict = {}
+    # Aggregates the hourly records on each of the given
+    # fields in a single pass of the data
+    # returns a dict of aggregate dicts keyed on agg field
+    agg_dict_dict = {}
 
     # skipped fields
     # These fields should not be aggregated
     # The main aggregation field is also added in here
-    field_skip_list = [
+    # hours is counted separately
+    common_skip_list = [
+            'hours',
+            'interval',
             'datetime', 
             'ts', 
             'weekday',
@@ -660,7 +726,6 @@ def gen_aggregate_dict(
             'grid_voltage_2_max',
             'grid_voltage_3_max',
             ]
-    field_skip_list.append(agg_field)
 
     # time hierarchy list
     # if aggregating on day, we preserve the week, month and year
@@ -669,75 +734,95 @@ def gen_aggregate_dict(
     # if the aggregation field is not in this list, all 
     # these fields are removed
     time_hierarchy_list = ['day', 'week', 'month', 'year']
-    if agg_field not in time_hierarchy_list:
-        # skip all these fields
-        field_skip_list += time_hierarchy_list
-    else:
-        # find location in list and skip all fields 
-        # up to that location
-        agg_field_index = time_hierarchy_list.index(agg_field)
-        field_skip_list += time_hierarchy_list[:agg_field_index]
-
-    for ts in data_dict:
-        rec = data_dict[ts]
-
-        # skip records that do not have 
-        # the aggregate field
-        if not agg_field in rec:
-            continue
-
-        agg_value = rec[agg_field]
 
-        # initialise aggregate record
-        # and assign aggregate field with its value
-        if not agg_value in agg_dict:
-            agg_dict[agg_value] = {}
-            agg_dict[agg_value][agg_field] = agg_value
-            agg_dict[agg_value]['hours'] = 0
-
-        # count record
-        agg_dict[agg_value]['hours'] += 1
-
-        # perform aggregation
-        for field in rec:
-            # skip fields
-            if field in field_skip_list:
+    # per aggregation skip set
+    skip_set_dict = {}
+    for agg_field in agg_field_list:
+        field_skip_list = common_skip_list + [agg_field]
+        if agg_field not in time_hierarchy_list:
+            # skip all these fields
+            field_skip_list += time_hierarchy_list
+        else:
+            # find location in list and skip all fields 
+            # up to that location
+            agg_field_index = time_hierarchy_list.index(agg_field)
+            field_skip_list += time_hierarchy_list[:agg_field_index]
+
+        skip_set_dict[agg_field] = set(field_skip_list)
+        agg_dict_dict[agg_field] = {}
+
+    for rec in data_dict.values():
+        # string and numeric fields of the record
+        # string values overwrite and numeric values add
+        item_list = []
+        for field, value in rec.items():
+            value_type = type(value)
+            if value_type is str:
+                item_list.append((field, value, True))
+            elif (value_type is int or 
+                  value_type is float):
+                item_list.append((field, value, False))
+
+        for agg_field in agg_field_list:
+            # skip records that do not have 
+            # the aggregate field
+            if not agg_field in rec:
                 continue
 
-            # string aggregation
-            # we simply overwrite the value
-            if type(rec[field]) == str:
-                agg_dict[agg_value][field] = rec[field]
+            agg_dict = agg_dict_dict[agg_field]
+            field_skip_set = skip_set_dict[agg_field]
+            agg_value = rec[agg_field]
+
+            # initialise aggregate record
+            # and assign aggregate field with its value
+            agg_rec = agg_dict.get(agg_value)
+            if agg_rec is None:
+                agg_rec = {}
+                agg_rec[agg_field] = agg_value
+                agg_rec['hours'] = 0
+                agg_dict[agg_value] = agg_rec
+
+            # count hours covered by the record
+            # day aggregates being rolled up carry 
+            # their own hour count
+            if 'hours' in rec:
+                agg_rec['hours'] += rec['hours']
+            else:
+                agg_rec['hours'] += energy_store.get_interval_hours(rec)
+
+            # perform aggregation
+            for field, value, is_str in item_list:
+                # skip fields
+                if field in field_skip_set:
+                    continue
 
-            # numeric aggregations
-            if type(rec[field]) in [int, float]:
                 # set to value on first encounter or 
                 # add to existing aggregate total
-                if not field in agg_dict[agg_value]:
-                    agg_dict[agg_value][field] = rec[field]
+                if (is_str or 
+                    not field in agg_rec):
+                    agg_rec[field] = value
                 else:
-                    agg_dict[agg_value][field] += rec[field]
+                    agg_rec[field] += value
 
     # derived fields
-    for agg_value in agg_dict:
-        agg_rec = agg_dict[agg_value]
-
-        # savings %
-        if ('savings' in agg_rec and 
-            'bill_amount' in agg_rec):
-            original_bill_value = agg_rec['bill_amount'] + agg_rec['savings']
-            savings_percent = (agg_rec['savings'] / original_bill_value)
-            agg_rec['savings_percent'] = savings_percent
-
-        # solar consumed/export %
-        if 'solar_consumed' in agg_rec:
-            agg_rec['solar_consumed_percent'] = 0
-            agg_rec['export_percent'] = 0
-            if agg_rec['solar'] > 0:
-                agg_rec['solar_consumed_percent'] = agg_rec['solar_consumed'] / agg_rec['solar']
-                agg_rec['export_percent'] = agg_rec['export'] / agg_rec['solar']
-
-    return agg_dict
+    for agg_dict in agg_dict_dict.values():
+        for agg_rec in agg_dict.values():
+            # savings %
+            if ('savings' in agg_rec and 
+                'bill_amount' in agg_rec):
+                original_bill_value = agg_rec['bill_amount'] + agg_rec['savings']
+                savings_percent = (agg_rec['savings'] / original_bill_value)
+                agg_rec['savings_percent'] = savings_percent
+
+            # solar consumed/export %
+            if 'solar_consumed' in agg_rec:
+                agg_rec['solar_consumed_percent'] = 0
+                agg_rec['export_percent'] = 0
+                if agg_rec['solar'] > 0:
+                    agg_rec['solar_consumed_percent'] = agg_rec['solar_consumed'] / agg_rec['solar']
+                    agg_rec['export_percent'] = agg_rec['export'] / agg_rec['solar']
+
+    return agg_dict_dict
 
 
 def load_tariffs(
@@ -754,99 +839,184 @@ def load_tariffs(
                 tariff_file)
             )
 
-    with open(tariff_file) as fp:
-        tariff_plan_full_list = json.load(fp)
-        tariff_plan_list = []
-
-        # remove disabled plans
-        for tariff_plan in tariff_plan_full_list:
-            if ('enabled' in tariff_plan and 
-                not tariff_plan['enabled']):
-                pass
-            else:
-                tariff_plan_list.append(tariff_plan)
-
-        for tariff_plan in tariff_plan_list:
-            # scale standing charge to hourly rate
-            tariff_plan['standing_rate'] = tariff_plan['annual_standing_charge'] / 365 / 24
-
-            # tariff reg dimensions.. 
-            # tariff_reg[day][hour] -> {"name", "rate"}
-            tariff_plan['tariff_reg'] = {}
-
-            for tariff_rec in tariff_plan['tariffs']:
-                # initialise optional days list
-                if not 'days' in tariff_rec:
-                    tariff_rec['days'] = [1,2,3,4,5,6,7]
-
-                for day in tariff_rec['days']:
-                    if not day in tariff_plan['tariff_reg']:
-                        tariff_plan['tariff_reg'][day] = {}
-
-                start_hh = tariff_rec['start'] 
-                end_hh = tariff_rec['end'] 
-
-                if start_hh == end_hh:
-                    # full 24 hour range
-                    for day in tariff_rec['days']:
-                        for hh in range(0, 24):
-                            tariff_plan['tariff_reg'][day][hh] = {
-                                    'name' : tariff_rec['name'],
-                                    'rate' : tariff_rec['rate'],
-                                    }
-                else:
-                    hh = start_hh
-                    while hh != end_hh:
-                        for day in tariff_rec['days']:
-                            tariff_plan['tariff_reg'][day][hh] = {
-                                    'name' : tariff_rec['name'],
-                                    'rate' : tariff_rec['rate'],
-                                    }
-                        hh = (hh + 1) % 24 # 0-23 modulo
-
-            # validate parsed plan
-
-            # 7-day coverage 
-            week_day_set = set(range(1, 8))
-            coverage_set = set(tariff_plan['tariff_reg'].keys())
-            if coverage_set != week_day_set:
-                raise Exception(
-                        'Tariff plan %s does not have full 7-day coverage.. missing days: %s' % (
-                            tariff_plan['name'],
-                            str(week_day_set - coverage_set)
-                            )
-                        )
-            for day in tariff_plan['tariff_reg']:
-                # 24-hour coverage
-                day_hour_set = set(range(0, 24))
-                coverage_set = set(tariff_plan['tariff_reg'][day].keys())
-                if coverage_set != day_hour_set:
-                    raise Exception(
-                            'Tariff plan %s does not have full 24-hour coverage for day %d .. missing hours: %s' % (
-                                tariff_plan['name'],
-                                day,
-                                str(day_hour_set - coverage_set)
-                                )
-                            )
+    tariffs = tariff_utils.load_tariff_file(tariff_file)
 
     log_message(
             verbose,
             'Loaded tariffs.. \n%s' % (
-                json.dumps(tariff_plan_list, indent=4)
+                json.dumps(tariffs, indent=4)
                 )
             )
 
-    return tariff_plan_list
+    return tariffs
 
 
-def load_data(
-        idir: str,
+def get_plan_index(
+        tariffs: dict,
+        day: str) -> int:
+
+    # index of the tariff plan covering the given day
+    # YYYY-MM-DD
+    plan_index = tariff_utils.get_plan_index(
+            tariffs,
+            day)
+
+    if plan_index is None:
+        raise Exception(
+                'No tariff plan covers day %s' % (
+                    day)
+                )
+
+    return plan_index
+
+
+def load_prices(
+        semopx_dir: str,
+        margin: float = 0,
+        vat_rate: float = 0) -> dict:
+
+    # dynamic import prices from a SEMOpx data directory
+    # (see tariff_utils.load_prices)
+    if not semopx_dir:
+        return None
+
+    prices = tariff_utils.load_prices(
+            semopx_dir,
+            margin,
+            vat_rate)
+
+    log_message(
+            1,
+            'Loaded %d SEMOpx prices from %s' % (
+                len(prices['ts_list']),
+                semopx_dir
+                )
+            )
+
+    return prices
+
+
+def get_price_hash(
+        prices: dict) -> str:
+
+    # fingerprint of the loaded dynamic prices
+    if not prices:
+        return ''
+
+    return hashlib.sha1(
+            json.dumps(
+                prices).encode('utf-8')).hexdigest()
+
+
+def log_missing_prices(
+        num_missing: int,
+        num_recs: int) -> None:
+
+    if num_missing:
+        log_message(
+                1,
+                'WARNING: No SEMOpx price for %d/%d records.. using tariff plan rates' % (
+                    num_missing,
+                    num_recs)
+                )
+
+    return
+
+
+def apply_tariffs(
+        data_dict: dict,
+        tariffs: dict,
+        prices: dict = None) -> None:
+
+    # per-record costing of the loaded hours
+    plan_list = tariffs['plan_list']
+    name_list = tariffs['name_list']
+    plan_index_dict = {}
+
+    # dynamic import rates replace the plan tariff rates
+    # joined on ts in a single pass, None where no
+    # price is available
+    rec_list = list(data_dict.values())
+    dynamic_rate_list = [None] * len(rec_list)
+    if prices:
+        dynamic_rate_list = tariff_utils.get_dynamic_rates(
+                prices,
+                [rec['ts'] for rec in rec_list],
+                [int(energy_store.get_interval_hours(rec) * 3600) for rec in rec_list])
+        log_missing_prices(
+                dynamic_rate_list.count(None),
+                len(rec_list))
+
+    for rec, dynamic_rate in zip(rec_list, dynamic_rate_list):
+        # cost calculation based on week day number and hour
+        # weekday is formatted as '<num> <local name>'
+        # so we plit on whitespace and get int() of first field
+        slot = tariff_utils.get_slot(
+                int(rec['weekday'].split(' ')[0]),
+                rec['hour'])
+
+        # select the appropriate tariff plan
+        # based on the date range
+        if not rec['day'] in plan_index_dict:
+            plan_index_dict[rec['day']] = get_plan_index(
+                    tariffs,
+                    rec['day'])
+        tariff_plan = plan_list[plan_index_dict[rec['day']]]
+
+        rec['plan'] = tariff_plan['name']
+        rec['tariff_name'] = name_list[tariff_plan['name_index_list'][slot]]
+        rec['tariff_rate'] = tariff_plan['rate_list'][slot]
+        if dynamic_rate is not None:
+            rec['tariff_rate'] = dynamic_rate
+        rec['import_cost'] = rec['import'] * rec['tariff_rate']
+        rec['bill_amount'] = rec['import_cost']
+
+        # standing rate is per hour and the cost is for
+        # the interval covered by the record
+        # standing_cost will live on in aggregations
+        # rate only appears in hour record
+        rec['standing_rate'] = tariff_plan['standing_rate']
+        rec['standing_cost'] = rec['standing_rate'] * energy_store.get_interval_hours(rec)
+        rec['bill_amount'] += rec['standing_cost']
+
+        # FIT (export_credit)
+        # calculates the credit and export and 
+        # adjusts relative cost to match
+        rec['export_rate'] = tariff_plan['fit_rate']
+        rec['export_credit'] = rec['export'] * rec['export_rate']
+        rec['bill_amount'] -= rec['export_credit'] 
+        rec['savings'] = rec['export_credit'] 
+
+        # Solar Self-consumption
+        # Solar credit is calculated based on the applicable tariff
+        # for ther given hour (import costs we avoided).
+        # Relative import is further offset by this self-consumption.
+        # Savings is then calculated as the sum of solar and export
+        # credit
+        if 'solar_consumed' in rec:
+            rec['solar_consumed_percent'] = 0
+            rec['export_percent'] = 0
+            if rec['solar'] > 0:
+                rec['solar_consumed_percent'] = rec['solar_consumed'] / rec['solar']
+                rec['export_percent'] = rec['export'] / rec['solar']
+
+            rec['solar_credit'] = rec['solar_consumed'] * rec['tariff_rate']
+
+            # reset savings for solar credit
+            rec['savings'] = rec['solar_credit'] + rec['export_credit'] 
+
+        # savings %
+        original_bill_value = rec['bill_amount'] + rec['savings']
+        savings_percent = (rec['savings'] / original_bill_value)
+        rec['savings_percent'] = savings_percent
+
+    return
+
+
+def get_range_ts(
         start_date: str,
         end_date: str,
-        time_zone: str,
-        tariff_plan_list: list) -> dict:
-
-    global verbose
+        timezone: str) -> tuple:
 
     # start/end range
     start_ts = 0
@@ -854,112 +1024,90 @@ def load_data(
     start_dt = None
     end_dt = None
     if start_date:
-        start_ts, start_dt = parse_range_time(
+        start_ts, start_dt = time_utils.parse_range_time(
                 start_date,
                 timezone,
                 end = False)
     
     if end_date:
-        end_ts, end_dt = parse_range_time(
+        end_ts, end_dt = time_utils.parse_range_time(
                 end_date,
                 timezone,
                 end = True)
 
+    return start_ts, end_ts
+
+
+def iter_hour_records(
+        full_path: str,
+        start_ts: int = 0,
+        end_ts: int = 0):
+
+    # records from a JSONL day file or columnar month file
+    # restricted to the optional start/end range
+    for rec in energy_store.iter_file_records(
+            full_path,
+            start_ts,
+            end_ts):
+
+        # naive datetime conversion
+        # into datetime object
+        datetime_dt = time_utils.parse_fixed_time(
+                rec['datetime'], 
+                '%Y/%m/%d %H:%M:%S')
+        # reformat back to YYYY-MM-DD HH
+        # to reduce to the hour it represents
+        # or YYYY-MM-DD HH:MM for sub-hourly intervals
+        if 'interval' in rec:
+            rec['datetime'] = '%04d-%02d-%02d %02d:%02d' % (
+                    datetime_dt.year,
+                    datetime_dt.month,
+                    datetime_dt.day,
+                    datetime_dt.hour,
+                    datetime_dt.minute)
+        else:
+            rec['datetime'] = '%04d-%02d-%02d %02d' % (
+                    datetime_dt.year,
+                    datetime_dt.month,
+                    datetime_dt.day,
+                    datetime_dt.hour)
+
+        yield rec
+
+    return
+
+
+def load_records(
+        idir: str,
+        start_date: str,
+        end_date: str,
+        time_zone: str) -> dict:
+
+    global verbose
+
+    start_ts, end_ts = get_range_ts(start_date, end_date, time_zone)
+
     # load all data
     data_dict = {}
     file_count = 0
-    for filename in os.listdir(idir):
-        # only loading .jsonl files
-        if not filename.endswith('.jsonl'):
-            continue
-    
+    for full_path in energy_store.list_data_files(
+            idir,
+            start_ts,
+            end_ts):
+        # JSONL day files and columnar month files
+        # files outside the start/end range are 
+        # already skipped by name
         file_count += 1
-        full_path = '%s/%s' % (idir, filename)
-        with open(full_path) as fp:
-            for line in fp:
-                rec = json.loads(line)
-    
-                # skip records if out of range
-                # FIXME probably could also include skipping of 
-                # full files based on name
-                if (start_ts and 
-                    rec['ts'] < start_ts):
-                    continue
-    
-                if (end_ts and 
-                    rec['ts'] > end_ts):
-                    continue
-    
-                # naive datetime conversion
-                # into datetime object
-                datetime_dt = datetime.datetime.strptime(
-                        rec['datetime'], 
-                        '%Y/%m/%d %H:%M:%S')
-                # reformat back to YYYY-MM-DD HH
-                # to reduce to the hour it represents
-                rec['datetime'] = datetime_dt.strftime('%Y-%m-%d %H')
-    
-                # store keyed on datetime object
-                data_dict[rec['datetime']] = rec
-    
-                # cost calculation based on week day number and hour
-                # weekday is formatted as '<num> <local name>'
-                # so we plit on whitespace and get int() of first field
-                dt_weekday = int(rec['weekday'].split(' ')[0])
-                dt_hour = rec['hour']
-
-                # select the appropriate tariff plan
-                # based on the date range
-                # YYYY-MM-DD comparison
-                for tariff_plan in tariff_plan_list:
-                    if (rec['day'] >= tariff_plan['start'] and 
-                        rec['day'] <= tariff_plan['end']):
-                        break
-
-                rec['plan'] = tariff_plan['name']
-                rec['tariff_name'] = tariff_plan['tariff_reg'][dt_weekday][dt_hour]['name']
-                rec['tariff_rate'] = tariff_plan['tariff_reg'][dt_weekday][dt_hour]['rate']
-                rec['import_cost'] = rec['import'] * rec['tariff_rate']
-                rec['bill_amount'] = rec['import_cost']
-
-                # both fields same value here
-                # but standing_cost will live on in aggregations
-                # rate only appears in hour record
-                rec['standing_rate'] = tariff_plan['standing_rate']
-                rec['standing_cost'] = rec['standing_rate']
-                rec['bill_amount'] += rec['standing_cost']
-
-                # FIT (export_credit)
-                # calculates the credit and export and 
-                # adjusts relative cost to match
-                rec['export_rate'] = tariff_plan['fit_rate']
-                rec['export_credit'] = rec['export'] * rec['export_rate']
-                rec['bill_amount'] -= rec['export_credit'] 
-                rec['savings'] = rec['export_credit'] 
-
-                # Solar Self-consumption
-                # Solar credit is calculated based on the applicable tariff
-                # for ther given hour (import costs we avoided).
-                # Relative import is further offset by this self-consumption.
-                # Savings is then calculated as the sum of solar and export
-                # credit
-                if 'solar_consumed' in rec:
-                    rec['solar_consumed_percent'] = 0
-                    rec['export_percent'] = 0
-                    if rec['solar'] > 0:
-                        rec['solar_consumed_percent'] = rec['solar_consumed'] / rec['solar']
-                        rec['export_percent'] = rec['export'] / rec['solar']
-
-                    rec['solar_credit'] = rec['solar_consumed'] * rec['tariff_rate']
-
-                    # reset savings for solar credit
-                    rec['savings'] = rec['solar_credit'] + rec['export_credit'] 
-
-                # savings %
-                original_bill_value = rec['bill_amount'] + rec['savings']
-                savings_percent = (rec['savings'] / original_bill_value)
-                rec['savings_percent'] = savings_percent
-    
+
+        # records are already restricted to the 
+        # start/end range
+        for rec in iter_hour_records(
+                full_path,
+                start_ts,
+                end_ts):
+            # store keyed on datetime object
+            data_dict[rec['datetime']] = rec
+
     log_message(
             1,
             'Loaded %d files, %d records' % (
@@ -971,970 +1119,1788 @@ def load_data(
     return data_dict
 
 
-# main()
-report_choices = [
-            'year',
-            'month',
-            'week',
-            'day', 
-            'hour', 
-            'tariff',
-            'weekday',
-            '24h',
-            ]
+def load_data(
+        idir: str,
+        start_date: str,
+        end_date: str,
+        time_zone: str,
+        tariffs: dict,
+        prices: dict = None) -> dict:
+
+    # loads and costs the hourly records
+    perf_utils.start_stage('load')
+    data_dict = load_records(
+            idir,
+            start_date,
+            end_date,
+            time_zone)
+    perf_utils.end_stage('load')
+
+    perf_utils.start_stage('cost')
+    apply_tariffs(
+            data_dict,
+            tariffs,
+            prices)
+    perf_utils.end_stage('cost')
 
-parser = argparse.ArgumentParser(
-        description = 'Energy Data Report Generator'
-        )
+    return data_dict
 
-parser.add_argument(
-        '--file', 
-        help = 'Output XLSX file', 
-        required = True
-        )
 
-parser.add_argument(
-        '--tariffs', 
-        help = 'Tariffs JSON file', 
-        required = True
-        )
+def gen_report_dicts(
+        data_dict: dict,
+        report_list: list,
+        day_dict: dict = None) -> dict:
+
+    # data dict for each of the selected reports
+    # the hour report is the hourly records and the others
+    # are aggregated in a single pass
+    # Given the day aggregates (from the cache), the week, month
+    # and year reports are instead rolled up from those days
+    agg_field_list = []
+    rollup_field_list = []
+    for report in report_list:
+        agg_field = report_field_dict[report]
+        if (report == 'hour' or 
+            agg_field in agg_field_list or 
+            agg_field in rollup_field_list):
+            continue
 
-parser.add_argument(
-        '--idir', 
-        help = 'Input Directory for data files', 
-        required = True
-        )
+        if day_dict is None:
+            agg_field_list.append(agg_field)
+        elif agg_field in ['week', 'month', 'year']:
+            rollup_field_list.append(agg_field)
+        elif agg_field != 'day':
+            agg_field_list.append(agg_field)
+
+    agg_dict_dict = gen_aggregate_dicts(data_dict, agg_field_list)
+    if day_dict is not None:
+        agg_dict_dict.update(
+                gen_aggregate_dicts(day_dict, rollup_field_list))
+        agg_dict_dict['day'] = day_dict
+
+    report_dict_dict = {}
+    for report in report_list:
+        if report == 'hour':
+            report_dict_dict[report] = data_dict
+        else:
+            report_dict_dict[report] = agg_dict_dict[report_field_dict[report]]
 
-parser.add_argument(
-        '--start', 
-        help = 'Calculation Start Date (YYYYMMDD)', 
-        required = False
-        )
+    return report_dict_dict
 
-parser.add_argument(
-        '--end', 
-        help = 'Calculation End Date (YYYYMMDD)', 
-        required = False
-        )
 
-parser.add_argument(
-        '--timezone', 
-        help = 'Timezone', 
-        default = 'Europe/Dublin',
-        required = False
-        )
+def format_csv_value(
+        value,
+        field_format: str) -> str:
 
-parser.add_argument(
-        '--currency', 
-        help = 'Currency Symbol (def:€)', 
-        default = '€',
-        required = False
-        )
+    # compact CSV text for a field value
+    # numbers use the field format precision with 
+    # trailing zeros removed
+    if value is None:
+        return ''
 
-parser.add_argument(
-        '--verbose', 
-        help = 'Enable verbose output', 
-        action = 'store_true'
-        )
+    if field_format == 'str':
+        return str(value)
 
-parser.add_argument(
-        '--reports', 
-        help = 'Reports to generate', 
-        required = False,
-        nargs = '*',
-        choices = report_choices,
-        default = report_choices
-        )
+    value_str = format(value, csv_format_dict[field_format])
+    if '.' in value_str:
+        value_str = value_str.rstrip('0').rstrip('.')
+    if value_str == '-0':
+        value_str = '0'
 
-parser.add_argument(
-        '--hide_columns', 
-        help = 'columns to hide',
-        nargs = '*',
-        required = False,
-        choices = list(field_dict.keys()),
-        default = []
-        )
+    return value_str
 
-args = vars(parser.parse_args())
-report_file_name = args['file']
-tariff_file = args['tariffs']
-idir = args['idir']
-start_date = args['start']
-end_date = args['end']
-timezone = args['timezone']
-currency_symbol = args['currency']
-report_list = args['reports']
-hide_column_list = args['hide_columns']
-verbose = args['verbose']
 
-# hidden columns
-# populate hidden boolean into field dict
-for column_key in hide_column_list:
-    if column_key in field_dict:
-        field_dict[column_key]['hidden'] = True
+def write_columnar_report(
+        report_file_name: str,
+        data_dict: dict,
+        report_list: list,
+        day_dict: dict = None) -> None:
+
+    # CSV or parquet output with a file per selected report
+    # named after the report file, e.g. report_hour.csv
+    # no charts or cell formatting, just the columns 
+    # in field dict order
+    file_prefix = os.path.splitext(report_file_name)[0]
+
+    perf_utils.start_stage('aggregate')
+    report_dict_dict = gen_report_dicts(
+            data_dict, 
+            report_list,
+            day_dict)
+    perf_utils.end_stage('aggregate')
+
+    perf_utils.start_stage('write')
+    for report in report_list:
+        report_dict = report_dict_dict[report]
+
+        # nothing to do if no data
+        if len(report_dict) == 0:
+            continue
 
-log_message(
-        1,
-        'Generating report %s' % (
-            report_file_name
-            )
-        )
+        file_name = '%s_%s.%s' % (
+                file_prefix,
+                report,
+                output_format)
 
-tariff_plan_list = load_tariffs(tariff_file)
+        log_message(
+                1,
+                'Writing %s (%d rows)' % (
+                    file_name,
+                    len(report_dict)
+                    )
+                )
 
-data_dict = load_data(
-        idir,
-        start_date,
-        end_date,
-        timezone,
-        tariff_plan_list)
+        header_fields, data_field_set = get_header_fields(
+                field_dict,
+                report_dict,
+                report_field_dict[report])
+
+        # data incremental sort on key
+        key_list = list(report_dict.keys())
+        key_list.sort()
+
+        if output_format == 'csv':
+            with open(file_name, 'w', newline = '') as fp:
+                writer = csv.writer(fp)
+                writer.writerow(header_fields)
+
+                # field formats resolved once per column
+                format_list = [
+                        field_dict[field]['format'] 
+                        for field in header_fields]
+                for key in key_list:
+                    rec = report_dict[key]
+                    writer.writerow(
+                            [
+                                format_csv_value(
+                                    rec.get(field),
+                                    field_format)
+                                for field, field_format in zip(
+                                    header_fields,
+                                    format_list)
+                                ]
+                            )
 
-# XLSX
-workbook = xlsxwriter.Workbook(report_file_name)
+        elif output_format == 'parquet':
+            # typed columns, strings as text, integer format 
+            # fields as int64 and all other numbers as float64
+            # missing values are null
+            column_dict = {}
+            schema_list = []
+            for field in header_fields:
+                field_format = field_dict[field]['format']
+                value_list = [
+                        report_dict[key].get(field) 
+                        for key in key_list]
+
+                if field_format == 'str':
+                    column_type = pyarrow.string()
+                    value_list = [
+                            None if value is None else str(value)
+                            for value in value_list]
+                elif field_format == 'integer':
+                    column_type = pyarrow.int64()
+                    value_list = [
+                            None if value is None else int(value)
+                            for value in value_list]
+                else:
+                    column_type = pyarrow.float64()
 
-# try to reconstruct the command line 
-# options to capture in the properties
-comment_str = 'Invoke options:\n'
-for arg in sys.argv:
-    if arg.startswith('--'):
-        comment_str += '\n'
-    comment_str += ' ' + arg
+                column_dict[field] = pyarrow.array(
+                        value_list, 
+                        type = column_type)
+                schema_list.append((field, column_type))
 
-workbook.set_properties(
-    {
-        'title': 'Energy Usage Report',
-        'subject': 'Python-generated Excel report based on energy usage data',
-        'keywords': 'python energy solar report',
-        'author': 'https://github.com/dresdner353/energyutils',
-        'comments': comment_str
-    }
-)
-
-format_dict = {}
-
-header_format = workbook.add_format()
-header_format.set_text_wrap()
-header_format.set_align('top')
-header_format.set_align('center')
-header_format.set_bg_color('#C1C1C1')
-format_dict['header'] = header_format
-
-str_format = workbook.add_format() 
-str_format.set_num_format('General') # text
-str_format.set_align('right')
-format_dict['str'] = str_format
-
-float_format = workbook.add_format() 
-# with commas and 4 decimal places
-float_format.set_num_format('#,##0.0000') 
-format_dict['float'] = float_format
-
-int_format = workbook.add_format() 
-# no decimal places
-int_format.set_num_format('0') 
-format_dict['integer'] = int_format
-
-kwh_format = workbook.add_format() 
-# with commas and 2 decimal places
-kwh_format.set_num_format('#,##0.00 "kWh"') 
-format_dict['kwh'] = kwh_format
-
-# 3dp variant of kwh 
-# only needed for smaller offset-type fields
-kwh_3dp_format = workbook.add_format() 
-# with commas and 3 decimal places
-kwh_3dp_format.set_num_format('#,##0.000 "kWh"') 
-format_dict['kwh_3dp'] = kwh_3dp_format
-
-vac_format = workbook.add_format() 
-# with commas and 2 decimal place
-vac_format.set_num_format('#,##0.00 "V"') 
-format_dict['vac'] = vac_format
-
-percent_format = workbook.add_format() 
-percent_format.set_num_format('0.0%') 
-format_dict['percent'] = percent_format
-
-currency_4dp_format = workbook.add_format() 
-# with currency symbol, commas and 4 decimal places
-currency_4dp_format.set_num_format(
-        '%s#,##0.0000;[BLUE]-%s#,##0.0000' % (
-            currency_symbol,
-            currency_symbol
-            )
-        ) 
-format_dict['currency_4dp'] = currency_4dp_format
-
-currency_2dp_format = workbook.add_format() 
-# with currency symbol, commas and 2 decimal places
-currency_2dp_format.set_num_format(
-        '%s#,##0.00;[BLUE]-%s#,##0.00' % (
-            currency_symbol,
-            currency_symbol
+            table = pyarrow.table(
+                    column_dict,
+                    schema = pyarrow.schema(schema_list))
+            pyarrow.parquet.write_table(
+                    table,
+                    file_name)
+
+    perf_utils.end_stage('write')
+
+    return
+
+
+def get_tariff_hash(
+        tariffs: dict) -> str:
+
+    # fingerprint of the loaded tariff plans
+    return hashlib.sha1(
+            json.dumps(
+                tariffs, 
+                sort_keys = True).encode('utf-8')).hexdigest()
+
+
+def get_cache_group(
+        filename: str) -> str:
+
+    # cache entry file holding a data file.. the YYYY-MM month
+    # of a day or month file or 'other' for any other naming
+    if energy_store.get_file_ts_range(filename) is None:
+        return 'other'
+
+    return filename[:7]
+
+
+def load_cache_entry(
+        entry_file: str) -> dict:
+
+    # cached costed records and day aggregates keyed by
+    # source filename. Empty if missing or unreadable
+    file_entry_dict = {}
+    if os.path.exists(entry_file):
+        try:
+            with open(entry_file, 'rb') as fp:
+                cache_dict = pickle.load(fp)
+            if cache_dict.get('version') == cache_version:
+                file_entry_dict = cache_dict['files']
+        except Exception as ex:
+            log_message(
+                    1,
+                    'Ignoring unreadable cache file %s (%s)' % (
+                        entry_file,
+                        ex)
+                    )
+
+    return file_entry_dict
+
+
+def save_cache_entry(
+        entry_file: str,
+        file_entry_dict: dict) -> None:
+
+    # written to a temp file first so that 
+    # parallel batch workers and interrupted
+    # runs never leave a partial cache file
+    os.makedirs(os.path.dirname(entry_file), exist_ok = True)
+    tmp_entry_file = '%s.%d.tmp' % (
+            entry_file,
+            os.getpid())
+    with open(tmp_entry_file, 'wb') as fp:
+        pickle.dump(
+                {
+                    'version' : cache_version,
+                    'files' : file_entry_dict,
+                    },
+                fp, 
+                protocol = pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_entry_file, entry_file)
+
+    return
+
+
+def evict_cache_variants(
+        idir_cache_dir: str,
+        variant_cache_dir: str) -> None:
+
+    # marks the variant as used and removes the least 
+    # recently used variants of the input directory
+    # beyond the limit (e.g. left by tariff plan edits)
+    os.makedirs(variant_cache_dir, exist_ok = True)
+    os.utime(variant_cache_dir)
+
+    variant_list = []
+    for name in os.listdir(idir_cache_dir):
+        full_path = os.path.join(idir_cache_dir, name)
+        try:
+            if os.path.isdir(full_path):
+                variant_list.append((os.stat(full_path).st_mtime_ns, full_path))
+        except FileNotFoundError:
+            # removed by a parallel batch worker
+            pass
+
+    variant_list.sort(reverse = True)
+    for mtime_ns, full_path in variant_list[cache_variant_limit:]:
+        if full_path != variant_cache_dir:
+            shutil.rmtree(full_path, ignore_errors = True)
+
+    return
+
+
+def load_cached_data(
+        idir: str,
+        start_date: str,
+        end_date: str,
+        timezone: str,
+        tariffs: dict,
+        cache_dir: str,
+        prices: dict = None) -> tuple:
+
+    # loads the costed hourly records and their day aggregates
+    # using an on-disk cache. The cache has a directory per
+    # input directory and timezone with a sub-directory per
+    # costed variant (tariff plans and dynamic prices). Each
+    # variant holds an entry file per month of data files 
+    # (<YYYY-MM>.cache) with each file's costed records and 
+    # day aggregates. An entry is reused as long as the file
+    # size and modification time match. Only the month entries
+    # in the start/end range are read and only new or changed 
+    # files are read and costed. Entries for deleted data 
+    # files are dropped.
+    #
+    # Returns the hourly data dict and day aggregate dict. The
+    # day dict is None if the days could not be combined from 
+    # the cached entries (records for the same hour or day
+    # spread across files)
+    start_ts, end_ts = get_range_ts(start_date, end_date, timezone)
+
+    idir_key = hashlib.sha1(
+            ('%s|%s' % (
+                os.path.abspath(idir),
+                timezone)).encode('utf-8')).hexdigest()
+    variant_key = hashlib.sha1(
+            ('%s|%s' % (
+                get_tariff_hash(tariffs),
+                get_price_hash(prices))).encode('utf-8')).hexdigest()
+    idir_cache_dir = '%s/%s' % (cache_dir, idir_key[:16])
+    variant_cache_dir = '%s/%s' % (idir_cache_dir, variant_key[:16])
+    evict_cache_variants(
+            idir_cache_dir,
+            variant_cache_dir)
+
+    # month entries of all data files so entries
+    # for months with no files left can be dropped
+    group_filename_dict = {}
+    for full_path in energy_store.list_data_files(idir):
+        filename = os.path.basename(full_path)
+        group = get_cache_group(filename)
+        if not group in group_filename_dict:
+            group_filename_dict[group] = set()
+        group_filename_dict[group].add(filename)
+
+    for entry_filename in os.listdir(variant_cache_dir):
+        if (entry_filename.endswith('.cache') and 
+            not entry_filename[:-len('.cache')] in group_filename_dict):
+            os.remove(os.path.join(variant_cache_dir, entry_filename))
+
+    # entries hold all records of the file
+    # and the start/end range is applied after
+    file_list = energy_store.list_data_files(
+            idir,
+            start_ts,
+            end_ts)
+
+    group_file_list_dict = {}
+    for full_path in file_list:
+        group = get_cache_group(os.path.basename(full_path))
+        if not group in group_file_list_dict:
+            group_file_list_dict[group] = []
+        group_file_list_dict[group].append(full_path)
+
+    # read and cost new or changed files of each
+    # month entry in range
+    file_entry_dict = {}
+    miss_count = 0
+    for group, group_file_list in group_file_list_dict.items():
+        entry_file = '%s/%s.cache' % (variant_cache_dir, group)
+        group_entry_dict = load_cache_entry(entry_file)
+
+        # drop deleted files
+        changed = False
+        for filename in list(group_entry_dict.keys()):
+            if not filename in group_filename_dict[group]:
+                del group_entry_dict[filename]
+                changed = True
+
+        for full_path in group_file_list:
+            filename = os.path.basename(full_path)
+            file_stat = os.stat(full_path)
+            fingerprint = (file_stat.st_size, file_stat.st_mtime_ns)
+
+            file_entry = group_entry_dict.get(filename)
+            if (file_entry and 
+                file_entry['fingerprint'] == fingerprint):
+                continue
+
+            miss_count += 1
+            changed = True
+            file_data_dict = {}
+            for rec in iter_hour_records(full_path):
+                file_data_dict[rec['datetime']] = rec
+
+            apply_tariffs(
+                    file_data_dict,
+                    tariffs,
+                    prices)
+
+            group_entry_dict[filename] = {
+                    'fingerprint' : fingerprint,
+                    'records' : file_data_dict,
+                    'days' : gen_aggregate_dicts(
+                        file_data_dict, 
+                        ['day'])['day'],
+                    }
+
+        if changed:
+            save_cache_entry(
+                    entry_file,
+                    group_entry_dict)
+
+        for full_path in group_file_list:
+            filename = os.path.basename(full_path)
+            file_entry_dict[filename] = group_entry_dict[filename]
+
+    # combine the entries
+    data_dict = {}
+    day_dict = {}
+    for full_path in file_list:
+        file_entry = file_entry_dict[os.path.basename(full_path)]
+        file_data_dict = file_entry['records']
+        file_day_dict = file_entry['days']
+
+        if start_ts or end_ts:
+            range_data_dict = {}
+            for key, rec in file_data_dict.items():
+                if ((not start_ts or rec['ts'] >= start_ts) and
+                    (not end_ts or rec['ts'] <= end_ts)):
+                    range_data_dict[key] = rec
+
+            if len(range_data_dict) != len(file_data_dict):
+                file_data_dict = range_data_dict
+                file_day_dict = gen_aggregate_dicts(
+                        file_data_dict, 
+                        ['day'])['day']
+
+        if day_dict is not None:
+            if (not data_dict.keys().isdisjoint(file_data_dict) or 
+                not day_dict.keys().isdisjoint(file_day_dict)):
+                day_dict = None
+            else:
+                day_dict.update(file_day_dict)
+
+        data_dict.update(file_data_dict)
+
+    log_message(
+            1,
+            'Loaded %d files (%d from cache), %d records' % (
+                len(file_list), 
+                len(file_list) - miss_count,
+                len(data_dict)
+                )
             )
-        ) 
-format_dict['currency_2dp'] = currency_2dp_format
 
-# aggregate dicts
-day_dict = gen_aggregate_dict(data_dict, 'day')
-weekday_dict = gen_aggregate_dict(data_dict, 'weekday')
-week_dict = gen_aggregate_dict(data_dict, 'week')
-month_dict = gen_aggregate_dict(data_dict, 'month')
-year_dict = gen_aggregate_dict(data_dict, 'year')
-hour_dict = gen_aggregate_dict(data_dict, 'hour')
-tariff_dict = gen_aggregate_dict(data_dict, 'tariff_name')
+    return data_dict, day_dict
 
-# Aggregate worksheets
 
-cost_label = 'Cost (%s)' % (currency_symbol)
+def write_report(
+        report_file_name: str,
+        data_dict: dict,
+        report_list: list,
+        comment_str: str,
+        day_dict: dict = None) -> None:
+
+    # generates the report from the costed hourly records
+    # with a sheet per selected report
+    if output_format != 'xlsx':
+        write_columnar_report(
+                report_file_name,
+                data_dict,
+                report_list,
+                day_dict)
+        return
 
-power_series =  [
-        {
-            'field': 'import',
-            'colour': 'red',
-            },
-        {
-            'field': 'solar_consumed',
-            'colour': 'green',
-            },
-        {
-            'field': 'export',
-            'colour': 'blue',
-            },
-        ]
+    # XLSX
+    # low memory mode uses xlsxwriter's constant_memory 
+    # option where each row is flushed to a temp file once
+    # the next row is started
+    workbook_options = {}
+    if low_memory:
+        workbook_options['constant_memory'] = True
 
-grid_series =  [
-        {
-            'field': 'grid_voltage_max',
-            'colour': '#FF0000',
-            },
-        {
-            'field': 'grid_voltage_min',
-            'colour': '#880000',
-            },
-        ]
+    workbook = xlsxwriter.Workbook(
+            report_file_name,
+            workbook_options)
 
-grid_1_series =  [
-        {
-            'field': 'grid_voltage_1_max',
-            'colour': '#FF0000',
-            },
+    workbook.set_properties(
         {
-            'field': 'grid_voltage_1_min',
-            'colour': '#880000',
-            },
-        ]
+            'title': 'Energy Usage Report',
+            'subject': 'Python-generated Excel report based on energy usage data',
+            'keywords': 'python energy solar report',
+            'author': 'https://github.com/dresdner353/energyutils',
+            'comments': comment_str
+        }
+    )
+
+    format_dict = {}
+
+    header_format = workbook.add_format()
+    header_format.set_text_wrap()
+    header_format.set_align('top')
+    header_format.set_align('center')
+    header_format.set_bg_color('#C1C1C1')
+    format_dict['header'] = header_format
+
+    str_format = workbook.add_format() 
+    str_format.set_num_format('General') # text
+    str_format.set_align('right')
+    format_dict['str'] = str_format
+
+    float_format = workbook.add_format() 
+    # with commas and 4 decimal places
+    float_format.set_num_format('#,##0.0000') 
+    format_dict['float'] = float_format
+
+    int_format = workbook.add_format() 
+    # no decimal places
+    int_format.set_num_format('0') 
+    format_dict['integer'] = int_format
+
+    kwh_format = workbook.add_format() 
+    # with commas and 2 decimal places
+    kwh_format.set_num_format('#,##0.00 "kWh"') 
+    format_dict['kwh'] = kwh_format
+
+    # 3dp variant of kwh 
+    # only needed for smaller offset-type fields
+    kwh_3dp_format = workbook.add_format() 
+    # with commas and 3 decimal places
+    kwh_3dp_format.set_num_format('#,##0.000 "kWh"') 
+    format_dict['kwh_3dp'] = kwh_3dp_format
+
+    vac_format = workbook.add_format() 
+    # with commas and 2 decimal place
+    vac_format.set_num_format('#,##0.00 "V"') 
+    format_dict['vac'] = vac_format
+
+    percent_format = workbook.add_format() 
+    percent_format.set_num_format('0.0%') 
+    format_dict['percent'] = percent_format
+
+    currency_4dp_format = workbook.add_format() 
+    # with currency symbol, commas and 4 decimal places
+    currency_4dp_format.set_num_format(
+            '%s#,##0.0000;[BLUE]-%s#,##0.0000' % (
+                currency_symbol,
+                currency_symbol
+                )
+            ) 
+    format_dict['currency_4dp'] = currency_4dp_format
+
+    currency_2dp_format = workbook.add_format() 
+    # with currency symbol, commas and 2 decimal places
+    currency_2dp_format.set_num_format(
+            '%s#,##0.00;[BLUE]-%s#,##0.00' % (
+                currency_symbol,
+                currency_symbol
+                )
+            ) 
+    format_dict['currency_2dp'] = currency_2dp_format
+
+    # aggregate dicts
+    # only built for the selected reports
+    perf_utils.start_stage('aggregate')
+    report_dict_dict = gen_report_dicts(
+            data_dict, 
+            report_list,
+            day_dict)
+    perf_utils.end_stage('aggregate')
+    perf_utils.start_stage('write')
+    day_dict = report_dict_dict.get('day', {})
+    weekday_dict = report_dict_dict.get('weekday', {})
+    week_dict = report_dict_dict.get('week', {})
+    month_dict = report_dict_dict.get('month', {})
+    year_dict = report_dict_dict.get('year', {})
+    hour_dict = report_dict_dict.get('24h', {})
+    tariff_dict = report_dict_dict.get('tariff', {})
+
+    # Aggregate worksheets
+
+    cost_label = 'Cost (%s)' % (currency_symbol)
+
+    power_series =  [
+            {
+                'field': 'import',
+                'colour': 'red',
+                },
+            {
+                'field': 'solar_consumed',
+                'colour': 'green',
+                },
+            {
+                'field': 'export',
+                'colour': 'blue',
+                },
+            ]
 
-grid_2_series =  [
-        {
-            'field': 'grid_voltage_2_max',
-            'colour': '#DDDD00',
-            },
-        {
-            'field': 'grid_voltage_2_min',
-            'colour': '#666600',
-            },
-        ]
+    grid_series =  [
+            {
+                'field': 'grid_voltage_max',
+                'colour': '#FF0000',
+                },
+            {
+                'field': 'grid_voltage_min',
+                'colour': '#880000',
+                },
+            ]
 
-grid_3_series =  [
-        {
-            'field': 'grid_voltage_3_max',
-            'colour': '#0000FF',
-            },
-        {
-            'field': 'grid_voltage_3_min',
-            'colour': '#000088',
-            },
-        ]
+    grid_1_series =  [
+            {
+                'field': 'grid_voltage_1_max',
+                'colour': '#FF0000',
+                },
+            {
+                'field': 'grid_voltage_1_min',
+                'colour': '#880000',
+                },
+            ]
 
-pv_total_perf_series =  [
-        {
-            'field': 'solar',
-            'colour': '#EDC001',
-            },
-        ]
+    grid_2_series =  [
+            {
+                'field': 'grid_voltage_2_max',
+                'colour': '#DDDD00',
+                },
+            {
+                'field': 'grid_voltage_2_min',
+                'colour': '#666600',
+                },
+            ]
 
-pv_string_perf_series =  [
-        {
-            'field': 'solar_pv1',
-            'colour': '#DDDD00',
-            },
-        {
-            'field': 'solar_pv2',
-            'colour': 'orange',
-            },
-        {
-            'field': 'solar_pv3',
-            'colour': 'green',
-            },
-        {
-            'field': 'solar_pv4',
-            'colour': 'blue',
-            },
-        ]
+    grid_3_series =  [
+            {
+                'field': 'grid_voltage_3_max',
+                'colour': '#0000FF',
+                },
+            {
+                'field': 'grid_voltage_3_min',
+                'colour': '#000088',
+                },
+            ]
 
-value_series = [
-        {
-            'field': 'import_cost',
-            'colour': 'red',
-            },
-        {
-            'field': 'solar_credit',
-            'colour': 'green',
-            },
-        {
-            'field': 'export_credit',
-            'colour': 'blue',
-            },
-        ]
+    pv_total_perf_series =  [
+            {
+                'field': 'solar',
+                'colour': '#EDC001',
+                },
+            ]
 
-bill_series = [
-        {
-            'field': 'bill_amount',
-            'colour': 'red',
-            },
-        {
-            'field': 'savings',
-            'colour': 'green',
-            },
-        ]
+    pv_string_perf_series =  [
+            {
+                'field': 'solar_pv1',
+                'colour': '#DDDD00',
+                },
+            {
+                'field': 'solar_pv2',
+                'colour': 'orange',
+                },
+            {
+                'field': 'solar_pv3',
+                'colour': 'green',
+                },
+            {
+                'field': 'solar_pv4',
+                'colour': 'blue',
+                },
+            ]
 
-tariff_value_series = [
-        {
-            'field': 'import_cost',
-            'colour': 'red',
-            },
-        {
-            'field': 'solar_credit',
-            'colour': 'green',
-            },
-        {
-            'field': 'export_credit',
-            'colour': 'blue',
-            },
-        ]
+    value_series = [
+            {
+                'field': 'import_cost',
+                'colour': 'red',
+                },
+            {
+                'field': 'solar_credit',
+                'colour': 'green',
+                },
+            {
+                'field': 'export_credit',
+                'colour': 'blue',
+                },
+            ]
 
-battery_charging_series = [
-        {
-            'field': 'battery_grid_charge',
-            'colour': 'red',
-            },
-        {
-            'field': 'battery_solar_charge',
-            'colour': 'green',
-            },
-        {
-            'field': 'battery_charge',
-            'colour': 'purple',
-            },
-        {
-            'field': 'battery_discharge',
-            'colour': 'blue',
-            },
-        ]
+    bill_series = [
+            {
+                'field': 'bill_amount',
+                'colour': 'red',
+                },
+            {
+                'field': 'savings',
+                'colour': 'green',
+                },
+            ]
 
-battery_storage_series = [
-        {
-            'field': 'battery_storage',
-            'colour': 'blue',
-            },
-        ]
+    tariff_value_series = [
+            {
+                'field': 'import_cost',
+                'colour': 'red',
+                },
+            {
+                'field': 'solar_credit',
+                'colour': 'green',
+                },
+            {
+                'field': 'export_credit',
+                'colour': 'blue',
+                },
+            ]
 
-battery_cycles_series = [
-        {
-            'field': 'battery_cycles',
-            'colour': 'blue',
-            },
-        ]
+    battery_charging_series = [
+            {
+                'field': 'battery_grid_charge',
+                'colour': 'red',
+                },
+            {
+                'field': 'battery_solar_charge',
+                'colour': 'green',
+                },
+            {
+                'field': 'battery_charge',
+                'colour': 'purple',
+                },
+            {
+                'field': 'battery_discharge',
+                'colour': 'blue',
+                },
+            ]
 
-battery_capacity_series = [
-        {
-            'field': 'battery_capacity',
-            'colour': 'blue',
-            },
-        ]
-
-for report in report_list:
-    if report == 'hour':
-        add_worksheet(
-                workbook,
-                'Hour',
-                format_dict,
-                field_dict,
-                data_dict,
-                'datetime',
-                chart_list = [
-                    {
-                        'title' : 'Bill Calculations',
-                        'type' : 'column',
-                        'x_title' : 'Hour',
-                        'x_rotation' : -45,
-                        'y_title' : cost_label,
-                        'series' : bill_series,
-                    },
-                    {
-                        'title' : 'Power Distribution',
-                        'type' : 'column',
-                        'sub_type' : 'stacked',
-                        'x_title' : 'Hour',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : power_series,
-                        },
-                    {
-                        'title' : 'PV Generation',
-                        'type' : 'column',
-                        'x_title' : 'Hour',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : pv_total_perf_series,
-                        },
-                    {
-                        'title' : 'PV String Generation',
-                        'type' : 'column',
-                        'x_title' : 'Hour',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : pv_string_perf_series,
-                        },
-                    {
-                        'title' : 'Battery Charging',
-                        'type' : 'column',
-                        'x_title' : 'Hour',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : battery_charging_series,
-                        },
-                    {
-                        'title' : 'Battery Storage',
-                        'type' : 'column',
-                        'x_title' : 'Hour',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : battery_storage_series,
-                        },
-                    {
-                        'title' : 'Battery Cycles',
-                        'type' : 'column',
-                        'x_title' : 'Hour',
-                        'x_rotation' : -45,
-                        'y_title' : 'Cycles',
-                        'series' : battery_cycles_series,
-                        },
-                    {
-                        'title' : 'Battery Capacity',
-                        'type' : 'column',
-                        'x_title' : 'Hour',
-                        'x_rotation' : -45,
-                        'y_title' : '% Full',
-                        'series' : battery_capacity_series,
-                        },
-                    {
-                        'title' : 'Power Value',
-                        'type' : 'column',
-                        'sub_type' : 'stacked',
-                        'x_title' : 'Hour',
-                        'x_rotation' : -45,
-                        'y_title' : cost_label,
-                        'series' : value_series,
-                        },
-                    {
-                        'title' : 'Grid Voltage',
-                        'type' : 'column',
-                        'x_title' : 'Hour',
-                        'x_rotation' : -45,
-                        'y_title' : 'VAC',
-                        'series' : grid_series,
-                        },
-                    {
-                        'title' : 'Grid Voltage L1',
-                        'type' : 'column',
-                        'x_title' : 'Hour',
-                        'x_rotation' : -45,
-                        'y_title' : 'VAC',
-                        'series' : grid_1_series,
-                        },
-                    {
-                        'title' : 'Grid Voltage L2',
-                        'type' : 'column',
-                        'x_title' : 'Hour',
-                        'x_rotation' : -45,
-                        'y_title' : 'VAC',
-                        'series' : grid_2_series,
-                        },
-                    {
-                        'title' : 'Grid Voltage L3',
-                        'type' : 'column',
-                        'x_title' : 'Hour',
-                        'x_rotation' : -45,
-                        'y_title' : 'VAC',
-                        'series' : grid_3_series,
-                        },
+    battery_storage_series = [
+            {
+                'field': 'battery_storage',
+                'colour': 'blue',
+                },
             ]
-        )
 
+    battery_cycles_series = [
+            {
+                'field': 'battery_cycles',
+                'colour': 'blue',
+                },
+            ]
 
-    if report == 'day':
-        add_worksheet(
-                workbook,
-                'Day',
-                format_dict,
-                field_dict,
-                day_dict,
-                'day',
-                chart_list = [
-                    {
-                        'title' : 'Bill Calculations',
-                        'type' : 'column',
-                        'x_title' : 'Day',
-                        'x_rotation' : -45,
-                        'y_title' : cost_label,
-                        'series' : bill_series,
-                        },
-                    {
-                        'title' : 'Power Distribution',
-                        'type' : 'column',
-                        'sub_type' : 'stacked',
-                        'x_title' : 'Day',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : power_series,
-                        },
-                    {
-                        'title' : 'PV Generation',
-                        'type' : 'column',
-                        'x_title' : 'Day',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : pv_total_perf_series,
-                        },
-                    {
-                        'title' : 'PV String Generation',
-                        'type' : 'column',
-                        'x_title' : 'Day',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : pv_string_perf_series,
-                        },
-                    {
-                        'title' : 'Charging',
-                        'type' : 'column',
-                        'x_title' : 'Day',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : battery_charging_series,
-                        },
-                    {
-                        'title' : 'Battery Cycles',
-                        'type' : 'column',
-                        'x_title' : 'Day',
-                        'x_rotation' : -45,
-                        'y_title' : 'Cycles',
-                        'series' : battery_cycles_series,
-                        },
-                    {
-                        'title' : 'Power Value',
-                        'type' : 'column',
-                        'sub_type' : 'stacked',
-                        'x_title' : 'Day',
-                        'x_rotation' : -45,
-                        'y_title' : cost_label,
-                        'series' : value_series,
+    battery_capacity_series = [
+            {
+                'field': 'battery_capacity',
+                'colour': 'blue',
+                },
+            ]
+
+    for report in report_list:
+        if report == 'hour':
+            add_worksheet(
+                    workbook,
+                    'Hour',
+                    format_dict,
+                    field_dict,
+                    data_dict,
+                    'datetime',
+                    chart_list = [
+                        {
+                            'title' : 'Bill Calculations',
+                            'type' : 'column',
+                            'x_title' : 'Hour',
+                            'x_rotation' : -45,
+                            'y_title' : cost_label,
+                            'series' : bill_series,
                         },
+                        {
+                            'title' : 'Power Distribution',
+                            'type' : 'column',
+                            'sub_type' : 'stacked',
+                            'x_title' : 'Hour',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : power_series,
+                            },
+                        {
+                            'title' : 'PV Generation',
+                            'type' : 'column',
+                            'x_title' : 'Hour',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : pv_total_perf_series,
+                            },
+                        {
+                            'title' : 'PV String Generation',
+                            'type' : 'column',
+                            'x_title' : 'Hour',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : pv_string_perf_series,
+                            },
+                        {
+                            'title' : 'Battery Charging',
+                            'type' : 'column',
+                            'x_title' : 'Hour',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : battery_charging_series,
+                            },
+                        {
+                            'title' : 'Battery Storage',
+                            'type' : 'column',
+                            'x_title' : 'Hour',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : battery_storage_series,
+                            },
+                        {
+                            'title' : 'Battery Cycles',
+                            'type' : 'column',
+                            'x_title' : 'Hour',
+                            'x_rotation' : -45,
+                            'y_title' : 'Cycles',
+                            'series' : battery_cycles_series,
+                            },
+                        {
+                            'title' : 'Battery Capacity',
+                            'type' : 'column',
+                            'x_title' : 'Hour',
+                            'x_rotation' : -45,
+                            'y_title' : '% Full',
+                            'series' : battery_capacity_series,
+                            },
+                        {
+                            'title' : 'Power Value',
+                            'type' : 'column',
+                            'sub_type' : 'stacked',
+                            'x_title' : 'Hour',
+                            'x_rotation' : -45,
+                            'y_title' : cost_label,
+                            'series' : value_series,
+                            },
+                        {
+                            'title' : 'Grid Voltage',
+                            'type' : 'column',
+                            'x_title' : 'Hour',
+                            'x_rotation' : -45,
+                            'y_title' : 'VAC',
+                            'series' : grid_series,
+                            },
+                        {
+                            'title' : 'Grid Voltage L1',
+                            'type' : 'column',
+                            'x_title' : 'Hour',
+                            'x_rotation' : -45,
+                            'y_title' : 'VAC',
+                            'series' : grid_1_series,
+                            },
+                        {
+                            'title' : 'Grid Voltage L2',
+                            'type' : 'column',
+                            'x_title' : 'Hour',
+                            'x_rotation' : -45,
+                            'y_title' : 'VAC',
+                            'series' : grid_2_series,
+                            },
+                        {
+                            'title' : 'Grid Voltage L3',
+                            'type' : 'column',
+                            'x_title' : 'Hour',
+                            'x_rotation' : -45,
+                            'y_title' : 'VAC',
+                            'series' : grid_3_series,
+                            },
+                ]
+            )
+
+
+        if report == 'day':
+            add_worksheet(
+                    workbook,
+                    'Day',
+                    format_dict,
+                    field_dict,
+                    day_dict,
+                    'day',
+                    chart_list = [
+                        {
+                            'title' : 'Bill Calculations',
+                            'type' : 'column',
+                            'x_title' : 'Day',
+                            'x_rotation' : -45,
+                            'y_title' : cost_label,
+                            'series' : bill_series,
+                            },
+                        {
+                            'title' : 'Power Distribution',
+                            'type' : 'column',
+                            'sub_type' : 'stacked',
+                            'x_title' : 'Day',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : power_series,
+                            },
+                        {
+                            'title' : 'PV Generation',
+                            'type' : 'column',
+                            'x_title' : 'Day',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : pv_total_perf_series,
+                            },
+                        {
+                            'title' : 'PV String Generation',
+                            'type' : 'column',
+                            'x_title' : 'Day',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : pv_string_perf_series,
+                            },
+                        {
+                            'title' : 'Charging',
+                            'type' : 'column',
+                            'x_title' : 'Day',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : battery_charging_series,
+                            },
+                        {
+                            'title' : 'Battery Cycles',
+                            'type' : 'column',
+                            'x_title' : 'Day',
+                            'x_rotation' : -45,
+                            'y_title' : 'Cycles',
+                            'series' : battery_cycles_series,
+                            },
+                        {
+                            'title' : 'Power Value',
+                            'type' : 'column',
+                            'sub_type' : 'stacked',
+                            'x_title' : 'Day',
+                            'x_rotation' : -45,
+                            'y_title' : cost_label,
+                            'series' : value_series,
+                            },
+
+                ]
+            )
+
+        if report == 'week':
+            add_worksheet(
+                    workbook,
+                    'Week',
+                    format_dict,
+                    field_dict,
+                    week_dict,
+                    'week',
+                    chart_list = [
+                        {
+                            'title' : 'Bill Calculations',
+                            'type' : 'column',
+                            'x_title' : 'Week',
+                            'x_rotation' : -45,
+                            'y_title' : cost_label,
+                            'series' : bill_series,
+                            },
+                        {
+                            'title' : 'Power Distribution',
+                            'type' : 'column',
+                            'sub_type' : 'stacked',
+                            'x_title' : 'Week',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : power_series,
+                            },
+                        {
+                            'title' : 'PV Generation',
+                            'type' : 'column',
+                            'x_title' : 'Week',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : pv_total_perf_series,
+                            },
+                        {
+                            'title' : 'PV String Generation',
+                            'type' : 'column',
+                            'x_title' : 'Week',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : pv_string_perf_series,
+                            },
+                        {
+                            'title' : 'Charging',
+                            'type' : 'column',
+                            'x_title' : 'Week',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : battery_charging_series,
+                            },
+                        {
+                            'title' : 'Battery Cycles',
+                            'type' : 'column',
+                            'x_title' : 'Week',
+                            'x_rotation' : -45,
+                            'y_title' : 'Cycles',
+                            'series' : battery_cycles_series,
+                            },
+                        {
+                            'title' : 'Power Value',
+                            'type' : 'column',
+                            'sub_type' : 'stacked',
+                            'x_title' : 'Week',
+                            'x_rotation' : -45,
+                            'y_title' : cost_label,
+                            'series' : value_series,
+                            },
+
+                ]
+            )
+
+        if report == 'month':
+            add_worksheet(
+                    workbook,
+                    'Month',
+                    format_dict,
+                    field_dict,
+                    month_dict,
+                    'month',
+                    chart_list = [
+                        {
+                            'title' : 'Bill Calculations',
+                            'type' : 'column',
+                            'x_title' : 'Month',
+                            'x_rotation' : -45,
+                            'y_title' : cost_label,
+                            'series' : bill_series,
+                            },
+                        {
+                            'title' : 'Power Distribution',
+                            'type' : 'column',
+                            'sub_type' : 'stacked',
+                            'x_title' : 'Month',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : power_series,
+                            },
+                        {
+                            'title' : 'PV Generation',
+                            'type' : 'column',
+                            'x_title' : 'Month',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : pv_total_perf_series,
+                            },
+                        {
+                            'title' : 'PV String Generation',
+                            'type' : 'column',
+                            'x_title' : 'Month',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : pv_string_perf_series,
+                            },
+                        {
+                            'title' : 'Charging',
+                            'type' : 'column',
+                            'x_title' : 'Month',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : battery_charging_series,
+                            },
+                        {
+                            'title' : 'Battery Cycles',
+                            'type' : 'column',
+                            'x_title' : 'Month',
+                            'x_rotation' : -45,
+                            'y_title' : 'Cycles',
+                            'series' : battery_cycles_series,
+                            },
+                        {
+                            'title' : 'Power Value',
+                            'type' : 'column',
+                            'sub_type' : 'stacked',
+                            'x_title' : 'Month',
+                            'x_rotation' : -45,
+                            'y_title' : cost_label,
+                            'series' : value_series,
+                            },
+
+                ]
+            )
+
+        if report == 'year':
+            add_worksheet(
+                    workbook,
+                    'Year',
+                    format_dict,
+                    field_dict,
+                    year_dict,
+                    'year',
+                    chart_list = [
+                        {
+                            'title' : 'Bill Calculations',
+                            'type' : 'column',
+                            'x_title' : 'Year',
+                            'x_rotation' : -45,
+                            'y_title' : cost_label,
+                            'series' : bill_series,
+                            },
+                        {
+                            'title' : 'Power Distribution',
+                            'type' : 'column',
+                            'sub_type' : 'stacked',
+                            'x_title' : 'Year',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : power_series,
+                            },
+                        {
+                            'title' : 'PV Generation',
+                            'type' : 'column',
+                            'x_title' : 'Year',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : pv_total_perf_series,
+                            },
+                        {
+                            'title' : 'PV String Generation',
+                            'type' : 'column',
+                            'x_title' : 'Year',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : pv_string_perf_series,
+                            },
+                        {
+                            'title' : 'Charging',
+                            'type' : 'column',
+                            'x_title' : 'Year',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : battery_charging_series,
+                            },
+                        {
+                            'title' : 'Battery Cycles',
+                            'type' : 'column',
+                            'x_title' : 'Year',
+                            'x_rotation' : -45,
+                            'y_title' : 'Cycles',
+                            'series' : battery_cycles_series,
+                            },
+                        {
+                            'title' : 'Power Value',
+                            'type' : 'column',
+                            'sub_type' : 'stacked',
+                            'x_title' : 'Year',
+                            'x_rotation' : -45,
+                            'y_title' : cost_label,
+                            'series' : value_series,
+                            },
+
+                ]
+            )
+
+        if report == 'weekday':
+            add_worksheet(
+                    workbook,
+                    'Weekday',
+                    format_dict,
+                    field_dict,
+                    weekday_dict,
+                    'weekday',
+                    chart_list = [
+                        {
+                            'title' : 'Bill Calculations',
+                            'type' : 'column',
+                            'x_title' : 'Weekday',
+                            'y_title' : cost_label,
+                            'series' : bill_series,
+                            },
+                        {
+                            'title' : 'Power Distribution',
+                            'type' : 'column',
+                            'sub_type' : 'stacked',
+                            'x_title' : 'Weekday',
+                            'y_title' : 'kWh',
+                            'series' : power_series
+                            },
+                        {
+                            'title' : 'PV Generation',
+                            'type' : 'column',
+                            'x_title' : 'Weekday',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : pv_total_perf_series,
+                            },
+                        {
+                            'title' : 'PV String Generation',
+                            'type' : 'column',
+                            'x_title' : 'Weekday',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : pv_string_perf_series,
+                            },
+                        {
+                            'title' : 'Charging',
+                            'type' : 'column',
+                            'x_title' : 'Weekday',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : battery_charging_series,
+                            },
+                        {
+                            'title' : 'Battery Cycles',
+                            'type' : 'column',
+                            'x_title' : 'Weekday',
+                            'x_rotation' : -45,
+                            'y_title' : 'Cycles',
+                            'series' : battery_cycles_series,
+                            },
+                        {
+                            'title' : 'Power Value',
+                            'type' : 'column',
+                            'sub_type' : 'stacked',
+                            'x_title' : 'Weekday',
+                            'x_rotation' : -45,
+                            'y_title' : cost_label,
+                            'series' : value_series,
+                            },
+
+                        ]
+            )
 
+        if report == '24h':
+            add_worksheet(
+                    workbook,
+                    '24h',
+                    format_dict,
+                    field_dict,
+                    hour_dict,
+                    'hour',
+                    chart_list = [
+                        {
+                            'title' : 'Bill Calculations',
+                            'type' : 'column',
+                            'x_title' : 'Hour',
+                            'y_title' : cost_label,
+                            'series' : bill_series,
+                            },
+                        {
+                            'title' : 'Power Distribution',
+                            'type' : 'column',
+                            'sub_type' : 'stacked',
+                            'x_title' : 'Hour',
+                            'y_title' : 'kWh',
+                            'series' : power_series,
+                            },
+                        {
+                            'title' : 'PV Generation',
+                            'type' : 'column',
+                            'x_title' : 'Hour',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : pv_total_perf_series,
+                            },
+                        {
+                            'title' : 'PV String Generation',
+                            'type' : 'column',
+                            'x_title' : 'Hour',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : pv_string_perf_series,
+                            },
+                        {
+                            'title' : 'Charging',
+                            'type' : 'column',
+                            'x_title' : 'Hour',
+                            'x_rotation' : -45,
+                            'y_title' : 'kWh',
+                            'series' : battery_charging_series,
+                            },
+                        {
+                            'title' : 'Battery Cycles',
+                            'type' : 'column',
+                            'x_title' : 'Hour',
+                            'x_rotation' : -45,
+                            'y_title' : 'Cycles',
+                            'series' : battery_cycles_series,
+                            },
+                        {
+                            'title' : 'Power Value',
+                            'type' : 'column',
+                            'sub_type' : 'stacked',
+                            'x_title' : 'Hour',
+                            'x_rotation' : -45,
+                            'y_title' : cost_label,
+                            'series' : value_series,
+                            },
+
+                        ])
+
+        if report == 'tariff':
+            add_worksheet(
+                    workbook,
+                    'Tariff',
+                    format_dict,
+                    field_dict,
+                    tariff_dict,
+                    'tariff_name',
+                    chart_list = [
+                        {
+                            'title' : 'Bill Calculations',
+                            'type' : 'column',
+                            'x_title' : 'Tariff',
+                            'x_rotation' : -45,
+                            'y_title' : cost_label,
+                            'series' : bill_series,
+                            },
+                        {
+                            'title' : 'Charging',
+                            'type' : 'column',
+                            'x_title' : 'Tariff',
+                            'y_title' : 'kWh',
+                            'series' : battery_charging_series,
+                            },
+                        {
+                            'title' : 'Battery Cycles',
+                            'type' : 'column',
+                            'x_title' : 'Tariff',
+                            'x_rotation' : -45,
+                            'y_title' : 'Cycles',
+                            'series' : battery_cycles_series,
+                            },
+                        {
+                            'title' : 'Power Value',
+                            'type' : 'column',
+                            'x_title' : 'Tariff',
+                            'y_title' : cost_label,
+                            'series' : tariff_value_series,
+                            },
+                        ]
+                    )
+
+    workbook.close()
+    perf_utils.end_stage('write')
+
+    return
+
+
+def init_batch_worker(
+        record_dict_dict: dict,
+        tariff_dict: dict,
+        price_dict: dict,
+        comment_str: str) -> None:
+
+    # loaded records, tariffs and prices shared by 
+    # the batch scenarios run in this process
+    global batch_record_dict_dict
+    global batch_tariff_dict
+    global batch_price_dict
+    global batch_comment_str
+
+    batch_record_dict_dict = record_dict_dict
+    batch_tariff_dict = tariff_dict
+    batch_price_dict = price_dict
+    batch_comment_str = comment_str
+
+    return
+
+
+def gen_batch_report(
+        scenario: dict) -> str:
+
+    # costs, aggregates and writes the report for a single
+    # batch scenario. The loaded records are shared across
+    # scenarios so the costing is applied to a copy
+    # With the aggregate cache, each scenario loads its 
+    # own costed records from the cache instead
+    tariffs = batch_tariff_dict[scenario['tariffs']]
+    prices = batch_price_dict[
+            (scenario['semopx'], 
+             scenario['semopx_margin'], 
+             scenario['semopx_vat'])]
+
+    day_dict = None
+    if cache_dir:
+        perf_utils.start_stage('load')
+        data_dict, day_dict = load_cached_data(
+                scenario['idir'],
+                scenario['start'],
+                scenario['end'],
+                timezone,
+                tariffs,
+                cache_dir,
+                prices)
+        perf_utils.end_stage('load')
+    else:
+        record_dict = batch_record_dict_dict[
+                (scenario['idir'], 
+                 scenario['start'], 
+                 scenario['end'])]
+        data_dict = {}
+        for key, rec in record_dict.items():
+            data_dict[key] = dict(rec)
+
+        perf_utils.start_stage('cost')
+        apply_tariffs(
+                data_dict,
+                tariffs,
+                prices)
+        perf_utils.end_stage('cost')
+    perf_utils.count('records', len(data_dict))
+
+    write_report(
+            scenario['file'],
+            data_dict,
+            scenario['reports'],
+            batch_comment_str + '\n\nBatch scenario:\n' + json.dumps(scenario, indent = 4),
+            day_dict)
+
+    return scenario['file']
+
+
+def load_batch_scenarios(
+        batch_file: str,
+        default_dict: dict) -> list:
+
+    # Batch manifest is a JSON list of scenario objects
+    # {"file", "idir", "tariffs", "reports", "start", "end",
+    #  "semopx", "semopx_margin", "semopx_vat"}
+    # with all but "file" defaulting to the command line 
+    # options given
+    with open(batch_file) as fp:
+        scenario_full_list = json.load(fp)
+
+    scenario_list = []
+    for scenario_rec in scenario_full_list:
+        scenario = dict(default_dict)
+        scenario.update(scenario_rec)
+
+        for field in ['file', 'idir', 'tariffs']:
+            if not scenario.get(field):
+                log_message(
+                        1, 
+                        'Error: batch scenario %s has no %s' % (
+                            json.dumps(scenario_rec),
+                            field)
+                        )
+                sys.exit(-1)
+
+        for report in scenario['reports']:
+            if not report in report_choices:
+                log_message(
+                        1, 
+                        'Error: batch scenario %s has unknown report %s' % (
+                            scenario['file'],
+                            report)
+                        )
+                sys.exit(-1)
+
+        scenario_list.append(scenario)
+
+    return scenario_list
+
+
+def gen_batch_reports(
+        scenario_list: list,
+        comment_str: str,
+        jobs: int) -> None:
+
+    # shared inputs are loaded once.. tariffs per tariff 
+    # file, prices per SEMOpx directory and formula and 
+    # records per data directory and date range
+    tariff_dict = {}
+    price_dict = {}
+    record_dict_dict = {}
+    for scenario in scenario_list:
+        if not scenario['tariffs'] in tariff_dict:
+            tariff_dict[scenario['tariffs']] = load_tariffs(
+                    scenario['tariffs'])
+
+        price_key = (
+                scenario['semopx'], 
+                scenario['semopx_margin'], 
+                scenario['semopx_vat'])
+        if not price_key in price_dict:
+            price_dict[price_key] = load_prices(*price_key)
+
+        data_key = (
+                scenario['idir'], 
+                scenario['start'], 
+                scenario['end'])
+        if (not cache_dir and 
+            not data_key in record_dict_dict):
+            perf_utils.start_stage('load')
+            record_dict_dict[data_key] = load_records(
+                    scenario['idir'],
+                    scenario['start'],
+                    scenario['end'],
+                    timezone)
+            perf_utils.end_stage('load')
+
+    initargs = (record_dict_dict, tariff_dict, price_dict, comment_str)
+    if jobs <= 1 or len(scenario_list) <= 1:
+        init_batch_worker(*initargs)
+        for scenario in scenario_list:
+            gen_batch_report(scenario)
+        return
+
+    # each workbook written in a worker process with the 
+    # shared inputs passed once to each worker
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers = jobs,
+            initializer = init_batch_worker,
+            initargs = initargs) as executor:
+        future_list = [
+                executor.submit(gen_batch_report, scenario)
+                for scenario in scenario_list]
+        for future in concurrent.futures.as_completed(future_list):
+            log_message(
+                    1,
+                    'Completed %s' % (
+                        future.result())
+                    )
+
+    return
+
+
+# main()
+report_choices = [
+            'year',
+            'month',
+            'week',
+            'day', 
+            'hour', 
+            'tariff',
+            'weekday',
+            '24h',
             ]
+
+parser = argparse.ArgumentParser(
+        description = 'Energy Data Report Generator'
         )
 
-    if report == 'week':
-        add_worksheet(
-                workbook,
-                'Week',
-                format_dict,
-                field_dict,
-                week_dict,
-                'week',
-                chart_list = [
-                    {
-                        'title' : 'Bill Calculations',
-                        'type' : 'column',
-                        'x_title' : 'Week',
-                        'x_rotation' : -45,
-                        'y_title' : cost_label,
-                        'series' : bill_series,
-                        },
-                    {
-                        'title' : 'Power Distribution',
-                        'type' : 'column',
-                        'sub_type' : 'stacked',
-                        'x_title' : 'Week',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : power_series,
-                        },
-                    {
-                        'title' : 'PV Generation',
-                        'type' : 'column',
-                        'x_title' : 'Week',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : pv_total_perf_series,
-                        },
-                    {
-                        'title' : 'PV String Generation',
-                        'type' : 'column',
-                        'x_title' : 'Week',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : pv_string_perf_series,
-                        },
-                    {
-                        'title' : 'Charging',
-                        'type' : 'column',
-                        'x_title' : 'Week',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : battery_charging_series,
-                        },
-                    {
-                        'title' : 'Battery Cycles',
-                        'type' : 'column',
-                        'x_title' : 'Week',
-                        'x_rotation' : -45,
-                        'y_title' : 'Cycles',
-                        'series' : battery_cycles_series,
-                        },
-                    {
-                        'title' : 'Power Value',
-                        'type' : 'column',
-                        'sub_type' : 'stacked',
-                        'x_title' : 'Week',
-                        'x_rotation' : -45,
-                        'y_title' : cost_label,
-                        'series' : value_series,
-                        },
+parser.add_argument(
+        '--file', 
+        help = 'Output XLSX file (or file name prefix for CSV/parquet)', 
+        required = False
+        )
 
-            ]
+parser.add_argument(
+        '--tariffs', 
+        help = 'Tariffs JSON file', 
+        required = False
         )
 
-    if report == 'month':
-        add_worksheet(
-                workbook,
-                'Month',
-                format_dict,
-                field_dict,
-                month_dict,
-                'month',
-                chart_list = [
-                    {
-                        'title' : 'Bill Calculations',
-                        'type' : 'column',
-                        'x_title' : 'Month',
-                        'x_rotation' : -45,
-                        'y_title' : cost_label,
-                        'series' : bill_series,
-                        },
-                    {
-                        'title' : 'Power Distribution',
-                        'type' : 'column',
-                        'sub_type' : 'stacked',
-                        'x_title' : 'Month',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : power_series,
-                        },
-                    {
-                        'title' : 'PV Generation',
-                        'type' : 'column',
-                        'x_title' : 'Month',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : pv_total_perf_series,
-                        },
-                    {
-                        'title' : 'PV String Generation',
-                        'type' : 'column',
-                        'x_title' : 'Month',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : pv_string_perf_series,
-                        },
-                    {
-                        'title' : 'Charging',
-                        'type' : 'column',
-                        'x_title' : 'Month',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : battery_charging_series,
-                        },
-                    {
-                        'title' : 'Battery Cycles',
-                        'type' : 'column',
-                        'x_title' : 'Month',
-                        'x_rotation' : -45,
-                        'y_title' : 'Cycles',
-                        'series' : battery_cycles_series,
-                        },
-                    {
-                        'title' : 'Power Value',
-                        'type' : 'column',
-                        'sub_type' : 'stacked',
-                        'x_title' : 'Month',
-                        'x_rotation' : -45,
-                        'y_title' : cost_label,
-                        'series' : value_series,
-                        },
+parser.add_argument(
+        '--idir', 
+        help = 'Input Directory for data files', 
+        required = False
+        )
 
-            ]
+parser.add_argument(
+        '--start', 
+        help = 'Calculation Start Date (YYYYMMDD)', 
+        required = False
         )
 
-    if report == 'year':
-        add_worksheet(
-                workbook,
-                'Year',
-                format_dict,
-                field_dict,
-                year_dict,
-                'year',
-                chart_list = [
-                    {
-                        'title' : 'Bill Calculations',
-                        'type' : 'column',
-                        'x_title' : 'Year',
-                        'x_rotation' : -45,
-                        'y_title' : cost_label,
-                        'series' : bill_series,
-                        },
-                    {
-                        'title' : 'Power Distribution',
-                        'type' : 'column',
-                        'sub_type' : 'stacked',
-                        'x_title' : 'Year',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : power_series,
-                        },
-                    {
-                        'title' : 'PV Generation',
-                        'type' : 'column',
-                        'x_title' : 'Year',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : pv_total_perf_series,
-                        },
-                    {
-                        'title' : 'PV String Generation',
-                        'type' : 'column',
-                        'x_title' : 'Year',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : pv_string_perf_series,
-                        },
-                    {
-                        'title' : 'Charging',
-                        'type' : 'column',
-                        'x_title' : 'Year',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : battery_charging_series,
-                        },
-                    {
-                        'title' : 'Battery Cycles',
-                        'type' : 'column',
-                        'x_title' : 'Year',
-                        'x_rotation' : -45,
-                        'y_title' : 'Cycles',
-                        'series' : battery_cycles_series,
-                        },
-                    {
-                        'title' : 'Power Value',
-                        'type' : 'column',
-                        'sub_type' : 'stacked',
-                        'x_title' : 'Year',
-                        'x_rotation' : -45,
-                        'y_title' : cost_label,
-                        'series' : value_series,
-                        },
+parser.add_argument(
+        '--end', 
+        help = 'Calculation End Date (YYYYMMDD)', 
+        required = False
+        )
 
-            ]
+parser.add_argument(
+        '--timezone', 
+        help = 'Timezone', 
+        default = 'Europe/Dublin',
+        required = False
         )
 
-    if report == 'weekday':
-        add_worksheet(
-                workbook,
-                'Weekday',
-                format_dict,
-                field_dict,
-                weekday_dict,
-                'weekday',
-                chart_list = [
-                    {
-                        'title' : 'Bill Calculations',
-                        'type' : 'column',
-                        'x_title' : 'Weekday',
-                        'y_title' : cost_label,
-                        'series' : bill_series,
-                        },
-                    {
-                        'title' : 'Power Distribution',
-                        'type' : 'column',
-                        'sub_type' : 'stacked',
-                        'x_title' : 'Weekday',
-                        'y_title' : 'kWh',
-                        'series' : power_series
-                        },
-                    {
-                        'title' : 'PV Generation',
-                        'type' : 'column',
-                        'x_title' : 'Weekday',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : pv_total_perf_series,
-                        },
-                    {
-                        'title' : 'PV String Generation',
-                        'type' : 'column',
-                        'x_title' : 'Weekday',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : pv_string_perf_series,
-                        },
-                    {
-                        'title' : 'Charging',
-                        'type' : 'column',
-                        'x_title' : 'Weekday',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : battery_charging_series,
-                        },
-                    {
-                        'title' : 'Battery Cycles',
-                        'type' : 'column',
-                        'x_title' : 'Weekday',
-                        'x_rotation' : -45,
-                        'y_title' : 'Cycles',
-                        'series' : battery_cycles_series,
-                        },
-                    {
-                        'title' : 'Power Value',
-                        'type' : 'column',
-                        'sub_type' : 'stacked',
-                        'x_title' : 'Weekday',
-                        'x_rotation' : -45,
-                        'y_title' : cost_label,
-                        'series' : value_series,
-                        },
+parser.add_argument(
+        '--currency', 
+        help = 'Currency Symbol (def:€)', 
+        default = '€',
+        required = False
+        )
 
-                    ]
+parser.add_argument(
+        '--semopx', 
+        help = 'SEMOpx data directory for dynamic import rates', 
+        required = False
         )
 
-    if report == '24h':
-        add_worksheet(
-                workbook,
-                '24h',
-                format_dict,
-                field_dict,
-                hour_dict,
-                'hour',
-                chart_list = [
-                    {
-                        'title' : 'Bill Calculations',
-                        'type' : 'column',
-                        'x_title' : 'Hour',
-                        'y_title' : cost_label,
-                        'series' : bill_series,
-                        },
-                    {
-                        'title' : 'Power Distribution',
-                        'type' : 'column',
-                        'sub_type' : 'stacked',
-                        'x_title' : 'Hour',
-                        'y_title' : 'kWh',
-                        'series' : power_series,
-                        },
-                    {
-                        'title' : 'PV Generation',
-                        'type' : 'column',
-                        'x_title' : 'Hour',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : pv_total_perf_series,
-                        },
-                    {
-                        'title' : 'PV String Generation',
-                        'type' : 'column',
-                        'x_title' : 'Hour',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : pv_string_perf_series,
-                        },
-                    {
-                        'title' : 'Charging',
-                        'type' : 'column',
-                        'x_title' : 'Hour',
-                        'x_rotation' : -45,
-                        'y_title' : 'kWh',
-                        'series' : battery_charging_series,
-                        },
-                    {
-                        'title' : 'Battery Cycles',
-                        'type' : 'column',
-                        'x_title' : 'Hour',
-                        'x_rotation' : -45,
-                        'y_title' : 'Cycles',
-                        'series' : battery_cycles_series,
-                        },
-                    {
-                        'title' : 'Power Value',
-                        'type' : 'column',
-                        'sub_type' : 'stacked',
-                        'x_title' : 'Hour',
-                        'x_rotation' : -45,
-                        'y_title' : cost_label,
-                        'series' : value_series,
-                        },
+parser.add_argument(
+        '--semopx_margin', 
+        help = 'Margin added to the SEMOpx rates per kWh (def:0)', 
+        default = 0,
+        type = float,
+        required = False
+        )
 
-                    ])
+parser.add_argument(
+        '--semopx_vat', 
+        help = 'VAT Rate applied to the SEMOpx rates (def:0.. range 1-100)', 
+        default = 0,
+        type = float,
+        required = False
+        )
 
-    if report == 'tariff':
-        add_worksheet(
-                workbook,
-                'Tariff',
-                format_dict,
-                field_dict,
-                tariff_dict,
-                'tariff_name',
-                chart_list = [
-                    {
-                        'title' : 'Bill Calculations',
-                        'type' : 'column',
-                        'x_title' : 'Tariff',
-                        'x_rotation' : -45,
-                        'y_title' : cost_label,
-                        'series' : bill_series,
-                        },
-                    {
-                        'title' : 'Charging',
-                        'type' : 'column',
-                        'x_title' : 'Tariff',
-                        'y_title' : 'kWh',
-                        'series' : battery_charging_series,
-                        },
-                    {
-                        'title' : 'Battery Cycles',
-                        'type' : 'column',
-                        'x_title' : 'Tariff',
-                        'x_rotation' : -45,
-                        'y_title' : 'Cycles',
-                        'series' : battery_cycles_series,
-                        },
-                    {
-                        'title' : 'Power Value',
-                        'type' : 'column',
-                        'x_title' : 'Tariff',
-                        'y_title' : cost_label,
-                        'series' : tariff_value_series,
-                        },
-                    ]
+parser.add_argument(
+        '--low_memory', 
+        help = 'Stream worksheet rows to disk to reduce memory usage', 
+        action = 'store_true'
+        )
+
+parser.add_argument(
+        '--output', 
+        help = 'Output format (def:xlsx), csv and parquet write a file per report', 
+        choices = ['xlsx', 'csv', 'parquet'],
+        default = 'xlsx',
+        required = False
+        )
+
+parser.add_argument(
+        '--cache', 
+        help = 'Directory for the costed/aggregated data cache', 
+        required = False
+        )
+
+parser.add_argument(
+        '--batch', 
+        help = 'Scenario manifest JSON file for batch report generation', 
+        required = False
+        )
+
+parser.add_argument(
+        '--jobs', 
+        help = 'Number of batch reports generated in parallel (def 1, 0 for all CPUs)', 
+        type = int,
+        default = 1,
+        required = False
+        )
+
+parser.add_argument(
+        '--verbose', 
+        help = 'Enable verbose output', 
+        action = 'store_true'
+        )
+
+parser.add_argument(
+        '--reports', 
+        help = 'Reports to generate', 
+        required = False,
+        nargs = '*',
+        choices = report_choices,
+        default = report_choices
+        )
+
+parser.add_argument(
+        '--hide_columns', 
+        help = 'columns to hide',
+        nargs = '*',
+        required = False,
+        choices = list(field_dict.keys()),
+        default = []
+        )
+
+perf_utils.add_arguments(parser)
+
+args = vars(parser.parse_args())
+report_file_name = args['file']
+tariff_file = args['tariffs']
+idir = args['idir']
+start_date = args['start']
+end_date = args['end']
+timezone = args['timezone']
+currency_symbol = args['currency']
+semopx_dir = args['semopx']
+semopx_margin = args['semopx_margin']
+semopx_vat = args['semopx_vat']
+report_list = args['reports']
+hide_column_list = args['hide_columns']
+low_memory = args['low_memory']
+output_format = args['output']
+cache_dir = args['cache']
+batch_file = args['batch']
+jobs = args['jobs']
+verbose = args['verbose']
+
+if (not batch_file and 
+    not (report_file_name and tariff_file and idir)):
+    log_message(1, 'Error: --file, --tariffs and --idir are required unless --batch is used')
+    sys.exit(-1)
+
+if jobs <= 0:
+    jobs = os.cpu_count()
+
+if output_format == 'parquet' and pyarrow is None:
+    log_message(1, 'Error: --output parquet requires the pyarrow module')
+    sys.exit(-1)
+
+# hidden columns
+# populate hidden boolean into field dict
+for column_key in hide_column_list:
+    if column_key in field_dict:
+        field_dict[column_key]['hidden'] = True
+
+# try to reconstruct the command line 
+# options to capture in the properties
+comment_str = 'Invoke options:\n'
+for arg in sys.argv:
+    if arg.startswith('--'):
+        comment_str += '\n'
+    comment_str += ' ' + arg
+
+if __name__ == '__main__':
+    perf_utils.start(args)
+
+    if batch_file:
+        # command line options serve as the 
+        # defaults for each scenario
+        scenario_list = load_batch_scenarios(
+                batch_file,
+                {
+                    'idir' : idir,
+                    'tariffs' : tariff_file,
+                    'reports' : report_list,
+                    'start' : start_date,
+                    'end' : end_date,
+                    'semopx' : semopx_dir,
+                    'semopx_margin' : semopx_margin,
+                    'semopx_vat' : semopx_vat,
+                    })
+
+        log_message(
+                1,
+                'Generating %d batch reports from %s' % (
+                    len(scenario_list),
+                    batch_file
+                    )
                 )
 
-workbook.close()
+        gen_batch_reports(
+                scenario_list,
+                comment_str,
+                jobs)
+    else:
+        log_message(
+                1,
+                'Generating report %s' % (
+                    report_file_name
+                    )
+                )
+
+        tariffs = load_tariffs(tariff_file)
+        prices = load_prices(
+                semopx_dir,
+                semopx_margin,
+                semopx_vat)
+
+        day_dict = None
+        if cache_dir:
+            perf_utils.start_stage('load')
+            data_dict, day_dict = load_cached_data(
+                    idir,
+                    start_date,
+                    end_date,
+                    timezone,
+                    tariffs,
+                    cache_dir,
+                    prices)
+            perf_utils.end_stage('load')
+        else:
+            data_dict = load_data(
+                    idir,
+                    start_date,
+                    end_date,
+                    timezone,
+                    tariffs,
+                    prices)
+        perf_utils.count('records', len(data_dict))
+
+        write_report(
+                report_file_name,
+                data_dict,
+                report_list,
+                comment_str,
+                day_dict)
@@ -1,11 +1,12 @@
 import argparse
 import json
-import os
 import time
-import datetime
 import dateutil.parser
-import zoneinfo
 import sys
+import time_utils
+import tariff_utils
+import energy_store
+import perf_utils
 import xlsxwriter
 
 field_dict = {
@@ -118,32 +119,6 @@ def log_message(
     return
 
 
-def parse_range_time(
-        datetime_str: str,
-        timezone: str,
-        end: bool = False):
-
-    # naive parse
-    dt = datetime.datetime.strptime(datetime_str, '%Y%m%d')
-
-    # end of day
-    if end:
-        dt = dt.replace(
-                hour = 23,
-                minute = 59,
-                second = 59
-                )
-
-    # assert local timezone
-    dt = dt.replace(tzinfo = zoneinfo.ZoneInfo(timezone))
-
-    # convert go epoch as God intended
-    time_stamp = int(dt.timestamp())
-
-    # return both values
-    return time_stamp, dt
-
-
 def add_worksheet(
         workbook: xlsxwriter.Workbook,
         sheet_title: str,
@@ -154,6 +129,7 @@ def add_worksheet(
         chart_list: list = None) -> None:
 
     global verbose
+    global low_memory
 
     # nothing to do if no data sent
     if len(data_dict) == 0:
@@ -272,6 +248,7 @@ def add_worksheet(
             filter_key_list = list(filter_field_set)
             filter_key_list.sort()
             filter_key_list = filter_key_list[-max_filter_periods:]
+            filter_key_set = set(filter_key_list)
 
             # populate the filter list with the 
             # selected list of values
@@ -282,57 +259,81 @@ def add_worksheet(
                     filter_col,
                     filter_key_list)
     
+    # compile the per-column writer plan once
+    # (field, column, writer, cell format, default value)
+    # string fields default to an empty string
+    number_format_set = {
+            'integer', 
+            'float', 
+            'currency_4dp', 
+            'currency_2dp', 
+            'percent', 
+            'vac',
+            'kwh',
+            'kwh_3dp',
+            }
+    writer_plan = []
+    for field in header_fields:
+        field_rec = field_dict[field]
+        if field_rec['format'] == 'str':
+            writer_plan.append(
+                    (
+                        field,
+                        field_rec['col'],
+                        worksheet.write_string,
+                        format_dict[field_rec['format']],
+                        ''
+                        )
+                    )
+
+        elif field_rec['format'] in number_format_set:
+            # missing values are skipped
+            writer_plan.append(
+                    (
+                        field,
+                        field_rec['col'],
+                        worksheet.write_number,
+                        format_dict[field_rec['format']],
+                        None
+                        )
+                    )
+
+        # unknown field formats are skipped
+
     # Populate Rows in sorted order
+    # in low memory mode, the written cells are not retained 
+    # so the chart category values are tracked separately
+    category_list = []
     row = 0
     for key in key_list:
         rec = data_dict[key]
         row += 1
 
-        for field in header_fields:
-            field_rec = field_dict[field]
-            # write string
-            if field_rec['format'] == 'str':
-                # use present value or empty string
-                if field in rec:
-                    value = rec[field]
-                else:
-                    value = ''
-
-                worksheet.write_string(
-                        row,
-                        field_rec['col'],
-                        value,
-                        format_dict[field_rec['format']])
-    
-            # write number
-            elif field_rec['format'] in [
-                    'integer', 
-                    'float', 
-                    'currency_4dp', 
-                    'currency_2dp', 
-                    'percent', 
-                    'vac',
-                    'kwh',
-                    'kwh_3dp']:
-                if field in rec:
-                    value = rec[field]
-                    worksheet.write_number(
-                            row,
-                            field_rec['col'],
-                            value,
-                            format_dict[field_rec['format']])
-            else:
-                # unknown field format
-                # skipped
-                pass
+        if low_memory:
+            category_list.append(rec[first_field])
 
         # auto-hide row for filtered scenario
         # applies only if the given row's filter field value
         # is not in the filter value list
+        # Set ahead of the row cells so that rows are written 
+        # strictly in order for the low memory mode
         if (filtered_field and 
-            not rec[filtered_field] in filter_key_list):
+            not rec[filtered_field] in filter_key_set):
             worksheet.set_row(row, options={"hidden": True})
 
+        # write cells via the compiled plan
+        # missing numeric fields are left empty
+        for field, col, writer, cell_format, default in writer_plan:
+            value = rec.get(field, default)
+            if value is None:
+                continue
+
+            writer(
+                    row,
+                    col,
+                    value,
+                    cell_format)
+
     # Charts
     if not chart_list:
         return
@@ -379,6 +380,12 @@ def add_worksheet(
                     'categories': [sheet_title, 1, 0, row, 0],
                     'values': [sheet_title, 1, field_rec['col'], row, field_rec['col']],
                     }
+
+            # category cache for low memory mode
+            # otherwise taken from the written cells 
+            if low_memory:
+                series_dict['categories_data'] = category_list
+
             # optional series colour
             if 'colour' in series_rec:
                 series_dict['line'] = {'color': series_rec['colour']}
@@ -424,13 +431,13 @@ def load_data(
     start_dt = None
     end_dt = None
     if start_date:
-        start_ts, start_dt = parse_range_time(
+        start_ts, start_dt = time_utils.parse_range_time(
                 start_date,
                 timezone,
                 end = False)
     
     if end_date:
-        end_ts, end_dt = parse_range_time(
+        end_ts, end_dt = time_utils.parse_range_time(
                 end_date,
                 timezone,
                 end = True)
@@ -453,7 +460,13 @@ def load_data(
     vat_factor = 1 + (vat_rate / 100)
 
     # tariff intervals
-    tarff_interval_dict = {}
+    # compiled as a single plan covering all days
+    # intervals for unknown tariff names are ignored
+    plan = tariff_utils.new_plan(
+            'Tariffs',
+            '0001-01-01',
+            '9999-12-31')
+    tariffs = None
     if interval_list:
         for interval_str in interval_list:
 
@@ -492,114 +505,101 @@ def load_data(
                 # FIXME needs more advanced error handling
                 continue
 
-            for day in days:
-                # Initialise day
-                if not day in tarff_interval_dict:
-                    tarff_interval_dict[day] = {}
-
-                if start_hh == end_hh:
-                    # single xx:xx range (full 24 hours)
-                    for i in range(0, 24):
-                        tarff_interval_dict[day][i] = tariff_name
-                else:
-                    hh = start_hh
-                    while hh != end_hh:
-                        if tariff_name in tariff_dict:
-                            tarff_interval_dict[day][hh] = tariff_name
-                        hh = (hh + 1) % 24
+            if tariff_name in tariff_dict:
+                tariff_utils.set_plan_tariff(
+                        plan,
+                        days,
+                        start_hh,
+                        end_hh,
+                        tariff_name,
+                        tariff_dict[tariff_name])
+
+        tariffs = tariff_utils.compile_tariffs([plan])
         log_message(
                 verbose,
                 'Tariff Intervals: %s' % (
                     json.dumps(
-                        tarff_interval_dict, 
+                        tariffs, 
                         indent = 4)
                     )
                 )
     
-        for day in [1,2,3,4,5,6,7]:
-            if not day in tarff_interval_dict:
+        missing_dict = tariff_utils.get_missing_hours(plan)
+        for day in missing_dict:
+            if len(missing_dict[day]) == 24:
                 log_message(
                         1,
                         'WARNING: Tariff interval data not present for day %d' % (
                             day)   
                         )
-        for day in tarff_interval_dict.keys():
-            if len(tarff_interval_dict[day]) != 24:
+            else:
                 log_message(
                         1,
                         'WARNING: Tariff interval data present for only %d/24 hours in day %d' % (
-                            len(tarff_interval_dict[day]),
+                            24 - len(missing_dict[day]),
                             day)   
                         )
 
     # load all data
     data_dict = {}
     file_count = 0
-    for filename in os.listdir(idir):
-        # only loading .jsonl files
-        if not filename.endswith('.jsonl'):
-            continue
-    
+    for full_path in energy_store.list_data_files(
+            idir,
+            start_ts,
+            end_ts):
+        # JSONL day files and columnar month files
+        # files outside the start/end range are 
+        # already skipped by name
         file_count += 1
-        full_path = '%s/%s' % (idir, filename)
-        with open(full_path) as fp:
-            for line in fp:
-                rec = json.loads(line)
-    
-                # skip records if out of range
-                # FIXME probably could also include skipping of 
-                # full files based on name
-                if (start_ts and 
-                    rec['ts'] < start_ts):
-                    continue
-    
-                if (end_ts and 
-                    rec['ts'] > end_ts):
-                    continue
+
+        # records are already restricted to the 
+        # start/end range
+        for rec in energy_store.iter_file_records(
+                full_path,
+                start_ts,
+                end_ts):
     
-                # store keyed on ts field
-                data_dict[rec['ts']] = rec
-
-                # populate time keys from parsed ts
-                dt_ref = datetime.datetime.fromtimestamp(
-                        rec['ts'], 
-                        tz = zoneinfo.ZoneInfo(time_zone))
-
-                rec['hour'] = dt_ref.hour
-                rec['day'] = '%04d-%02d-%02d' % (
-                  dt_ref.year, 
-                  dt_ref.month, 
-                  dt_ref.day)
-                rec['month'] = '%04d-%02d' % (
-                  dt_ref.year, 
-                  dt_ref.month) 
-                rec['year'] = '%04d' %(
-                  dt_ref.year)
-                rec['weekday'] = dt_ref.strftime('%u %a')
-                rec['week'] = dt_ref.strftime('%Y-%W')
-
-                # tariff calculation based on week day number and hour
-                dt_weekday = int(dt_ref.strftime('%u'))
-                dt_hour = rec['hour']
-
-                # Import Tariff and charging rates
-                if (dt_weekday in tarff_interval_dict and 
-                    dt_hour in tarff_interval_dict[dt_weekday]):
-                    rec['tariff_name'] = tarff_interval_dict[dt_weekday][dt_hour]
-                    rec['tariff_rate'] = tariff_dict[rec['tariff_name']]
-
-                # VAT adjustment
-                rate_field_list = [
-                        'da_kwh_rate', 
-                        'ida1_kwh_rate', 
-                        'ida2_kwh_rate', 
-                        'ida3_kwh_rate', 
-                        'final_kwh_rate'
-                        ]
-
-                for rate_field in rate_field_list:
-                    if rate_field in rec:
-                        rec[rate_field] = rec[rate_field] * vat_factor
+            # store keyed on ts field
+            data_dict[rec['ts']] = rec
+
+            # populate time keys from parsed ts
+            dt_ref = time_utils.epoch_to_local(
+                    rec['ts'], 
+                    time_zone)
+
+            rec['hour'] = dt_ref.hour
+            (rec['day'], 
+             rec['month'], 
+             rec['year'], 
+             rec['weekday'], 
+             rec['week']) = time_utils.get_day_keys(
+                     dt_ref.year, 
+                     dt_ref.month, 
+                     dt_ref.day)
+
+            # tariff calculation based on week day number and hour
+            # Import Tariff and charging rates
+            if tariffs:
+                tariff = tariff_utils.get_tariff(
+                        tariffs,
+                        0,
+                        dt_ref.isoweekday(),
+                        rec['hour'])
+                if tariff:
+                    rec['tariff_name'], rec['tariff_rate'] = tariff
+
+            # VAT adjustment
+            rate_field_list = [
+                    'da_kwh_rate', 
+                    'ida1_kwh_rate', 
+                    'ida2_kwh_rate', 
+                    'ida3_kwh_rate', 
+                    'final_kwh_rate'
+                    ]
+
+            for rate_field in rate_field_list:
+                if rate_field in rec:
+                    rec[rate_field] = rec[rate_field] * vat_factor
 
     log_message(
             1,
@@ -677,6 +677,12 @@ parser.add_argument(
         required = False
         )
 
+parser.add_argument(
+        '--low_memory', 
+        help = 'Stream worksheet rows to disk to reduce memory usage', 
+        action = 'store_true'
+        )
+
 parser.add_argument(
         '--verbose', 
         help = 'Enable verbose output', 
@@ -692,6 +698,8 @@ parser.add_argument(
         default = []
         )
 
+perf_utils.add_arguments(parser)
+
 args = vars(parser.parse_args())
 report_file_name = args['file']
 tariff_list = args['tariff_rate']
@@ -703,8 +711,11 @@ end_date = args['end']
 timezone = args['timezone']
 currency_symbol = args['currency']
 hide_column_list = args['hide_columns']
+low_memory = args['low_memory']
 verbose = args['verbose']
 
+perf_utils.start(args)
+
 # populate hidden boolean into field dict
 for column_key in hide_column_list:
     if column_key in field_dict:
@@ -717,6 +728,7 @@ log_message(
             )
         )
 
+perf_utils.start_stage('load')
 data_dict = load_data(
         idir,
         start_date,
@@ -725,9 +737,22 @@ data_dict = load_data(
         tariff_list,
         interval_list,
         vat_rate)
+perf_utils.end_stage('load')
+perf_utils.count('records', len(data_dict))
+
+perf_utils.start_stage('write')
 
 # XLSX
-workbook = xlsxwriter.Workbook(report_file_name)
+# low memory mode uses xlsxwriter's constant_memory 
+# option where each row is flushed to a temp file once
+# the next row is started
+workbook_options = {}
+if low_memory:
+    workbook_options['constant_memory'] = True
+
+workbook = xlsxwriter.Workbook(
+        report_file_name,
+        workbook_options)
 
 # try to reconstruct the command line 
 # options to capture in the properties
@@ -866,3 +891,4 @@ add_worksheet(
         )
 
 workbook.close()
+perf_utils.end_stage('write')
@@ -0,0 +1,287 @@
+import argparse
+import atexit
+import collections
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+
+# optional resource module for peak memory (not on Windows)
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Shared run instrumentation for the CLI scripts.
+# Named stages (load, parse, cost, aggregate, write etc)
+# are timed with start_stage()/end_stage() and can be
+# entered more than once with the times added up. Record
+# counters are kept per name. The peak resident memory
+# is sampled at the end of each stage.
+#
+# add_arguments() adds the --timings and --profile options
+# to a script and start() then enables them. The timing
+# summary is printed when the script exits, either as a
+# readable table or as a single JSON line for cron jobs
+# and the benchmark script.
+#
+# start() should only be called in the main process of
+# scripts that use worker processes
+
+# script name, start time and options
+run_dict = {
+        'script' : os.path.basename(sys.argv[0]),
+        'start_time' : time.perf_counter(),
+        'timings' : None,
+        'profile' : None,
+        'profile_format' : None,
+        }
+
+# stage name -> {'elapsed', 'calls', 'peak_rss_kb'}
+# in the order first started
+stage_dict = {}
+
+# stage name -> start time of the stages in progress
+active_stage_dict = {}
+
+# counter name -> count
+counter_dict = collections.OrderedDict()
+
+# sampling interval for the stack profile (seconds)
+stack_sample_interval = 0.005
+
+
+def get_peak_rss_kb() -> int | None:
+
+    # peak resident memory of this process in KB
+    # ru_maxrss is KB on Linux and bytes on macOS
+    if resource is None:
+        return None
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak_rss //= 1024
+
+    return peak_rss
+
+
+def start_stage(
+        name: str) -> None:
+
+    active_stage_dict[name] = time.perf_counter()
+    if not name in stage_dict:
+        stage_dict[name] = {
+                'elapsed' : 0,
+                'calls' : 0,
+                'peak_rss_kb' : None,
+                }
+
+    return
+
+
+def end_stage(
+        name: str) -> float:
+
+    # ends the stage adding to its total time
+    # returns the elapsed time of this call
+    elapsed = time.perf_counter() - active_stage_dict.pop(name)
+    stage_rec = stage_dict[name]
+    stage_rec['elapsed'] += elapsed
+    stage_rec['calls'] += 1
+    stage_rec['peak_rss_kb'] = get_peak_rss_kb()
+
+    return elapsed
+
+
+def count(
+        name: str,
+        num: int = 1) -> None:
+
+    counter_dict[name] = counter_dict.get(name, 0) + num
+
+    return
+
+
+def get_summary() -> dict:
+
+    # timing summary for the run so far
+    elapsed = time.perf_counter() - run_dict['start_time']
+
+    summary_stage_dict = {}
+    for name, stage_rec in stage_dict.items():
+        summary_stage_dict[name] = {
+                'elapsed' : round(stage_rec['elapsed'], 4),
+                'calls' : stage_rec['calls'],
+                'peak_rss_kb' : stage_rec['peak_rss_kb'],
+                }
+
+    # record rate for each counter over the full run
+    rate_dict = {}
+    for name, num in counter_dict.items():
+        rate_dict[name] = round(num / elapsed) if elapsed > 0 else 0
+
+    return {
+            'script' : run_dict['script'],
+            'elapsed' : round(elapsed, 4),
+            'peak_rss_kb' : get_peak_rss_kb(),
+            'stages' : summary_stage_dict,
+            'counters' : dict(counter_dict),
+            'rates' : rate_dict,
+            }
+
+
+def format_summary(
+        summary: dict) -> str:
+
+    # readable table of the timing summary
+    line_list = [
+            'Timings for %s.. %.3fs%s' % (
+                summary['script'],
+                summary['elapsed'],
+                (', peak RSS %d MB' % (summary['peak_rss_kb'] // 1024)
+                 if summary['peak_rss_kb'] else '')
+                )
+            ]
+
+    for name, stage_rec in summary['stages'].items():
+        line_list.append(
+                '  %-20s %10.3fs %6d calls %8s MB' % (
+                    name,
+                    stage_rec['elapsed'],
+                    stage_rec['calls'],
+                    (stage_rec['peak_rss_kb'] // 1024
+                     if stage_rec['peak_rss_kb'] else '-'))
+                )
+
+    for name, num in summary['counters'].items():
+        line_list.append(
+                '  %-20s %10d (%d/s)' % (
+                    name,
+                    num,
+                    summary['rates'][name])
+                )
+
+    return '\n'.join(line_list)
+
+
+def print_summary() -> None:
+
+    summary = get_summary()
+    if run_dict['timings'] == 'json':
+        print(json.dumps(summary))
+    else:
+        print(format_summary(summary))
+    sys.stdout.flush()
+
+    return
+
+
+def start_stack_sampler() -> None:
+
+    # samples the main thread stack at a fixed interval
+    # and counts each distinct stack. Written at exit as
+    # folded stacks (one 'frame;frame;frame count' line per
+    # stack) as used by flamegraph.pl and speedscope
+    stack_count_dict = collections.Counter()
+    main_thread_id = threading.main_thread().ident
+    run_dict['stack_count_dict'] = stack_count_dict
+
+    def sample_stacks():
+        while True:
+            time.sleep(stack_sample_interval)
+            frame = sys._current_frames().get(main_thread_id)
+            frame_list = []
+            while frame:
+                code = frame.f_code
+                frame_list.append(
+                        '%s:%s' % (
+                            os.path.basename(code.co_filename),
+                            code.co_name))
+                frame = frame.f_back
+            if frame_list:
+                stack_count_dict[';'.join(reversed(frame_list))] += 1
+
+    sampler_thread = threading.Thread(
+            target = sample_stacks,
+            daemon = True)
+    sampler_thread.start()
+
+    return
+
+
+def write_profile() -> None:
+
+    profile_file = run_dict['profile']
+    if run_dict['profile_format'] == 'stacks':
+        stack_count_dict = dict(run_dict['stack_count_dict'])
+        with open(profile_file, 'w') as f:
+            for stack in sorted(stack_count_dict.keys()):
+                f.write('%s %d\n' % (stack, stack_count_dict[stack]))
+    else:
+        profiler = run_dict['profiler']
+        profiler.disable()
+        profiler.dump_stats(profile_file)
+
+    print(
+            '%s Profile written to %s' % (
+                time.asctime(),
+                profile_file)
+            )
+
+    return
+
+
+def add_arguments(
+        parser: argparse.ArgumentParser) -> None:
+
+    # common instrumentation options
+    parser.add_argument(
+            '--timings',
+            help = 'Print stage timings at exit (text or json)',
+            choices = ['text', 'json'],
+            required = False
+            )
+
+    parser.add_argument(
+            '--profile',
+            help = 'Write a profile of the run to the given file',
+            required = False
+            )
+
+    parser.add_argument(
+            '--profile_format',
+            help = 'Profile format (def cprofile), stacks writes folded stacks for flame graphs',
+            choices = ['cprofile', 'stacks'],
+            default = 'cprofile',
+            required = False
+            )
+
+    return
+
+
+def start(
+        args: dict) -> None:
+
+    # enables the timing summary and profile
+    # selected in the parsed arguments
+    run_dict['timings'] = args.get('timings')
+    run_dict['profile'] = args.get('profile')
+    run_dict['profile_format'] = args.get('profile_format')
+
+    # exit handlers run in reverse order so the profile
+    # is stopped before the summary is printed
+    if run_dict['timings']:
+        atexit.register(print_summary)
+
+    if run_dict['profile']:
+        if run_dict['profile_format'] == 'stacks':
+            start_stack_sampler()
+        else:
+            run_dict['profiler'] = cProfile.Profile()
+            run_dict['profiler'].enable()
+        atexit.register(write_profile)
+
+    return
@@ -4,9 +4,9 @@ import json
 import os
 import time
 import datetime
-import dateutil.parser
-import zoneinfo
 import sys
+import time_utils
+import energy_store
 
 
 def log_message(
@@ -31,13 +31,13 @@ def parse_semopx_time(
     # Parse SEMOpx UTC time to DT
     # this has a "Z" inicator the parse will corectly
     # assert a UTC timezone
-    utc_dt = dateutil.parser.parse(datetime_str)
+    utc_dt = time_utils.parse_iso_time(datetime_str)
 
     # convert go epoch as God intended
     time_stamp = int(utc_dt.timestamp())
 
     # Localise to specified local timezone
-    local_dt = utc_dt.astimezone(zoneinfo.ZoneInfo(timezone))
+    local_dt = utc_dt.astimezone(time_utils.get_zone(timezone))
 
     # return both values
     return time_stamp, local_dt
@@ -47,7 +47,8 @@ def retrieve_market_results(
         odir: str, 
         days: int,
         market_area: str,
-        timezone: str) -> None:
+        timezone: str,
+        data_format: str) -> None:
 
     global gv_verbose
 
@@ -160,57 +161,55 @@ def retrieve_market_results(
         report_count += 1
         report = report_dict[key]
 
-        # JSON output file
-        json_filename = '%s/%s.jsonl' % (odir, report['date'])
+        # output file (day file or columnar month file)
+        json_filename = energy_store.get_day_file(
+                odir, 
+                report['date'], 
+                data_format)
 
         # check for complete data sets
-        if os.path.exists(json_filename):
-            # load file into dict
-            with open(json_filename, 'r') as f:
-                # parse into dict
-                rec_dict = {}
-                for line in f:
-                    rec = json.loads(line)
-                    ts = rec['ts']
-                    rec_dict[ts] = rec
-
-                da_present = False
-                ida1_present = False
-                ida2_present = False
-                ida3_present = False
-
-                for ts in rec_dict:
-                    rec = rec_dict[ts]
-                    if 'da_kwh_rate' in rec:
-                        da_present = True
-                    if 'ida1_kwh_rate' in rec:
-                        ida1_present = True
-                    if 'ida2_kwh_rate' in rec:
-                        ida2_present = True
-                    if 'ida3_kwh_rate' in rec:
-                        ida3_present = True
-
-                log_message(gv_verbose,
-                            'Checks: filename:%s DA:%s IDA1:%s IDA2:%s IDA3:%s' % (
-                                json_filename,
-                                da_present,
-                                ida1_present,
-                                ida2_present,
-                                ida3_present
-                                )
+        rec_dict = energy_store.read_day_records(
+                odir, 
+                report['date'], 
+                data_format)
+        if rec_dict:
+            da_present = False
+            ida1_present = False
+            ida2_present = False
+            ida3_present = False
+
+            for ts in rec_dict:
+                rec = rec_dict[ts]
+                if 'da_kwh_rate' in rec:
+                    da_present = True
+                if 'ida1_kwh_rate' in rec:
+                    ida1_present = True
+                if 'ida2_kwh_rate' in rec:
+                    ida2_present = True
+                if 'ida3_kwh_rate' in rec:
+                    ida3_present = True
+
+            log_message(gv_verbose,
+                        'Checks: filename:%s DA:%s IDA1:%s IDA2:%s IDA3:%s' % (
+                            json_filename,
+                            da_present,
+                            ida1_present,
+                            ida2_present,
+                            ida3_present
                             )
+                        )
 
-                # complete record has data from all auctions
-                if (da_present and 
-                    ida1_present and
-                    ida2_present and
-                    ida3_present):
-                    log_message(
-                            gv_verbose,
-                            'Skipping %s (cached)' % (json_filename)
-                            )
-                    skip_count += 1
-                    continue
+            # complete record has data from all auctions
+            if (da_present and 
+                ida1_present and
+                ida2_present and
+                ida3_present):
+                log_message(
+                        gv_verbose,
+                        'Skipping %s (cached)' % (json_filename)
+                        )
+                skip_count += 1
+                continue
 
         # 1-sec delay between API calls
         time.sleep(1)
@@ -323,7 +322,7 @@ def retrieve_market_results(
                 # next :30 timestamp and datetime
                 next_ts = ts + 1800
                 utc_dt = datetime.datetime.fromtimestamp(next_ts, datetime.UTC)
-                next_dt = utc_dt.astimezone(zoneinfo.ZoneInfo(timezone))
+                next_dt = utc_dt.astimezone(time_utils.get_zone(timezone))
 
                 if next_ts in rec_dict:
                     next_rec = rec_dict[next_ts]
@@ -361,10 +360,10 @@ def retrieve_market_results(
                     json_filename
                     )
                 )
-        with open(json_filename, 'w') as f:
-            for ts in sorted(rec_dict.keys()):
-                rec = rec_dict[ts]
-                f.write(json.dumps(rec) + '\n')
+        energy_store.write_days(
+                odir,
+                {report['date']: rec_dict},
+                data_format)
 
     log_message(
             1,
@@ -417,6 +416,14 @@ parser.add_argument(
         required = False
         )
 
+parser.add_argument(
+        '--format', 
+        help = 'Output data format (def jsonl)', 
+        default = 'jsonl',
+        choices = energy_store.data_format_list,
+        required = False
+        )
+
 parser.add_argument(
         '--verbose', 
         help = 'Enable verbose output', 
@@ -428,14 +435,11 @@ odir = args['odir']
 backfill_days = args['days']
 market_area = args['market']
 timezone = args['timezone']
+data_format = args['format']
 gv_verbose = args['verbose']
 
-# JSON encoder force decimal places to 4
-class RoundingFloat(float):
-    __repr__ = staticmethod(lambda x: format(x, '.4f'))
-
-json.encoder.c_make_encoder = None
-json.encoder.float = RoundingFloat
+# JSONL writer decimal places forced to 4
+energy_store.set_decimal_places(4)
 
 if not os.path.exists(odir):
     os.mkdir(odir)
@@ -444,5 +448,6 @@ retrieve_market_results(
         odir = odir,
         days = backfill_days,
         market_area = market_area,
-        timezone = timezone)
+        timezone = timezone,
+        data_format = data_format)
 
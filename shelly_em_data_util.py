@@ -4,8 +4,8 @@ import json
 import os
 import time
 import datetime
-import dateutil.parser
-import zoneinfo
+import time_utils
+import energy_store
 
 
 def log_message(
@@ -27,17 +27,11 @@ def parse_time(
         datetime_str: str,
         timezone: str) -> tuple[int, datetime.datetime]:
 
-    # naive parse
-    dt = dateutil.parser.parse(datetime_str)
-
-    # assert local timezone
-    dt = dt.replace(tzinfo = zoneinfo.ZoneInfo(timezone))
-
-    # convert go epoch as God intended
-    time_stamp = int(dt.timestamp())
-
-    # return both values
-    return time_stamp, dt
+    # naive parse and assert local timezone
+    # ISO timestamps take the fast path
+    return time_utils.parse_local_time(
+            datetime_str,
+            timezone)
 
 
 def get_day_data(
@@ -48,7 +42,8 @@ def get_day_data(
         grid_scale_factor: int,
         pv_kwh_discard: float,
         date_ref: datetime.date,
-        odir: str) -> None: 
+        odir: str,
+        data_format: str) -> None: 
 
     global gv_verbose
 
@@ -77,23 +72,26 @@ def get_day_data(
             date_ref.month, 
             date_ref.day) 
 
-    dest_jsonl_file = '%s/%s.jsonl' % (
+    dest_jsonl_file = energy_store.get_day_file(
             odir,
-            dest_file_prefix) 
+            dest_file_prefix,
+            data_format) 
 
     # default behaviour is to report 
     # as a standard write
     write_context = 'Writing'
 
-    # Check if the target file exists
-    if os.path.exists(dest_jsonl_file):
+    # Check if the target day exists
+    existing_dict = energy_store.read_day_records(
+            odir,
+            dest_file_prefix,
+            data_format)
+    if existing_dict:
         # file already exists.. only download if partial
         # property present in first record
 
         # get first record
-        fp = open(dest_jsonl_file)
-        line = fp.readline()
-        rec = json.loads(line)
+        rec = existing_dict[min(existing_dict.keys())]
 
         # rec will have partial property if it 
         # was a partial read
@@ -263,9 +261,10 @@ def get_day_data(
                 dest_jsonl_file
                 )
             )
-    with open(dest_jsonl_file, 'w') as f:
-        for key in sorted(data_dict.keys()):
-            f.write(json.dumps(data_dict[key]) + '\n')
+    energy_store.write_days(
+            odir,
+            {dest_file_prefix: data_dict},
+            data_format)
 
     return
 
@@ -336,6 +335,14 @@ parser.add_argument(
         required = True
         )
 
+parser.add_argument(
+        '--format', 
+        help = 'Output data format (def jsonl)', 
+        default = 'jsonl',
+        choices = energy_store.data_format_list,
+        required = False
+        )
+
 parser.add_argument(
         '--verbose', 
         help = 'Enable verbose output', 
@@ -351,14 +358,11 @@ pv_device_id = args['pv_id']
 grid_scale_factor = args['grid_scale_factor']
 pv_kwh_discard = args['pv_kwh_discard']
 auth_key = args['auth_key']
+data_format = args['format']
 gv_verbose = args['verbose']
 
-# JSON encoder force decimal places to 5
-class RoundingFloat(float):
-    __repr__ = staticmethod(lambda x: format(x, '.5f'))
-
-json.encoder.c_make_encoder = None
-json.encoder.float = RoundingFloat
+# JSONL writer decimal places forced to 5
+energy_store.set_decimal_places(5)
 
 if not os.path.exists(odir):
     os.mkdir(odir)
@@ -376,7 +380,8 @@ for i in range(0, backfill_days):
             grid_scale_factor = grid_scale_factor,
             pv_kwh_discard = pv_kwh_discard,
             date_ref = date_ref,
-            odir = odir)
+            odir = odir,
+            data_format = data_format)
 
     # move back to previous day
     date_ref = date_ref - datetime.timedelta(days = 1)
@@ -6,8 +6,6 @@ import sys
 import traceback
 import time
 import datetime
-import dateutil.parser
-import zoneinfo
 import random
 import copy
 import utils
@@ -50,10 +48,10 @@ def parse_time(
     """
 
     # naive parse
-    dt = dateutil.parser.parse(datetime_str)
+    dt = utils.parse_iso_time(datetime_str)
 
     # assert local timezone
-    dt = dt.replace(tzinfo = zoneinfo.ZoneInfo(timezone))
+    dt = dt.replace(tzinfo = utils.get_zone(timezone))
 
     # convert go epoch as God intended
     time_stamp = int(dt.timestamp())
@@ -8,6 +8,7 @@ import time
 import datetime
 import dateutil.parser
 import zoneinfo
+import functools
 
 # global tracker for verbose logging
 gv_verbose = 0
@@ -52,3 +53,34 @@ def wrap_exceptions(fn):
             raise Exception(exception_str)  
 
     return wrapper 
+
+
+@functools.lru_cache(maxsize = None)
+def get_zone(timezone):
+    """
+    Memoized zoneinfo lookup
+
+    Args:
+    timezone    - timezone name
+
+    Returns: ZoneInfo object
+    """
+
+    return zoneinfo.ZoneInfo(timezone)
+
+
+def parse_iso_time(datetime_str):
+    """
+    Naive or aware parse of a timestamp string. ISO formats are 
+    parsed natively with dateutil as the fallback for anything else.
+
+    Args:
+    datetime_str    - date string to be parsed
+
+    Returns: parsed datetime object
+    """
+
+    try:
+        return datetime.datetime.fromisoformat(datetime_str)
+    except ValueError:
+        return dateutil.parser.parse(datetime_str)
@@ -4,8 +4,8 @@ import json
 import os
 import time
 import datetime
-import dateutil.parser
-import zoneinfo
+import time_utils
+import energy_store
 import hmac
 import hashlib
 import base64
@@ -28,19 +28,13 @@ def log_message(
 
 def parse_time(
         datetime_str: str,
-        timezone: str) -> tuple:
+        timezone: str) -> tuple[int, datetime.datetime]:
 
-    # naive parse
-    dt = dateutil.parser.parse(datetime_str)
-
-    # assert local timezone
-    dt = dt.replace(tzinfo = zoneinfo.ZoneInfo(timezone))
-
-    # convert go epoch as God intended
-    time_stamp = int(dt.timestamp())
-
-    # return both values
-    return time_stamp, dt
+    # naive parse and assert local timezone
+    # ISO timestamps take the fast path
+    return time_utils.parse_local_time(
+            datetime_str,
+            timezone)
 
 
 def get_hours_in_day(
@@ -48,10 +42,10 @@ def get_hours_in_day(
         timezone: str) -> int:
 
     # naive parse of our datetime field
-    dt = datetime.datetime.strptime(datetime_str, '%Y/%m/%d %H:%M:%S')
+    dt = time_utils.parse_fixed_time(datetime_str, '%Y/%m/%d %H:%M:%S')
 
     # assert local timezone
-    dt = dt.replace(tzinfo = zoneinfo.ZoneInfo(timezone))
+    dt = dt.replace(tzinfo = time_utils.get_zone(timezone))
 
     # reset to current day midnight
     # and get dt for the next day 
@@ -461,7 +455,8 @@ def get_day_data(
         solis_ac_phase: int,
         shelly_api_host: str,
         shelly_auth_key: str,
-        shelly_device_id: str) -> None:
+        shelly_device_id: str,
+        data_format: str) -> None:
 
     # local jsonl file
     dest_file_prefix = '%04d-%02d-%02d' % (
@@ -469,23 +464,26 @@ def get_day_data(
             date_ref.month, 
             date_ref.day) 
 
-    dest_jsonl_file = '%s/%s.jsonl' % (
+    dest_jsonl_file = energy_store.get_day_file(
             odir,
-            dest_file_prefix) 
+            dest_file_prefix,
+            data_format) 
 
     # default behaviour is to report 
     # as a standard write
     write_context = 'Writing'
 
-    # Check if the target file exists
-    if os.path.exists(dest_jsonl_file):
+    # Check if the target day exists
+    existing_dict = energy_store.read_day_records(
+            odir,
+            dest_file_prefix,
+            data_format)
+    if existing_dict:
         # file already exists.. only overwrite if partial
         # property present in first record
 
         # get first record
-        fp = open(dest_jsonl_file)
-        line = fp.readline()
-        rec = json.loads(line)
+        rec = existing_dict[min(existing_dict.keys())]
 
         # rec will have partial property if it 
         # was a partial read
@@ -596,9 +594,10 @@ def get_day_data(
                 dest_jsonl_file
                 )
             )
-    with open(dest_jsonl_file, 'w') as f:
-        for key in sorted(solis_dict.keys()):
-            f.write(json.dumps(solis_dict[key]) + '\n')
+    energy_store.write_days(
+            odir,
+            {dest_file_prefix: solis_dict},
+            data_format)
 
     return
 
@@ -695,6 +694,14 @@ parser.add_argument(
         required = False
         )
 
+parser.add_argument(
+        '--format', 
+        help = 'Output data format (def jsonl)', 
+        default = 'jsonl',
+        choices = energy_store.data_format_list,
+        required = False
+        )
+
 parser.add_argument(
         '--verbose', 
         help = 'Enable verbose output', 
@@ -714,14 +721,11 @@ solis_ac_phase = args['solis_ac_phase']
 shelly_api_host = args['shelly_api_host']
 shelly_device_id = args['shelly_device_id']
 shelly_auth_key = args['shelly_auth_key']
+data_format = args['format']
 gv_verbose = args['verbose']
 
-# JSON encoder force decimal places to 5
-class RoundingFloat(float):
-    __repr__ = staticmethod(lambda x: format(x, '.5f'))
-
-json.encoder.c_make_encoder = None
-json.encoder.float = RoundingFloat
+# JSONL writer decimal places forced to 5
+energy_store.set_decimal_places(5)
 
 if not os.path.exists(odir):
     os.mkdir(odir)
@@ -743,7 +747,8 @@ for i in range(0, backfill_days):
             solis_ac_phase,
             shelly_api_host,
             shelly_auth_key,
-            shelly_device_id)
+            shelly_device_id,
+            data_format)
 
     # move back to previous day
     date_ref = date_ref - datetime.timedelta(days = 1)
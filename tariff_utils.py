@@ -0,0 +1,349 @@
+import bisect
+import datetime
+import json
+import energy_store
+
+
+# Compiled tariff plans shared by the report scripts.
+# Each plan holds a dense rate table and tariff name index
+# table with a slot per weekday and hour (7 x 24). Tariff
+# names are interned in a single list for all plans.
+# Plan date ranges are held as a sorted list of
+# non-overlapping day intervals so that the plan for a
+# given day is found with a binary search. Where plan date
+# ranges overlap, the earlier plan in the list wins.
+
+# weekday/hour slots in a plan
+num_slots = 7 * 24
+
+
+def get_slot(
+        weekday: int,
+        hour: int) -> int:
+
+    # slot for ISO weekday (1-7) and hour (0-23)
+    return (weekday - 1) * 24 + hour
+
+
+def new_plan(
+        name: str,
+        start: str,
+        end: str,
+        standing_rate: float = 0,
+        fit_rate: float = 0) -> dict:
+
+    # empty plan covering the inclusive YYYY-MM-DD
+    # start/end range with no tariffs set
+    return {
+            'name' : name,
+            'start' : start,
+            'end' : end,
+            'standing_rate' : standing_rate,
+            'fit_rate' : fit_rate,
+            'rate_list' : [None] * num_slots,
+            'tariff_list' : [None] * num_slots,
+            }
+
+
+def set_plan_tariff(
+        plan: dict,
+        days: list,
+        start_hh: int,
+        end_hh: int,
+        tariff_name: str,
+        rate: float) -> None:
+
+    # sets the tariff for the given weekdays from start hour
+    # up to but not including the end hour, wrapping
+    # around midnight. The same start and end hour
+    # covers the full 24 hours
+    # Later calls override earlier ones
+    if start_hh == end_hh:
+        hour_list = list(range(0, 24))
+    else:
+        hour_list = []
+        hh = start_hh
+        while hh != end_hh:
+            hour_list.append(hh)
+            hh = (hh + 1) % 24 # 0-23 modulo
+
+    for day in days:
+        for hh in hour_list:
+            slot = get_slot(day, hh)
+            plan['rate_list'][slot] = rate
+            plan['tariff_list'][slot] = tariff_name
+
+    return
+
+
+def get_missing_hours(
+        plan: dict) -> dict:
+
+    # weekday -> list of hours with no tariff set
+    missing_dict = {}
+    for day in range(1, 8):
+        for hh in range(0, 24):
+            if plan['tariff_list'][get_slot(day, hh)] is None:
+                if not day in missing_dict:
+                    missing_dict[day] = []
+                missing_dict[day].append(hh)
+
+    return missing_dict
+
+
+def add_day(
+        day: str,
+        num_days: int) -> str:
+
+    # YYYY-MM-DD offset by the given number of days
+    return (datetime.date.fromisoformat(day) +
+            datetime.timedelta(days = num_days)).isoformat()
+
+
+def compile_tariffs(
+        plan_list: list) -> dict:
+
+    # compiles a list of plans into the shared lookup form
+    # {
+    #   'plan_list' : [{'name', 'start', 'end', 'standing_rate',
+    #                   'fit_rate', 'rate_list', 'name_index_list'}],
+    #   'name_list' : interned tariff names,
+    #   'start_list', 'end_list', 'index_list' : sorted
+    #       non-overlapping day intervals and their plan index
+    # }
+    # unset slots have a None rate and -1 name index
+    name_list = []
+    name_index_dict = {}
+    compiled_plan_list = []
+    interval_list = []
+
+    for plan_index, plan in enumerate(plan_list):
+        name_index_list = []
+        for tariff_name in plan['tariff_list']:
+            if tariff_name is None:
+                name_index_list.append(-1)
+                continue
+
+            if not tariff_name in name_index_dict:
+                name_index_dict[tariff_name] = len(name_list)
+                name_list.append(tariff_name)
+            name_index_list.append(name_index_dict[tariff_name])
+
+        compiled_plan_list.append(
+                {
+                    'name' : plan['name'],
+                    'start' : plan['start'],
+                    'end' : plan['end'],
+                    'standing_rate' : plan['standing_rate'],
+                    'fit_rate' : plan['fit_rate'],
+                    'rate_list' : list(plan['rate_list']),
+                    'name_index_list' : name_index_list,
+                    }
+                )
+
+        # intervals for the parts of the plan date range
+        # not already covered by an earlier plan
+        start = plan['start']
+        end = plan['end']
+        for covered_start, covered_end, _ in sorted(interval_list):
+            if start > end:
+                break
+            if covered_end < start:
+                continue
+            if covered_start > end:
+                break
+            if covered_start > start:
+                interval_list.append(
+                        (start,
+                         add_day(covered_start, -1),
+                         plan_index))
+            start = add_day(covered_end, 1)
+
+        if start <= end:
+            interval_list.append((start, end, plan_index))
+
+    interval_list.sort()
+
+    return {
+            'plan_list' : compiled_plan_list,
+            'name_list' : name_list,
+            'start_list' : [interval[0] for interval in interval_list],
+            'end_list' : [interval[1] for interval in interval_list],
+            'index_list' : [interval[2] for interval in interval_list],
+            }
+
+
+def load_tariff_file(
+        tariff_file: str) -> dict:
+
+    # loads and compiles the tariff plans from a JSON
+    # tariff plan file (see sample_tariffs_plan.json)
+    # Disabled plans are skipped and each plan must set
+    # a tariff for every hour of the week
+    with open(tariff_file) as fp:
+        tariff_plan_full_list = json.load(fp)
+        plan_list = []
+
+        for tariff_plan in tariff_plan_full_list:
+            # remove disabled plans
+            if ('enabled' in tariff_plan and 
+                not tariff_plan['enabled']):
+                continue
+
+            # scale standing charge to hourly rate
+            plan = new_plan(
+                    tariff_plan['name'],
+                    tariff_plan['start'],
+                    tariff_plan['end'],
+                    tariff_plan['annual_standing_charge'] / 365 / 24,
+                    tariff_plan['fit_rate'])
+
+            for tariff_rec in tariff_plan['tariffs']:
+                # optional days list
+                set_plan_tariff(
+                        plan,
+                        tariff_rec.get('days', [1,2,3,4,5,6,7]),
+                        tariff_rec['start'],
+                        tariff_rec['end'],
+                        tariff_rec['name'],
+                        tariff_rec['rate'])
+
+            # validate parsed plan
+            missing_dict = get_missing_hours(plan)
+
+            # 7-day coverage 
+            missing_day_set = set()
+            for day in missing_dict:
+                if len(missing_dict[day]) == 24:
+                    missing_day_set.add(day)
+            if missing_day_set:
+                raise Exception(
+                        'Tariff plan %s does not have full 7-day coverage.. missing days: %s' % (
+                            plan['name'],
+                            str(missing_day_set)
+                            )
+                        )
+
+            # 24-hour coverage
+            for day in missing_dict:
+                raise Exception(
+                        'Tariff plan %s does not have full 24-hour coverage for day %d .. missing hours: %s' % (
+                            plan['name'],
+                            day,
+                            str(set(missing_dict[day]))
+                            )
+                        )
+
+            plan_list.append(plan)
+
+    return compile_tariffs(plan_list)
+
+
+def get_plan_index(
+        tariffs: dict,
+        day: str) -> int | None:
+
+    # index of the plan covering the YYYY-MM-DD day
+    # or None if no plan covers it
+    i = bisect.bisect_right(tariffs['start_list'], day) - 1
+    if (i >= 0 and
+        day <= tariffs['end_list'][i]):
+        return tariffs['index_list'][i]
+
+    return None
+
+
+def get_tariff(
+        tariffs: dict,
+        plan_index: int,
+        weekday: int,
+        hour: int) -> tuple[str, float] | None:
+
+    # tariff name and rate for the ISO weekday and hour
+    # or None if not set in the plan
+    plan = tariffs['plan_list'][plan_index]
+    slot = get_slot(weekday, hour)
+    name_index = plan['name_index_list'][slot]
+    if name_index < 0:
+        return None
+
+    return tariffs['name_list'][name_index], plan['rate_list'][slot]
+
+
+def load_prices(
+        semopx_dir: str,
+        margin: float = 0,
+        vat_rate: float = 0) -> dict:
+
+    # dynamic import prices from a SEMOpx data directory
+    # (semopx_data_util.py) as sorted ts and rate lists.
+    # The rate is the final_kwh_rate plus the given margin
+    # with VAT (1-100) then applied
+    vat_factor = 1 + (vat_rate / 100)
+
+    price_dict = {}
+    for full_path in energy_store.list_data_files(semopx_dir):
+        for rec in energy_store.iter_file_records(full_path):
+            if 'final_kwh_rate' in rec:
+                price_dict[rec['ts']] = (rec['final_kwh_rate'] + margin) * vat_factor
+
+    ts_list = sorted(price_dict.keys())
+
+    return {
+            'ts_list' : ts_list,
+            'rate_list' : [price_dict[ts] for ts in ts_list],
+            }
+
+
+def get_dynamic_rates(
+        prices: dict,
+        ts_list: list,
+        span_list: list) -> list:
+
+    # dynamic (market) rate for each interval starting at
+    # the given epoch ts and lasting the given span in seconds
+    # prices holds the sorted price interval start times
+    # and their rates
+    # {
+    #   'ts_list' : [ts, ...],
+    #   'rate_list' : [rate, ...],
+    # }
+    # The rate for an interval is the mean of the price
+    # intervals starting within it, so hourly usage takes
+    # the mean of its two half-hour prices. Intervals with
+    # no price are None
+    #
+    # The intervals are visited in ts order and matched
+    # against the prices in a single sorted merge pass
+    price_ts_list = prices['ts_list']
+    price_rate_list = prices['rate_list']
+    num_prices = len(price_ts_list)
+
+    rate_list = [None] * len(ts_list)
+    order_list = sorted(
+            range(len(ts_list)), 
+            key = ts_list.__getitem__)
+
+    i = 0
+    for index in order_list:
+        start_ts = ts_list[index]
+        end_ts = start_ts + span_list[index]
+
+        # first price at or after the interval start
+        while (i < num_prices and 
+               price_ts_list[i] < start_ts):
+            i += 1
+
+        total = 0
+        count = 0
+        j = i
+        while (j < num_prices and 
+               price_ts_list[j] < end_ts):
+            total += price_rate_list[j]
+            count += 1
+            j += 1
+
+        if count:
+            rate_list[index] = total / count
+
+    return rate_list
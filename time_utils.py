@@ -0,0 +1,235 @@
+import datetime
+import functools
+import zoneinfo
+
+
+# Shared time conversion helpers for the ingest,
+# simulation and report scripts.
+# Zone objects, local hour epoch values and per-day
+# aggregation keys are all cached as the same values
+# are looked up for every record processed
+
+# field widths for the fixed-format parser
+fixed_format_width_dict = {
+        'Y' : 4,
+        'm' : 2,
+        'd' : 2,
+        'H' : 2,
+        'M' : 2,
+        'S' : 2,
+        }
+
+
+@functools.lru_cache(maxsize = None)
+def get_zone(
+        timezone: str) -> zoneinfo.ZoneInfo:
+
+    return zoneinfo.ZoneInfo(timezone)
+
+
+@functools.lru_cache(maxsize = 65536)
+def local_hour_to_epoch(
+        year: int,
+        month: int,
+        day: int,
+        hour: int,
+        timezone: str) -> tuple[int, bool]:
+
+    # epoch of the start of the local hour
+    # using the same fold=0 semantics as
+    # dt.replace(tzinfo = ...)
+    hour_dt = datetime.datetime(
+            year,
+            month,
+            day,
+            hour,
+            tzinfo = get_zone(timezone))
+    hour_ts = int(hour_dt.timestamp())
+
+    # flag if the UTC offset is the same for the full hour
+    # DST changes on the half hour (e.g. Lord Howe) are not
+    # and those hours get resolved per value
+    end_ts = int(hour_dt.replace(minute = 59, second = 59).timestamp())
+    uniform = (end_ts - hour_ts == 3599)
+
+    return hour_ts, uniform
+
+
+def local_to_epoch(
+        dt: datetime.datetime,
+        timezone: str) -> int:
+
+    # local wall time of dt to epoch via the
+    # cached local hour table
+    hour_ts, uniform = local_hour_to_epoch(
+            dt.year,
+            dt.month,
+            dt.day,
+            dt.hour,
+            timezone)
+
+    if uniform:
+        return hour_ts + dt.minute * 60 + dt.second
+
+    return int(dt.replace(tzinfo = get_zone(timezone)).timestamp())
+
+
+def epoch_to_local(
+        time_stamp: int,
+        timezone: str) -> datetime.datetime:
+
+    return datetime.datetime.fromtimestamp(
+            time_stamp,
+            tz = get_zone(timezone))
+
+
+@functools.lru_cache(maxsize = None)
+def compile_fixed_format(
+        fmt: str) -> tuple:
+
+    # converts a strptime format made up of
+    # %Y %m %d %H %M %S and literal characters
+    # into a list of field slices and literal checks
+    field_list = []
+    literal_list = []
+    pos = 0
+    i = 0
+    while i < len(fmt):
+        if fmt[i] == '%':
+            directive = fmt[i + 1]
+            width = fixed_format_width_dict[directive]
+            field_list.append((directive, pos, pos + width))
+            pos += width
+            i += 2
+        else:
+            literal_list.append((pos, fmt[i]))
+            pos += 1
+            i += 1
+
+    return tuple(field_list), tuple(literal_list), pos
+
+
+def parse_fixed_time(
+        datetime_str: str,
+        fmt: str) -> datetime.datetime:
+
+    # fast naive parse of fixed-width timestamps
+    # using string slicing. Anything that does not match the
+    # exact layout is handed to strptime
+    field_list, literal_list, length = compile_fixed_format(fmt)
+
+    if len(datetime_str) != length:
+        return datetime.datetime.strptime(datetime_str, fmt)
+
+    for pos, literal in literal_list:
+        if datetime_str[pos] != literal:
+            return datetime.datetime.strptime(datetime_str, fmt)
+
+    value_dict = {
+            'Y' : 1900,
+            'm' : 1,
+            'd' : 1,
+            'H' : 0,
+            'M' : 0,
+            'S' : 0,
+            }
+    for directive, start, end in field_list:
+        field_str = datetime_str[start:end]
+        if not (field_str.isascii() and field_str.isdigit()):
+            return datetime.datetime.strptime(datetime_str, fmt)
+        value_dict[directive] = int(field_str)
+
+    return datetime.datetime(
+            value_dict['Y'],
+            value_dict['m'],
+            value_dict['d'],
+            value_dict['H'],
+            value_dict['M'],
+            value_dict['S'])
+
+
+def parse_iso_time(
+        datetime_str: str) -> datetime.datetime:
+
+    # ISO formats are handled natively and anything
+    # else falls back to the much slower dateutil parser
+    try:
+        return datetime.datetime.fromisoformat(datetime_str)
+    except ValueError:
+        import dateutil.parser
+        return dateutil.parser.parse(datetime_str)
+
+
+def parse_local_time(
+        datetime_str: str,
+        timezone: str,
+        fmt: str = None) -> tuple[int, datetime.datetime]:
+
+    # naive parse
+    # fixed format if given, otherwise ISO/free-form
+    if fmt:
+        dt = parse_fixed_time(datetime_str, fmt)
+    else:
+        dt = parse_iso_time(datetime_str)
+
+    # assert local timezone
+    dt = dt.replace(tzinfo = get_zone(timezone))
+
+    # convert go epoch as God intended
+    time_stamp = local_to_epoch(
+            dt,
+            timezone)
+
+    # return both values
+    return time_stamp, dt
+
+
+def parse_range_time(
+        datetime_str: str,
+        timezone: str,
+        end: bool = False) -> tuple[int, datetime.datetime]:
+
+    # naive parse
+    dt = parse_fixed_time(datetime_str, '%Y%m%d')
+
+    # end of day
+    if end:
+        dt = dt.replace(
+                hour = 23,
+                minute = 59,
+                second = 59
+                )
+
+    # assert local timezone
+    dt = dt.replace(tzinfo = get_zone(timezone))
+
+    # convert go epoch as God intended
+    time_stamp = int(dt.timestamp())
+
+    # return both values
+    return time_stamp, dt
+
+
+@functools.lru_cache(maxsize = 65536)
+def get_day_keys(
+        year: int,
+        month: int,
+        day: int) -> tuple[str, str, str, str, str]:
+
+    # day, month, year, weekday and week
+    # aggregation keys for a given local date
+    day_dt = datetime.date(year, month, day)
+
+    return (
+            '%04d-%02d-%02d' % (
+                year,
+                month,
+                day),
+            '%04d-%02d' % (
+                year,
+                month),
+            '%04d' % (
+                year),
+            day_dt.strftime('%u %a'),
+            day_dt.strftime('%Y-%W'),
+            )